@@ -0,0 +1,120 @@
+"""
+Compare the original listdir scan, serial VFSEntry.create_children() and
+VFSScanner on a generated tree.
+
+The original scan is reproduced by listdir_scan(): os.listdir per folder,
+then os.path.isdir/isfile per child and os.stat per file, as VFSEntry did
+before it moved to os.scandir. create_children() already uses os.scandir,
+so it is the serial baseline for the threaded scanner, not for the old code.
+
+    python dev/benchmarks/vfs_scan.py --files 1000000 --workers 1 4 8 16
+
+--root may point at an existing folder (e.g. a network mount) to scan it
+instead of generating a tree. Generated trees are kept in --tree-dir if
+given (created if missing), so later runs skip generation, and deleted
+afterwards otherwise.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from psgu.fs import VFSEntry, VFSScanner
+
+
+def generate_tree(root, num_files, files_per_dir=100, dirs_per_dir=10):
+    """Spread num_files empty files over a tree of dirs_per_dir fanout"""
+    num_dirs = max(1, num_files // files_per_dir)
+    dirs = [root]
+    i_dir = 0
+    while len(dirs) < num_dirs:
+        parent = dirs[i_dir]
+        for i in range(dirs_per_dir):
+            path = os.path.join(parent, 'd{}'.format(i))
+            os.makedirs(path, exist_ok=True)
+            dirs.append(path)
+        i_dir += 1
+    created = 0
+    for path in dirs:
+        for i in range(files_per_dir):
+            if created >= num_files:
+                return
+            open(os.path.join(path, 'f{}.txt'.format(i)), 'w').close()
+            created += 1
+
+
+def listdir_scan(path):
+    """The original scan, returns (entries, total file size)"""
+    entries = 0
+    size = 0
+    for name in os.listdir(path):
+        child_path = os.path.normpath(os.path.join(path, name))
+        entries += 1
+        if os.path.isdir(child_path):
+            child_entries, child_size = listdir_scan(child_path)
+            entries += child_entries
+            size += child_size
+        elif os.path.isfile(child_path):
+            size += os.stat(child_path).st_size
+    return entries, size
+
+
+def count_entries(entry):
+    return len(entry.collect_entries())
+
+
+def time_scan(root, func):
+    entry = VFSEntry(root)
+    start = time.perf_counter()
+    func(entry)
+    elapsed = time.perf_counter() - start
+    return elapsed, count_entries(entry)
+
+
+def run(root, workers_list):
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    start = time.perf_counter()
+    n = listdir_scan(root)[0] + 1
+    elapsed = time.perf_counter() - start
+    print('listdir (original):        {:8.2f}s  {} entries'.format(elapsed, n))
+    elapsed, n = time_scan(root, VFSEntry.create_children)
+    print('create_children (serial):  {:8.2f}s  {} entries'.format(elapsed, n))
+    for workers in workers_list:
+        scanner = VFSScanner(workers)
+        elapsed, n = time_scan(root, scanner.scan)
+        print('VFSScanner(workers={:>3}):   {:8.2f}s  {} entries'.format(workers, elapsed, n))
+
+
+def generate_if_empty(root, num_files):
+    if os.listdir(root):
+        return
+    print('Generating {} files in {}'.format(num_files, root))
+    start = time.perf_counter()
+    generate_tree(root, num_files)
+    print('  done in {:.1f}s'.format(time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--root', default=None)
+    parser.add_argument('--tree-dir', default=None)
+    args = parser.parse_args()
+
+    if args.root != None:
+        run(args.root, args.workers)
+    elif args.tree_dir != None:
+        os.makedirs(args.tree_dir, exist_ok=True)
+        generate_if_empty(args.tree_dir, args.files)
+        run(args.tree_dir, args.workers)
+    else:
+        with tempfile.TemporaryDirectory(prefix='psgu_vfs_bench_') as root:
+            generate_if_empty(root, args.files)
+            run(root, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -285,9 +285,9 @@ class Unit:
         best_vs = (self.value, self.degree.symbol)
         for symbol, value in as_each_degree.items():
         
-            # at least {minimum} is better
-            enough_value = (value >= minimum)
-            enough_best = (best_vs[0] >= minimum)
+            # at least {minimum} is better, by magnitude for negative values
+            enough_value = (abs(value) >= minimum)
+            enough_best = (abs(best_vs[0]) >= minimum)
             if enough_best and not enough_value:
                 continue
             if enough_value and not enough_best:
@@ -295,8 +295,8 @@ class Unit:
                 continue
 
             # smaller whole value is better
-            whole_value = int(value)
-            whole_best = int(best_vs[0])
+            whole_value = int(abs(value))
+            whole_best = int(abs(best_vs[0]))
             if whole_best < whole_value:
                 continue
             if whole_value < whole_best:
@@ -311,7 +311,7 @@ class Unit:
             value = round(value, decimal_digits)
         value_string = str(value)
         symbol = self.unit_scale.strip_s_if_singular(symbol, value)
-        if value:
+        if value and '.' in value_string:
             value_string = value_string.rstrip('0').rstrip('.')
         return value_string + sep + symbol
     
@@ -327,7 +327,7 @@ class Unit:
         if center_decimal:
             center_decimal_string(value_string, accuracy)
         symbol = self.unit_scale.strip_s_if_singular(symbol, value)
-        if value:
+        if value and '.' in value_string:
             value_string = value_string.rstrip('0').rstrip('.')
         return value_string + sep + symbol
     
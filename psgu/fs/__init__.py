@@ -1,3 +1,14 @@
 from .vfs import VirtualFS, VFS
+from .vfs_compact import CompactVirtualFS, CompactVFS, CompactVFSEntry
+from .vfs_rules import VFSRule, VFSRuleSet
+from .vfs_inodes import VFSInodeTracker
+from .vfs_search import VFSNameIndex, VFSNameQuery
+from .vfs_stats import VFSSizeHistogram
+from .vfs_export import VFSExport
+from .vfs_dupes import VFSDupeFinder
 from .vfs_entry import VFSEntry
 from .vfs_explorer import VFSExplorer
+from .vfs_scanner import VFSScanner
+from .vfs_cache import VFSCache
+from .vfs_diff import VFSDiff, VFSDiffEntry
+from .vfs_watcher import VFSWatcher
@@ -1,32 +1,615 @@
+from __future__ import annotations
+
+import heapq
+import os
+import stat
+from typing import Iterator
+
 from psgu.fs.vfs_entry import VFSEntry
+from psgu.fs.vfs_export import VFSExport
+from psgu.fs.vfs_inodes import VFSInodeTracker
+from psgu.fs.vfs_rules import VFSRuleSet
+from psgu.fs.vfs_scanner import CancelToken, ScanProgress, VFSScanner
+from psgu.fs.vfs_search import VFSNameIndex, VFSNameQuery
+from psgu.fs.vfs_stats import VFSSizeHistogram
 
 class VirtualFS:
 
-    def __init__(self):
-        self.root_entries = {}
-        self.all_entries = {}
-    
+    entry_class = VFSEntry
+
+    def __init__(self, scan_workers=1, lazy=False, index_names=False, follow_symlinks=False):
+        """
+        scan_workers: threads used to list folders when scanning. Values
+        above 1 help most on network mounts and other high latency roots.
+
+        lazy: only list a folder's children when they are needed, see
+        materialize(). Added roots are listed one level deep, so aggregates
+        only cover what has been listed so far until calc_*() is called.
+
+        all_entries indexes every entry connected to a root by path key
+        (see path_key()). Entries keep it up to date themselves as they are
+        connected and deleted. Keys are the entries' own path strings where
+        the OS allows, so the index stores no extra copies of paths.
+
+        index_names: also keep a VFSNameIndex of entry names, updated along
+        with all_entries, so search() doesn't walk every entry.
+
+        follow_symlinks: scan through symlinks to folders and files. Off by
+        default, symlinks are then entries of no type and no size. When on,
+        folders reached again through a link aren't scanned twice, see
+        VFSInodeTracker. Hardlinked files are counted once either way.
+        """
+        self.root_entries:dict[str, VFSEntry] = {}
+        self.all_entries:dict[str, VFSEntry] = {}
+        self.scan_workers = scan_workers
+        self.lazy = lazy
+        self.rules:VFSRuleSet|None = None
+        self.name_index:VFSNameIndex|None = VFSNameIndex() if index_names else None
+        self.follow_symlinks = follow_symlinks
+        self.inodes = VFSInodeTracker()
+
+    def path_key(path:str) -> str:
+        """Normalized path used as an index key"""
+        return os.path.normcase(os.path.normpath(path))
+
+    # Index
+
+    def _index_entries(self, entry:VFSEntry):
+        """Index entry and all of its descendants"""
+        all_entries = self.all_entries
+        name_index = self.name_index
+        inodes = self.inodes
+        for e in entry.walk():
+            e.vfs = self
+            all_entries[os.path.normcase(e.path)] = e
+            if name_index != None:
+                name_index.add(e)
+            if e.inode == None:
+                continue
+            if e.is_file():
+                if not inodes.add_file(e):
+                    # not yet in any aggregates, see connect_child()
+                    e.set_hardlink(True)
+            elif e.children_scanned: # e.g. loaded from a VFSCache
+                inodes.claim_dir(e)
+
+    def _unindex_entries(self, entry:VFSEntry):
+        """Remove entry and all of its descendants from the index"""
+        all_entries = self.all_entries
+        name_index = self.name_index
+        inodes = self.inodes
+        promoted = []
+        for e in entry.walk():
+            e.vfs = None
+            all_entries.pop(os.path.normcase(e.path), None)
+            if name_index != None:
+                name_index.remove(e)
+            if e.inode != None:
+                if e.is_dir():
+                    inodes.release_dir(e)
+                else:
+                    promoted.append(inodes.remove_file(e))
+        if entry.parent == None:
+            self.root_entries.pop(os.path.normcase(entry.path), None)
+        # other links to removed files count their bytes now
+        for e in promoted:
+            if e != None and e.vfs is self:
+                e.set_hardlink(False)
+                self._recheck_file(e, force=True)
+
+    def find_entry(self, path) -> VFSEntry|None:
+        return self.all_entries.get(VirtualFS.path_key(path))
+
+    def has_path(self, path) -> bool:
+        return VirtualFS.path_key(path) in self.all_entries
+
+    def iter_entries_under(self, path, include_self=True):
+        """
+        Yield all entries at or below path. path does not need to be an
+        entry itself, e.g. the parent folder of several roots.
+        """
+        entry = self.find_entry(path)
+        if entry != None:
+            yield from entry.walk(include_self)
+            return
+        prefix = VirtualFS.path_key(path).rstrip(os.sep) + os.sep
+        for key, root in list(self.root_entries.items()):
+            if key.startswith(prefix):
+                yield from root.walk()
+
+    # Roots
+
+    def get_root_entries(self) -> list[VFSEntry]:
+        return list(self.root_entries.values())
+
+    def add_path(self, path) -> VFSEntry:
+        """
+        Add path as a root and scan it. If already in the VFS, returns the
+        existing entry. Roots under path are reconnected into the new tree
+        rather than scanned again. A path under an entry of the VFS, e.g.
+        one removed before, goes back into that entry's tree instead.
+        """
+        for _ in self.iter_add_path(path):
+            pass
+        return self.find_entry(path)
+
+    def iter_add_path(self,
+            path,
+            cancel_token:CancelToken=None,
+            interval=0.1) -> Iterator[ScanProgress]:
+        """
+        add_path() as a generator yielding ScanProgress, see
+        VFSScanner.iter_scan(). If cancelled, or if the scan raises, the new
+        root is removed and any roots it had reconnected become roots again.
+        Folders that can't be listed are left empty, see VFSScanner.
+        """
+        entry = self.find_entry(path)
+        if entry != None:
+            return
+        ancestor = self._find_ancestor(path)
+        if ancestor != None:
+            yield from self._iter_attach_path(path, ancestor, cancel_token, interval)
+            return
+        entry = self.entry_class(path)
+        key = os.path.normcase(entry.path)
+        orphans = {}
+        prefix = key.rstrip(os.sep) + os.sep
+        for root_key, root in list(self.root_entries.items()):
+            if root_key.startswith(prefix):
+                del self.root_entries[root_key]
+                orphans[root.path] = root
+        absorbed = list(orphans.values())
+        self.root_entries[key] = entry
+        self._index_entries(entry)
+        if self.lazy:
+            self._materialize_orphan_parents(entry, orphans)
+            self.materialize(entry, orphans=orphans)
+            return
+        progress = None
+        scanner = VFSScanner(self.scan_workers)
+        try:
+            for progress in scanner.iter_scan(entry, orphans, cancel_token, interval):
+                yield progress
+        except BaseException:
+            self._undo_add_path(entry, absorbed)
+            raise
+        if progress != None and progress.cancelled:
+            self._undo_add_path(entry, absorbed)
+            return
+        self._settle_hardlinks(entry)
+        entry.refresh_aggregates()
+        self.apply_rules(entry)
+
+    def _settle_hardlinks(self, entry:VFSEntry):
+        """
+        After a scan, let the first link of each file in entry's subtree
+        count its bytes, so parallel scans count the same links as serial
+        ones whichever thread found a link first
+        """
+        files = [e for e in entry.walk() if e.inode != None and e.is_file()]
+        for owner, link in self.inodes.settle_files(files):
+            link.set_hardlink(True)
+            owner.set_hardlink(False)
+
+    def _undo_add_path(self, entry:VFSEntry, absorbed:list):
+        """Remove a partly scanned root, making the roots it absorbed roots again"""
+        for root in absorbed:
+            if root.parent != None:
+                root.disconnect()
+            self.root_entries[os.path.normcase(root.path)] = root
+        entry.delete_all()
+
+    def _add_loaded_root(self, root:VFSEntry) -> bool:
+        """
+        Add a tree read from a VFSCache or VFSExport as a root, then apply
+        the current rules to it. Roots already in vfs below it take the
+        place of the loaded entries at their paths, as add_path()
+        reconnects them. Skipped, returning False, if root's path is
+        already in vfs or under one of its roots, or if a root below it has
+        no loaded entry to replace.
+        """
+        if self.has_path(root.path) or self._find_ancestor(root.path) != None:
+            return False
+        key = os.path.normcase(root.path)
+        prefix = key.rstrip(os.sep) + os.sep
+        absorbed = [r for root_key, r in self.root_entries.items()
+            if root_key.startswith(prefix)]
+        replaced = []
+        if absorbed:
+            loaded = {os.path.normcase(e.path): e for e in root.walk()}
+            replaced = [loaded.get(os.path.normcase(r.path)) for r in absorbed]
+            if None in replaced:
+                return False
+        parents = []
+        for entry in replaced:
+            parents.append(entry.parent)
+            entry.disconnect()
+        self.root_entries[key] = root
+        self._index_entries(root)
+        for existing, parent in zip(absorbed, parents):
+            del self.root_entries[os.path.normcase(existing.path)]
+            parent.connect_child(existing)
+        self.apply_rules(root)
+        return True
+
+    def _find_ancestor(self, path) -> VFSEntry|None:
+        """The closest entry above path, None if path isn't under any root"""
+        path = os.path.normpath(path)
+        parent_path = os.path.dirname(path)
+        while parent_path != path:
+            entry = self.find_entry(parent_path)
+            if entry != None:
+                return entry
+            path = parent_path
+            parent_path = os.path.dirname(path)
+        return None
+
+    def _iter_attach_path(self, path, ancestor:VFSEntry, cancel_token:CancelToken, interval):
+        """
+        iter_add_path() for a path under ancestor. Folders on the way are
+        listed if they aren't yet, and the first one missing from its
+        parent is added back and scanned, taking path with it.
+        """
+        path = os.path.normpath(path)
+        folder = ancestor
+        for part in path[len(ancestor.path.rstrip(os.sep)) + 1:].split(os.sep):
+            if folder.stale or not folder.children_scanned:
+                self.materialize(folder)
+            child_path = os.path.join(folder.path, part)
+            child = self.find_entry(child_path)
+            if child != None:
+                folder = child
+                continue
+            if not folder.is_dir():
+                return
+            entry = self.entry_class(child_path)
+            folder.connect_child(entry)
+            if self.lazy and entry.is_dir():
+                self.materialize(entry)
+                folder = entry
+                continue
+            progress = None
+            scanner = VFSScanner(self.scan_workers)
+            try:
+                for progress in scanner.iter_scan(entry, None, cancel_token, interval):
+                    yield progress
+            except BaseException:
+                entry.delete_all()
+                raise
+            if progress != None and progress.cancelled:
+                entry.delete_all()
+                return
+            self._settle_hardlinks(entry)
+            entry.refresh_aggregates()
+            self.apply_rules(entry)
+            return
+
+    def scan(self, entry:VFSEntry, orphans:dict=None):
+        """
+        Create all of entry's descendants from the filesystem, then
+        calculate their aggregates
+        """
+        VFSScanner(self.scan_workers).scan(entry, orphans)
+        self._settle_hardlinks(entry)
+        entry.refresh_aggregates()
+
+    def materialize(self, entry:VFSEntry, recurse=False, listing:list=None, orphans:dict=None):
+        """
+        List an unscanned folder's children and add them to the aggregates,
+        or revalidate them if stale (see revalidate()).
+        listing: from VFSEntry.list_dir(), e.g. prefetched on another thread.
+        recurse: also scan or revalidate every folder below it that needs it.
+        """
+        if not entry.is_dir():
+            return
+        if recurse:
+            for folder in [e for e in entry.walk() if e.stale]:
+                if folder.stale: # not deleted by an earlier revalidate()
+                    self.revalidate(folder)
+            unscanned = list(entry.iter_unscanned_folders())
+            if not unscanned:
+                return
+            scanner = VFSScanner(self.scan_workers)
+            for folder in unscanned:
+                scanner.scan(folder, orphans)
+                self._settle_hardlinks(folder)
+        elif entry.stale:
+            self.revalidate(entry, listing)
+            return
+        elif entry.children_scanned:
+            return
+        else:
+            entry.scan_children(orphans, listing)
+        entry.refresh_aggregates()
+        self.apply_rules(entry)
+
+    def revalidate(self, entry:VFSEntry, listing:list=None) -> bool:
+        """
+        Check a stale folder (e.g. loaded from a VFSCache) against the
+        filesystem. Its children are only synced if its mtime changed.
+        Returns True if they were.
+        """
+        entry.stale = False
+        try:
+            mtime = os.stat(entry.path).st_mtime
+        except FileNotFoundError:
+            entry.delete_all()
+            return True
+        if mtime == entry.mtime:
+            return False
+        entry.set_mtime(mtime)
+        self.sync_children(entry, listing)
+        return True
+
+    def sync_children(self, entry:VFSEntry, listing:list=None):
+        """
+        Update a scanned folder's children from a new listing. Unchanged
+        children are kept, changed files are resized, and aggregates are
+        updated incrementally. New folders are scanned unless lazy.
+        """
+        if listing == None:
+            listing = VFSEntry.list_dir(entry.path, self.follow_symlinks)
+        old_children = {child.path: child for child in entry.children}
+        for child_path, entry_type, size, mtime, allocated, inode in listing:
+            child = old_children.pop(child_path, None)
+            if child != None and child.entry_type == entry_type:
+                if child.is_file() and mtime != child.mtime:
+                    child.set_mtime(mtime)
+                    child.set_size(size, allocated)
+                continue
+            if child != None:
+                child.delete_all()
+            child = self.entry_class(child_path, entry_type, size, mtime, allocated, inode)
+            entry.connect_child(child)
+            if not self.lazy:
+                self.scan(child)
+        for child in old_children.values():
+            child.delete_all()
+        self.apply_rules(entry)
+
+    def rescan(self, path, check_files=False) -> bool:
+        """
+        Bring the tree at path up to date with the filesystem. Only folders
+        whose mtime changed are listed again (see revalidate()), unscanned
+        folders of a lazy VFS are left alone, and aggregates are updated
+        incrementally. Child counts aren't compared: finding one takes the
+        listing this skips, and adding, removing or renaming a child
+        changes its folder's mtime anyway.
+        check_files: also stat files in unchanged folders, since editing a
+        file doesn't change its folder's mtime.
+        Returns False if path isn't in the VFS.
+        """
+        entry = self.find_entry(path)
+        if entry == None:
+            return False
+        to_check = [entry]
+        while to_check:
+            folder = to_check.pop()
+            if not folder.is_dir():
+                self._recheck_file(folder)
+                continue
+            if not folder.children_scanned:
+                continue
+            folder.stale = True
+            changed = self.revalidate(folder)
+            if folder.vfs is not self: # deleted
+                continue
+            for child in folder.children:
+                if child.is_dir():
+                    to_check.append(child)
+                elif check_files and not changed:
+                    self._recheck_file(child)
+        return True
+
+    def apply_changes(self, paths) -> list[VFSEntry]:
+        """
+        Sync the entries at changed paths, e.g. reported by a VFSWatcher.
+        A path not in the VFS syncs its parent folder instead.
+        Returns the folders synced and files rechecked that still exist,
+        and the parent folders of entries found deleted.
+        """
+        files = []
+        folders = {}
+        for path in paths:
+            entry = self.find_entry(path)
+            if entry == None:
+                entry = self.find_entry(os.path.dirname(path))
+                if entry == None:
+                    continue
+            if entry.is_dir():
+                folders[entry.path] = entry
+            else:
+                files.append(entry)
+        changed = []
+        for entry in files:
+            parent = entry.parent
+            self._recheck_file(entry)
+            if entry.vfs is self:
+                self.apply_rules(entry)
+                changed.append(entry)
+            elif parent != None and parent.vfs is self:
+                changed.append(parent)
+        for entry in folders.values():
+            if entry.vfs is not self:
+                continue
+            parent = entry.parent
+            try:
+                entry.set_mtime(os.stat(entry.path).st_mtime)
+                if entry.children_scanned:
+                    entry.stale = False
+                    self.sync_children(entry)
+            except FileNotFoundError:
+                entry.delete_all()
+                if parent != None and parent.vfs is self:
+                    changed.append(parent)
+                continue
+            changed.append(entry)
+        return changed
+
+    def _recheck_file(self, entry:VFSEntry, force=False):
+        """
+        Update a file's mtime and sizes if its mtime changed, or if force.
+        Other entries, e.g. symlinks that aren't followed, and links whose
+        bytes another entry counts are left alone unless force. Symlinks
+        are only followed if follow_symlinks is set, as when scanning.
+        """
+        if not entry.is_file() or (entry.hardlink and not force):
+            return
+        try:
+            stat_result = os.stat(entry.path, follow_symlinks=self.follow_symlinks)
+        except FileNotFoundError:
+            entry.delete_all()
+            return
+        if not stat.S_ISREG(stat_result.st_mode):
+            return # replaced, left to its folder's sync
+        if force or stat_result.st_mtime != entry.mtime:
+            entry.set_mtime(stat_result.st_mtime)
+            entry.set_size(stat_result.st_size,
+                VFSInodeTracker.stat_to_allocated(stat_result))
+
+    def _materialize_orphan_parents(self, entry:VFSEntry, orphans:dict):
+        """List the folders between entry and each orphan, so they're reconnected"""
+        prefix = entry.path.rstrip(os.sep) + os.sep
+        for orphan_path in list(orphans):
+            folder = entry
+            for part in orphan_path[len(prefix):].split(os.sep)[:-1]:
+                self.materialize(folder, orphans=orphans)
+                folder = self.find_entry(os.path.join(folder.path, part))
+                if folder == None:
+                    break
+            else:
+                self.materialize(folder, orphans=orphans)
+
+    def remove(self, path) -> bool:
+        """Remove the entry at path and its descendants"""
+        entry = self.find_entry(path)
+        if entry == None:
+            return False
+        entry.delete_all()
+        return True
+
+    def remove_all(self):
+        for entry in self.get_root_entries():
+            entry.delete_all()
+        self.root_entries.clear()
+        self.all_entries.clear()
+        self.inodes.clear()
+        if self.name_index != None:
+            self.name_index.clear()
+
+    # Search
+
+    def search(self, query:str) -> Iterator[VFSEntry]:
+        """
+        Yield entries whose names match query as they are found, see
+        VFSNameQuery. Uses the name index if index_names was set, otherwise
+        checks every entry.
+        """
+        query = VFSNameQuery(query)
+        if self.name_index != None:
+            return self.name_index.search(query)
+        return query.iter_matches(list(self.all_entries.values()))
+
+    # Queries
+    # One pass over the entries, nothing is sorted. Lazy trees only cover
+    # what has been scanned, see calc_all().
+
+    def _iter_query_entries(self, path=None):
+        if path == None:
+            return iter(self.all_entries.values())
+        return self.iter_entries_under(path, include_self=False)
+
+    def top_n(self, n:int, kind='file', path=None, allocated=False) -> list[VFSEntry]:
+        """
+        The n largest files, or folders by total size, largest first.
+        kind: VFSEntry.entry_types.FILE or DIR.
+        path: only entries below path, default everywhere.
+        allocated: rank by allocated size instead of apparent size.
+        """
+        key = VFSEntry.get_allocated_size if allocated else VFSEntry.get_size
+        entries = (e for e in self._iter_query_entries(path) if e.entry_type == kind)
+        return heapq.nlargest(n, entries, key=key)
+
+    def size_histogram(self, buckets:list[int]=None, path=None, allocated=False) -> VFSSizeHistogram:
+        """
+        File counts and bytes by size range, see VFSSizeHistogram.
+        Hardlinks counted at another path are left out.
+        """
+        histogram = VFSSizeHistogram(buckets)
+        for e in self._iter_query_entries(path):
+            if e.is_file() and not e.hardlink:
+                histogram.add(e.allocated_size if allocated else e.size)
+        return histogram
+
+    # Export
+
+    def export(self, stream, format='jsonl') -> int:
+        """
+        Write one record per entry to a text stream, see VFSExport.
+        Returns the number of entries written.
+        """
+        return VFSExport(format).write(self, stream)
+
+    def load_export(self, stream, format='jsonl') -> list[VFSEntry]:
+        """Add the trees in an export() stream as roots, returns the roots added"""
+        return VFSExport(format).read(self, stream)
+
+    # Rules
+
+    def set_rules(self, rules:VFSRuleSet|None):
+        """Exclude entries by rules from now on, and apply them to all roots now"""
+        self.rules = rules
+        if rules != None:
+            for entry in self.get_root_entries():
+                rules.apply(entry)
+
+    def apply_rules(self, entry:VFSEntry):
+        """Apply the rules, if any, to entry's subtree. Scans and syncs call this."""
+        if self.rules != None and entry.vfs is self:
+            self.rules.apply(entry)
+
+    # Calc
+    # Aggregates are kept up to date as entries are added and removed,
+    # these recalculate them from scratch, scanning any unscanned folders
+
+    def calc_root(self, path):
+        entry = self.find_entry(path)
+        if entry != None:
+            self.materialize(entry, recurse=True)
+            entry.calc_all()
+
+    def calc_roots(self, paths):
+        for path in paths:
+            self.calc_root(path)
+
+    def calc_all(self):
+        for entry in self.get_root_entries():
+            self.materialize(entry, recurse=True)
+            entry.calc_all()
+
+    # Other
+
     def for_entries(self, func, return_nones=False):
         """func(entry) called on every entry. rv's returned as list"""
         rvs = []
         for entry in self.all_entries.values():
             rv = func(entry)
             if rv != None or return_nones:
-                rvs.append(func(entry))
+                rvs.append(rv)
         return rvs
-    
+
     def for_roots(self, func, return_nones=False):
         """func(entry) called on every root. rv's returned as list"""
         rvs = []
         for entry in self.root_entries.values():
             rv = func(entry)
             if rv != None or return_nones:
-                rvs.append(func(entry))
+                rvs.append(rv)
         return rvs
-    
+
     def get_root_folder_count(self):
-        return len(self.for_roots(VFSEntry.is_dir))
-    
+        return len([e for e in self.root_entries.values() if e.is_dir()])
+
     def get_root_file_count(self):
-        return len(self.for_roots(VFSEntry.is_file))
+        return len([e for e in self.root_entries.values() if e.is_file()])
 VFS = VirtualFS
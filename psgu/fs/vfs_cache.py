@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import tempfile
+
+from psgu.fs.vfs import VirtualFS
+from psgu.fs.vfs_entry import VFSEntry
+
+
+__all__ = [
+    'VFSCache'
+]
+
+
+class VFSCache:
+
+    format_name = 'psgu-vfs-cache'
+    version = 2
+
+    # type codes
+    _types_to_codes = {
+        VFSEntry.entry_types.DIR: 'd',
+        VFSEntry.entry_types.FILE: 'f',
+        '': ''
+    }
+    _codes_to_types = {v: k for k, v in _types_to_codes.items()}
+
+    # flags
+    EXCLUDED = 1 << 0
+    SCANNED = 1 << 1
+    HARDLINK = 1 << 2
+
+    def __init__(self, path):
+        """
+        ---
+        Saves a VirtualFS's trees to a file, and loads them back.
+
+        The file is gzipped JSON with one array per field (parents, names,
+        types, sizes, mtimes, inodes, flags and aggregates), entries in walk()
+        order. The header fields are checked on load, and files from other
+        versions are ignored. Saves write to a temporary file which then
+        replaces the cache, so a cache is never left half written.
+
+        Loaded folders are marked stale, and VirtualFS revalidates them by
+        mtime when they are next opened or calculated (see
+        VirtualFS.materialize()).
+        ---
+        Args:
+            path: the cache file.
+        """
+        self.path = path
+
+    def save(self, vfs:VirtualFS):
+        parents = []
+        names = []
+        types = []
+        sizes = []
+        mtimes = []
+        inodes = []
+        flags = []
+        aggregates = []
+        indices = {}
+        for root in vfs.get_root_entries():
+            for entry in root.walk():
+                indices[entry] = len(names)
+                if entry.parent == None:
+                    parents.append(-1)
+                    names.append(entry.path)
+                else:
+                    parents.append(indices[entry.parent])
+                    names.append(entry.name)
+                types.append(VFSCache._types_to_codes[entry.entry_type])
+                sizes.append(entry.size)
+                mtimes.append(entry.mtime)
+                inodes.append(entry.inode)
+                flags.append(
+                    (VFSCache.EXCLUDED if entry.excluded else 0)
+                    | (VFSCache.SCANNED if entry.children_scanned else 0)
+                    | (VFSCache.HARDLINK if entry.hardlink else 0))
+                aggregates.append((
+                    entry.folder_count,
+                    entry.file_count,
+                    entry.excluded_size,
+                    entry.excluded_folder_count,
+                    entry.excluded_file_count,
+                    entry.allocated_size))
+        data = {
+            'format': VFSCache.format_name,
+            'version': VFSCache.version,
+            'parents': parents,
+            'names': names,
+            'types': types,
+            'sizes': sizes,
+            'mtimes': mtimes,
+            'inodes': inodes,
+            'flags': flags,
+            'aggregates': aggregates
+        }
+        cache_dir = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                    gz.write(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read(self) -> dict|None:
+        try:
+            with gzip.open(self.path, 'rb') as gz:
+                data = json.loads(gz.read().decode('utf-8'))
+        except (OSError, EOFError, ValueError):
+            return None
+        if not isinstance(data, dict) \
+                or data.get('format') != VFSCache.format_name \
+                or data.get('version') != VFSCache.version:
+            return None
+        return data
+
+    def load(self, vfs:VirtualFS) -> bool:
+        """
+        Add the cached trees to vfs as roots, see VirtualFS._add_loaded_root().
+        Returns False if there's no usable cache.
+        """
+        data = self._read()
+        if data == None:
+            return False
+        entry_class = vfs.entry_class
+        codes_to_types = VFSCache._codes_to_types
+        entries = []
+        roots = []
+        for parent_index, name, type_code, size, mtime, inode, flags, aggregates in zip(
+                data['parents'], data['names'], data['types'], data['sizes'],
+                data['mtimes'], data['inodes'], data['flags'], data['aggregates']):
+            if parent_index == -1:
+                entry = entry_class(name, codes_to_types[type_code], size, mtime, inode=inode)
+                roots.append(entry)
+            else:
+                parent = entries[parent_index]
+                entry = entry_class(os.path.join(parent.path, name),
+                    codes_to_types[type_code], size, mtime, inode=inode)
+                parent.connect_child(entry, update_aggregates=False)
+            entry.excluded = bool(flags & VFSCache.EXCLUDED)
+            entry.children_scanned = bool(flags & VFSCache.SCANNED)
+            entry.hardlink = bool(flags & VFSCache.HARDLINK)
+            entry.stale = entry.children_scanned
+            (entry.folder_count, entry.file_count, entry.excluded_size,
+                entry.excluded_folder_count, entry.excluded_file_count,
+                entry.allocated_size) = aggregates
+            entries.append(entry)
+        for root in roots:
+            vfs._add_loaded_root(root)
+        return True
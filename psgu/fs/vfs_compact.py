@@ -0,0 +1,863 @@
+from __future__ import annotations
+
+import heapq
+import os
+import stat
+from array import array
+from typing import Iterator
+
+from psgu.fs.vfs_entry import VFSEntry
+from psgu.fs.vfs_export import VFSExport
+from psgu.fs.vfs_inodes import VFSInodeTracker
+from psgu.fs.vfs_scanner import CancelToken, ScanProgress
+from psgu.fs.vfs_search import VFSNameQuery
+from psgu.fs.vfs_stats import VFSSizeHistogram
+
+
+__all__ = [
+    'CompactVirtualFS',
+    'CompactVFS',
+    'CompactVFSEntry'
+]
+NO_INDEX = -1
+
+
+class CompactVFSEntry:
+    """
+    A view of one entry in a CompactVirtualFS, made on demand. Has the
+    VFSEntry interface used by VFSExplorer and VFSExplorerView. Views of the
+    same entry compare equal.
+    """
+
+    __slots__ = ('vfs', 'index', '__weakref__')
+
+    entry_types = VFSEntry.entry_types
+    inode = None # rows don't keep inode numbers
+    cache_rules = False # views share one version, see VFSRuleSet.apply()
+
+    def __init__(self, vfs:CompactVirtualFS, index:int):
+        self.vfs = vfs
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactVFSEntry)
+            and self.index == other.index and self.vfs is other.vfs)
+
+    def __hash__(self):
+        return hash((id(self.vfs), self.index))
+
+    def __repr__(self):
+        return 'CompactVFSEntry({})'.format(self.path)
+
+    # Attributes
+
+    def get_name(self):
+        return self.vfs.get_name(self.index)
+    name = property(fget=get_name)
+
+    def get_path(self):
+        return self.vfs.get_path(self.index)
+    path = property(fget=get_path)
+
+    def get_parent(self) -> CompactVFSEntry|None:
+        parent = self.vfs.parent[self.index]
+        if parent == NO_INDEX:
+            return None
+        return CompactVFSEntry(self.vfs, parent)
+    parent = property(fget=get_parent)
+
+    def get_children(self) -> list[CompactVFSEntry]:
+        vfs = self.vfs
+        return [CompactVFSEntry(vfs, i) for i in vfs.iter_child_indices(self.index)]
+    children = property(fget=get_children)
+
+    def get_entry_type(self):
+        flags = self.vfs.flags[self.index]
+        if flags & CompactVirtualFS.DIR:
+            return VFSEntry.entry_types.DIR
+        if flags & CompactVirtualFS.FILE:
+            return VFSEntry.entry_types.FILE
+        return ''
+    entry_type = property(fget=get_entry_type)
+
+    def get_size(self):
+        return self.vfs.size[self.index]
+    size = property(fget=get_size)
+
+    def get_allocated_size(self):
+        return self.vfs.allocated_size[self.index]
+    allocated_size = property(fget=get_allocated_size)
+
+    def get_mtime(self):
+        return self.vfs.mtime[self.index]
+    mtime = property(fget=get_mtime)
+
+    def get_hardlink(self):
+        return bool(self.vfs.flags[self.index] & CompactVirtualFS.HARDLINK)
+    hardlink = property(fget=get_hardlink)
+
+    def is_dir(self):
+        return bool(self.vfs.flags[self.index] & CompactVirtualFS.DIR)
+
+    def is_file(self):
+        return bool(self.vfs.flags[self.index] & CompactVirtualFS.FILE)
+
+    def is_root(self):
+        return self.vfs.parent[self.index] == NO_INDEX
+
+    def is_excluded(self):
+        return bool(self.vfs.flags[self.index] & CompactVirtualFS.EXCLUDED)
+
+    def get_status(self):
+        if self.is_excluded():
+            return 'Excluded'
+        if self.get_excluded_folder_count() or self.get_excluded_file_count():
+            return 'Partial'
+        return ''
+    status = property(fget=get_status)
+
+    def get_children_scanned(self):
+        """Compact trees are always scanned fully"""
+        return True
+    children_scanned = property(fget=get_children_scanned)
+
+    def get_version(self):
+        """Rows have no change counters of their own, see CompactVirtualFS.version"""
+        return self.vfs.version
+    version = property(fget=get_version)
+    children_version = property(fget=get_version)
+
+    def get_type_symbol(self):
+        if self.is_dir():
+            return 'DIR'
+        return ''
+
+    # Aggregates
+
+    def get_folder_count(self):
+        return self.vfs.folder_count[self.index]
+
+    def get_file_count(self):
+        return self.vfs.file_count[self.index]
+
+    def get_included_size(self):
+        return self.vfs.size[self.index] - self.vfs.excluded_size[self.index]
+
+    def get_excluded_size(self):
+        return self.vfs.excluded_size[self.index]
+
+    def get_included_folder_count(self):
+        return self.vfs.folder_count[self.index] - self.vfs.excluded_folder_count[self.index]
+
+    def get_included_file_count(self):
+        return self.vfs.file_count[self.index] - self.vfs.excluded_file_count[self.index]
+
+    def get_excluded_folder_count(self):
+        return self.vfs.excluded_folder_count[self.index]
+
+    def get_excluded_file_count(self):
+        return self.vfs.excluded_file_count[self.index]
+
+    def get_subtree_aggregates(self):
+        return self.vfs.get_subtree_aggregates(self.index)
+
+    def set_size(self, size:int, allocated:int=None):
+        self.vfs.set_size(self.index, size, allocated)
+
+    def set_excluded(self, excluded:bool, update_aggregates=True):
+        self.vfs.set_excluded(self.index, excluded, update_aggregates)
+
+    def refresh_aggregates(self, restat=False):
+        self.vfs.calc_aggregates(self.index, restat)
+
+    def calc_size(self, restat=False):
+        self.vfs.calc_aggregates(self.index, restat)
+        return self.size
+
+    def calc_all(self):
+        self.calc_size()
+
+    # Traversal
+
+    def walk(self, include_self=True):
+        vfs = self.vfs
+        for i in vfs.iter_subtree_indices(self.index, include_self):
+            yield CompactVFSEntry(vfs, i)
+
+    def iter_parents(self, include_self=True):
+        entry = self if include_self else self.parent
+        while entry != None:
+            yield entry
+            entry = entry.parent
+
+    def iter_all_paths(self):
+        for entry in self.walk():
+            yield entry.path
+
+    def get_all_paths(self):
+        return list(self.iter_all_paths())
+
+    # Deletion
+
+    def delete_all(self):
+        self.vfs.delete_subtree(self.index)
+
+    def delete_self(self):
+        """Entries can't be orphaned in compact storage, deletes the subtree"""
+        self.delete_all()
+
+
+class CompactVirtualFS:
+
+    # flags
+    DIR = 1 << 0
+    FILE = 1 << 1
+    EXCLUDED = 1 << 2
+    DELETED = 1 << 3
+    HARDLINK = 1 << 4
+
+    def __init__(self):
+        """
+        ---
+        A VirtualFS storage engine for very large trees. Entries are rows
+        in parallel typed arrays instead of VFSEntry objects, around 80
+        bytes each plus their UTF-8 names:
+            parent, first_child, next_sibling: tree links by index
+            size, mtime, flags: DIR, FILE, EXCLUDED, DELETED, HARDLINK
+            name_offset, name_len: slice of the shared names bytearray
+            allocated_size, folder_count, file_count, excluded_size,
+                excluded_folder_count, excluded_file_count: aggregates,
+                as described in VFSEntry
+        CompactVFSEntry views are created on demand, and provide what
+        VFSExplorer and VFSExplorerView need from an entry.
+
+        A scan adds a folder's descendants after it, so reverse index order
+        is a valid bottom-up order for calculating aggregates. Deleted
+        entries are only flagged and unlinked, their rows are not reused.
+
+        Symlinks aren't followed. Hardlinked files are counted once per
+        added root, later links are flagged HARDLINK and count 0.
+        Rescans and watched changes sync folders' children as VirtualFS
+        does, but files found by a sync are counted even if another link
+        to them already is.
+        ---
+        """
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.size = array('q')
+        self.allocated_size = array('q')
+        self.mtime = array('d')
+        self.flags = array('B')
+        self.name_offset = array('Q')
+        self.name_len = array('I')
+        self.folder_count = array('i')
+        self.file_count = array('i')
+        self.excluded_size = array('q')
+        self.excluded_folder_count = array('i')
+        self.excluded_file_count = array('i')
+        self.names = bytearray()
+        self.root_dirs:dict[int, str] = {} # root index -> path of folder containing it
+        self.version = 0 # incremented on any change, see VFSEntry.version
+        self.rules = None # VFSRuleSet, see VirtualFS.set_rules()
+
+    def __len__(self):
+        """Number of rows, including deleted entries"""
+        return len(self.flags)
+
+    # Rows
+
+    def _add_row(self, parent:int, name:str, flags:int, size:int, mtime:float, allocated:int=0) -> int:
+        self.version += 1
+        index = len(self.flags)
+        name_bytes = os.fsencode(name)
+        self.parent.append(parent)
+        self.first_child.append(NO_INDEX)
+        self.next_sibling.append(NO_INDEX)
+        self.size.append(size)
+        self.allocated_size.append(allocated)
+        self.mtime.append(mtime)
+        self.flags.append(flags)
+        self.name_offset.append(len(self.names))
+        self.name_len.append(len(name_bytes))
+        self.names += name_bytes
+        self.folder_count.append(0)
+        self.file_count.append(0)
+        self.excluded_size.append(0)
+        self.excluded_folder_count.append(0)
+        self.excluded_file_count.append(0)
+        return index
+
+    def get_name(self, index) -> str:
+        offset = self.name_offset[index]
+        return os.fsdecode(bytes(self.names[offset:offset + self.name_len[index]]))
+
+    def get_path(self, index) -> str:
+        names = []
+        while True:
+            names.append(self.get_name(index))
+            parent = self.parent[index]
+            if parent == NO_INDEX:
+                break
+            index = parent
+        names.append(self.root_dirs[index])
+        names.reverse()
+        return os.path.join(*names)
+
+    def iter_child_indices(self, index):
+        child = self.first_child[index]
+        while child != NO_INDEX:
+            yield child
+            child = self.next_sibling[child]
+
+    def iter_subtree_indices(self, index, include_self=True):
+        """Depth-first, each folder before its children"""
+        stack = [index] if include_self else list(self.iter_child_indices(index))[::-1]
+        while stack:
+            i = stack.pop()
+            yield i
+            if self.first_child[i] != NO_INDEX:
+                stack.extend(list(self.iter_child_indices(i))[::-1])
+
+    def _find_child_index(self, index, name_bytes:bytes):
+        names = self.names
+        for child in self.iter_child_indices(index):
+            offset = self.name_offset[child]
+            if self.name_len[child] == len(name_bytes) \
+                    and names[offset:offset + len(name_bytes)] == name_bytes:
+                return child
+        return NO_INDEX
+
+    # Entries
+
+    def entry(self, index) -> CompactVFSEntry:
+        return CompactVFSEntry(self, index)
+
+    def get_root_entries(self) -> list[CompactVFSEntry]:
+        return [CompactVFSEntry(self, i) for i in self.root_dirs]
+
+    def _find_index(self, path) -> int:
+        key = os.path.normcase(os.path.normpath(path))
+        for root in self.root_dirs:
+            root_key = os.path.normcase(self.get_path(root))
+            if key == root_key:
+                return root
+            prefix = root_key.rstrip(os.sep) + os.sep
+            if not key.startswith(prefix):
+                continue
+            index = root
+            rel_parts = os.path.normpath(path)[len(prefix):].split(os.sep)
+            for part in rel_parts:
+                index = self._find_child_index(index, os.fsencode(part))
+                if index == NO_INDEX:
+                    return NO_INDEX
+            return index
+        return NO_INDEX
+
+    def find_entry(self, path) -> CompactVFSEntry|None:
+        index = self._find_index(path)
+        if index == NO_INDEX:
+            return None
+        return CompactVFSEntry(self, index)
+
+    def has_path(self, path) -> bool:
+        return self._find_index(path) != NO_INDEX
+
+    def _find_ancestor_index(self, path) -> int:
+        """The closest entry above path, NO_INDEX if path isn't under any root"""
+        path = os.path.normpath(path)
+        parent_path = os.path.dirname(path)
+        while parent_path != path:
+            index = self._find_index(parent_path)
+            if index != NO_INDEX:
+                return index
+            path = parent_path
+            parent_path = os.path.dirname(path)
+        return NO_INDEX
+
+    def add_path(self, path) -> CompactVFSEntry|None:
+        """
+        Add path as a root and scan it. Returns the existing entry if found.
+        Roots below path are replaced by its scan. A path under a root is
+        added by syncing the closest folder above it, see sync_children().
+        """
+        existing = self.find_entry(path)
+        if existing != None:
+            return existing
+        path = os.path.normpath(path)
+        ancestor = self._find_ancestor_index(path)
+        if ancestor != NO_INDEX:
+            if self.flags[ancestor] & self.DIR:
+                self.sync_children(ancestor)
+            return self.find_entry(path)
+        st = os.stat(path)
+        prefix = os.path.normcase(path).rstrip(os.sep) + os.sep
+        for root in list(self.root_dirs):
+            if os.path.normcase(self.get_path(root)).startswith(prefix):
+                self.delete_subtree(root)
+        if os.path.isdir(path):
+            flags = self.DIR
+            size = allocated = 0
+        else:
+            flags = self.FILE
+            size = st.st_size
+            allocated = VFSInodeTracker.stat_to_allocated(st)
+        root = self._add_row(NO_INDEX, os.path.basename(path), flags, size, st.st_mtime, allocated)
+        self.root_dirs[root] = os.path.dirname(path)
+        if flags & self.DIR:
+            self._scan(root, path)
+        self.calc_aggregates(root)
+        entry = CompactVFSEntry(self, root)
+        if self.rules != None:
+            self.rules.apply(entry)
+        return entry
+
+    def iter_add_path(self,
+            path,
+            cancel_token:CancelToken=None,
+            interval=0.1) -> Iterator[ScanProgress]:
+        """
+        add_path() with the VirtualFS.iter_add_path() interface. Compact
+        scans can't be cancelled or report progress as they go, so this
+        yields a single finished ScanProgress.
+        """
+        entry = self.add_path(path)
+        progress = ScanProgress()
+        progress.dirs_visited = entry.get_folder_count() + entry.is_dir()
+        progress.files_seen = entry.get_file_count()
+        progress.bytes_total = entry.get_size()
+        progress.current_path = entry.path
+        progress.done = True
+        yield progress
+
+    def _stat_dir_entry(self, dir_entry:os.DirEntry, file_inodes:set=None) -> tuple:
+        """
+        (flags, size, mtime, allocated) of a new row, one stat at most.
+        file_inodes: keys of hardlinked files already counted, see
+        VFSInodeTracker. Later links are flagged HARDLINK and count 0.
+        """
+        try:
+            st = dir_entry.stat(follow_symlinks=False)
+            size = allocated = 0
+            if dir_entry.is_dir(follow_symlinks=False):
+                flags = self.DIR
+            elif dir_entry.is_file(follow_symlinks=False):
+                flags = self.FILE
+                key = VFSInodeTracker.inode_key(st) if st.st_nlink > 1 else None
+                if key != None and file_inodes != None and key in file_inodes:
+                    flags |= self.HARDLINK
+                else:
+                    if key != None and file_inodes != None:
+                        file_inodes.add(key)
+                    size = st.st_size
+                    allocated = VFSInodeTracker.stat_to_allocated(st)
+            else:
+                flags = 0
+            return flags, size, st.st_mtime, allocated
+        except OSError:
+            return 0, 0, 0.0, 0
+
+    def _scan(self, index, path):
+        """
+        Add all descendants of a folder, one stat per entry at most.
+        Symlinks aren't followed, and hardlinked files are counted once.
+        """
+        file_inodes = set() # keys of hardlinked files seen, see VFSInodeTracker
+        to_scan = [(index, path)]
+        while to_scan:
+            i_dir, dir_path = to_scan.pop()
+            prev = NO_INDEX
+            with os.scandir(dir_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    flags, size, mtime, allocated = self._stat_dir_entry(dir_entry, file_inodes)
+                    child = self._add_row(i_dir, dir_entry.name, flags, size, mtime, allocated)
+                    if prev == NO_INDEX:
+                        self.first_child[i_dir] = child
+                    else:
+                        self.next_sibling[prev] = child
+                    prev = child
+                    if flags & self.DIR:
+                        to_scan.append((child, dir_entry.path))
+
+    def materialize(self, entry:CompactVFSEntry, recurse=False, listing=None, orphans=None):
+        """Roots are always scanned fully, see VirtualFS.materialize()"""
+        pass
+
+    def sync_children(self, index, path=None):
+        """
+        Update a folder's children from a new listing, see
+        VirtualFS.sync_children(). New folders are scanned. Rows don't keep
+        inode numbers, so a new file is counted even if another link to it
+        already is.
+        """
+        if path == None:
+            path = self.get_path(index)
+        old_children = {self.get_name(i): i for i in self.iter_child_indices(index)}
+        added = []
+        with os.scandir(path) as dir_entries:
+            for dir_entry in dir_entries:
+                flags, size, mtime, allocated = self._stat_dir_entry(dir_entry)
+                child = old_children.pop(dir_entry.name, NO_INDEX)
+                if child != NO_INDEX:
+                    type_flags = self.DIR | self.FILE
+                    if self.flags[child] & type_flags == flags & type_flags:
+                        if flags & self.FILE and mtime != self.mtime[child]:
+                            self.mtime[child] = mtime
+                            self.set_size(child, size, allocated)
+                        continue
+                    self.delete_subtree(child)
+                added.append((dir_entry.name, dir_entry.path, flags, size, mtime, allocated))
+        for child in old_children.values():
+            self.delete_subtree(child)
+        prev = NO_INDEX
+        for prev in self.iter_child_indices(index):
+            pass
+        for name, child_path, flags, size, mtime, allocated in added:
+            child = self._add_row(index, name, flags, size, mtime, allocated)
+            if prev == NO_INDEX:
+                self.first_child[index] = child
+            else:
+                self.next_sibling[prev] = child
+            prev = child
+            self._add_aggregates(index, self.get_subtree_aggregates(child))
+            if flags & self.DIR:
+                self._scan(child, child_path)
+                self.calc_aggregates(child)
+            if self.rules != None:
+                self.rules.apply(CompactVFSEntry(self, child))
+
+    def _revalidate(self, index) -> bool:
+        """Sync a folder's children if its mtime changed, see VirtualFS.revalidate()"""
+        path = self.get_path(index)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self.delete_subtree(index)
+            return True
+        if mtime == self.mtime[index]:
+            return False
+        self.mtime[index] = mtime
+        self.sync_children(index, path)
+        return True
+
+    def _recheck_file(self, index):
+        """Update a file's mtime and sizes if its mtime changed, see VirtualFS._recheck_file()"""
+        flags = self.flags[index]
+        if not flags & self.FILE or flags & self.HARDLINK:
+            return
+        try:
+            st = os.lstat(self.get_path(index))
+        except FileNotFoundError:
+            self.delete_subtree(index)
+            return
+        if not stat.S_ISREG(st.st_mode):
+            return
+        if st.st_mtime != self.mtime[index]:
+            self.version += 1
+            self.mtime[index] = st.st_mtime
+            self.set_size(index, st.st_size, VFSInodeTracker.stat_to_allocated(st))
+
+    def rescan(self, path, check_files=False) -> bool:
+        """
+        Bring the tree at path up to date with the filesystem, see
+        VirtualFS.rescan(). Only folders whose mtime changed are listed
+        again. Returns False if path isn't in the VFS.
+        """
+        index = self._find_index(path)
+        if index == NO_INDEX:
+            return False
+        to_check = [index]
+        while to_check:
+            i = to_check.pop()
+            if not self.flags[i] & self.DIR:
+                self._recheck_file(i)
+                continue
+            changed = self._revalidate(i)
+            if self.flags[i] & self.DELETED:
+                continue
+            for child in self.iter_child_indices(i):
+                if self.flags[child] & self.DIR:
+                    to_check.append(child)
+                elif check_files and not changed:
+                    self._recheck_file(child)
+        return True
+
+    def apply_changes(self, paths) -> list[CompactVFSEntry]:
+        """Sync the entries at changed paths, see VirtualFS.apply_changes()"""
+        files = []
+        folders = {}
+        for path in paths:
+            index = self._find_index(path)
+            if index == NO_INDEX:
+                index = self._find_index(os.path.dirname(path))
+                if index == NO_INDEX:
+                    continue
+            if self.flags[index] & self.DIR:
+                folders[index] = None
+            else:
+                files.append(index)
+        changed = []
+        for index in files:
+            parent = self.parent[index]
+            self._recheck_file(index)
+            if not self.flags[index] & self.DELETED:
+                changed.append(CompactVFSEntry(self, index))
+            elif parent != NO_INDEX:
+                changed.append(CompactVFSEntry(self, parent))
+        for index in folders:
+            if self.flags[index] & self.DELETED:
+                continue
+            parent = self.parent[index]
+            path = self.get_path(index)
+            try:
+                self.mtime[index] = os.stat(path).st_mtime
+                self.sync_children(index, path)
+            except FileNotFoundError:
+                self.delete_subtree(index)
+                if parent != NO_INDEX and not self.flags[parent] & self.DELETED:
+                    changed.append(CompactVFSEntry(self, parent))
+                continue
+            changed.append(CompactVFSEntry(self, index))
+        return changed
+
+    def remove(self, path) -> bool:
+        index = self._find_index(path)
+        if index == NO_INDEX:
+            return False
+        self.delete_subtree(index)
+        return True
+
+    def remove_all(self):
+        version = self.version
+        rules = self.rules
+        self.__init__()
+        self.version = version + 1
+        self.rules = rules
+
+    def delete_subtree(self, index):
+        self.version += 1
+        parent = self.parent[index]
+        if parent == NO_INDEX:
+            del self.root_dirs[index]
+        else:
+            self._add_aggregates(parent,
+                tuple([-n for n in self.get_subtree_aggregates(index)]))
+            # unlink from parent's children
+            child = self.first_child[parent]
+            if child == index:
+                self.first_child[parent] = self.next_sibling[index]
+            else:
+                while self.next_sibling[child] != index:
+                    child = self.next_sibling[child]
+                self.next_sibling[child] = self.next_sibling[index]
+        for i in list(self.iter_subtree_indices(index)):
+            self.flags[i] = self.DELETED
+        self.parent[index] = NO_INDEX
+        self.next_sibling[index] = NO_INDEX
+
+    # Search
+
+    def search(self, query:str):
+        """
+        Yield CompactVFSEntrys whose names match query, see VFSNameQuery.
+        There's no name index here, names are checked row by row.
+        """
+        query = VFSNameQuery(query)
+        for index in range(len(self.flags)):
+            # rows may be cleared between results, see remove_all()
+            if index >= len(self.flags):
+                return
+            if self.flags[index] & self.DELETED:
+                continue
+            if not query.matches_name(self.get_name(index).casefold()):
+                continue
+            entry = CompactVFSEntry(self, index)
+            if not query.has_path or query.matches(entry):
+                yield entry
+
+    # Queries, see VirtualFS.top_n()
+
+    def _iter_query_indices(self, path=None):
+        if path == None:
+            flags = self.flags
+            return (i for i in range(len(flags)) if not flags[i] & self.DELETED)
+        index = self._find_index(path)
+        if index == NO_INDEX:
+            return iter(())
+        return self.iter_subtree_indices(index, include_self=False)
+
+    def top_n(self, n:int, kind='file', path=None, allocated=False) -> list[CompactVFSEntry]:
+        type_flag = self.DIR if kind == VFSEntry.entry_types.DIR else self.FILE
+        flags = self.flags
+        sizes = self.allocated_size if allocated else self.size
+        indices = (i for i in self._iter_query_indices(path) if flags[i] & type_flag)
+        return [CompactVFSEntry(self, i)
+            for i in heapq.nlargest(n, indices, key=sizes.__getitem__)]
+
+    def size_histogram(self, buckets:list[int]=None, path=None, allocated=False) -> VFSSizeHistogram:
+        histogram = VFSSizeHistogram(buckets)
+        flags = self.flags
+        sizes = self.allocated_size if allocated else self.size
+        for i in self._iter_query_indices(path):
+            if flags[i] & self.FILE and not flags[i] & self.HARDLINK:
+                histogram.add(sizes[i])
+        return histogram
+
+    # Export
+
+    def export(self, stream, format='jsonl') -> int:
+        """See VirtualFS.export(). Exports are loaded back into a VirtualFS."""
+        return VFSExport(format).write(self, stream)
+
+    # Rules
+
+    def set_rules(self, rules):
+        self.rules = rules
+        if rules != None:
+            for entry in self.get_root_entries():
+                rules.apply(entry)
+
+    # Aggregates
+
+    def get_subtree_aggregates(self, index):
+        flags = self.flags[index]
+        is_dir = 1 if flags & self.DIR else 0
+        is_file = 1 if flags & self.FILE else 0
+        excluded = 1 if flags & self.EXCLUDED else 0
+        return (
+            self.size[index],
+            self.folder_count[index] + is_dir,
+            self.file_count[index] + is_file,
+            self.excluded_size[index],
+            self.excluded_folder_count[index] + (is_dir & excluded),
+            self.excluded_file_count[index] + (is_file & excluded),
+            self.allocated_size[index])
+
+    def _add_aggregates(self, index, delta):
+        d_size, d_folders, d_files, d_exc_size, d_exc_folders, d_exc_files, d_allocated = delta
+        self.version += 1
+        while index != NO_INDEX:
+            self.size[index] += d_size
+            self.allocated_size[index] += d_allocated
+            self.folder_count[index] += d_folders
+            self.file_count[index] += d_files
+            self.excluded_size[index] += d_exc_size
+            self.excluded_folder_count[index] += d_exc_folders
+            self.excluded_file_count[index] += d_exc_files
+            index = self.parent[index]
+
+    def set_size(self, index, size, allocated=None):
+        if self.flags[index] & self.HARDLINK:
+            return
+        if allocated == None:
+            allocated = self.allocated_size[index]
+        d_size = size - self.size[index]
+        d_allocated = allocated - self.allocated_size[index]
+        if d_size == 0 and d_allocated == 0:
+            return
+        d_exc_size = d_size if self.flags[index] & self.EXCLUDED else 0
+        self._add_aggregates(index, (d_size, 0, 0, d_exc_size, 0, 0, d_allocated))
+
+    def set_excluded(self, index, excluded:bool, update_aggregates=True):
+        flags = self.flags[index]
+        if bool(flags & self.EXCLUDED) == bool(excluded):
+            return
+        sign = 1 if excluded else -1
+        self.version += 1
+        self.flags[index] = flags ^ self.EXCLUDED
+        if not update_aggregates:
+            return
+        parent = self.parent[index]
+        if flags & self.DIR:
+            self._add_aggregates(parent, (0, 0, 0, 0, sign, 0, 0))
+            return
+        self._add_aggregates(index, (0, 0, 0, sign * self.size[index], 0, 0, 0))
+        if flags & self.FILE:
+            self._add_aggregates(parent, (0, 0, 0, 0, 0, sign, 0))
+
+    def calc_aggregates(self, index, restat=False):
+        """
+        Recalculate the aggregates of a subtree from scratch, then pass
+        the difference on to its parents
+        """
+        self.version += 1
+        before = self.get_subtree_aggregates(index)
+        indices = list(self.iter_subtree_indices(index))
+        for i in indices:
+            if self.flags[i] & self.DIR:
+                self.size[i] = 0
+                self.allocated_size[i] = 0
+                self.folder_count[i] = 0
+                self.file_count[i] = 0
+                self.excluded_size[i] = 0
+                self.excluded_folder_count[i] = 0
+                self.excluded_file_count[i] = 0
+            elif restat and self.flags[i] & self.FILE:
+                st = os.stat(self.get_path(i))
+                self.mtime[i] = st.st_mtime
+                if not self.flags[i] & self.HARDLINK:
+                    self.size[i] = st.st_size
+                    self.allocated_size[i] = VFSInodeTracker.stat_to_allocated(st)
+        # descendants come after their folders, so reversed is bottom up
+        for i in reversed(indices):
+            flags = self.flags[i]
+            if not flags & self.DIR:
+                excluded = flags & self.EXCLUDED
+                self.excluded_size[i] = self.size[i] if excluded else 0
+            if i == index:
+                continue
+            parent = self.parent[i]
+            c_size, c_folders, c_files, c_exc_size, c_exc_folders, c_exc_files, \
+                c_allocated = self.get_subtree_aggregates(i)
+            self.size[parent] += c_size
+            self.allocated_size[parent] += c_allocated
+            self.folder_count[parent] += c_folders
+            self.file_count[parent] += c_files
+            self.excluded_size[parent] += c_exc_size
+            self.excluded_folder_count[parent] += c_exc_folders
+            self.excluded_file_count[parent] += c_exc_files
+        parent = self.parent[index]
+        if parent != NO_INDEX:
+            after = self.get_subtree_aggregates(index)
+            self._add_aggregates(parent, tuple([a - b for a, b in zip(after, before)]))
+
+    def calc_root(self, path):
+        index = self._find_index(path)
+        if index != NO_INDEX:
+            self.calc_aggregates(index)
+
+    def calc_roots(self, paths):
+        for path in paths:
+            self.calc_root(path)
+
+    def calc_all(self):
+        for root in self.root_dirs:
+            self.calc_aggregates(root)
+
+    # Other
+
+    def for_entries(self, func, return_nones=False):
+        """func(entry) called on every entry. rv's returned as list"""
+        rvs = []
+        for root in list(self.root_dirs):
+            for index in self.iter_subtree_indices(root):
+                rv = func(CompactVFSEntry(self, index))
+                if rv != None or return_nones:
+                    rvs.append(rv)
+        return rvs
+
+    def for_roots(self, func, return_nones=False):
+        """func(entry) called on every root. rv's returned as list"""
+        rvs = []
+        for entry in self.get_root_entries():
+            rv = func(entry)
+            if rv != None or return_nones:
+                rvs.append(rv)
+        return rvs
+
+    def get_root_folder_count(self):
+        return len([i for i in self.root_dirs if self.flags[i] & self.DIR])
+
+    def get_root_file_count(self):
+        return len([i for i in self.root_dirs if self.flags[i] & self.FILE])
+CompactVFS = CompactVirtualFS
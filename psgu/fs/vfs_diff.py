@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import os
+
+from psgu.data import units as unit
+from psgu.fs.vfs import VirtualFS
+from psgu.fs.vfs_cache import VFSCache
+from psgu.fs.vfs_entry import VFSEntry
+
+
+__all__ = [
+    'VFSDiffEntry',
+    'VFSDiff'
+]
+
+
+class VFSDiffEntry(VFSEntry):
+
+    class changes:
+        ADDED = 'Added'
+        REMOVED = 'Removed'
+        RESIZED = 'Resized'
+        MODIFIED = 'Modified' # same size, new mtime
+        REPLACED = 'Replaced' # file became a folder or the other way
+        NONE = '' # folder with changes below it
+
+    def __init__(self,
+            init_path,
+            entry_type:str=None,
+            size:int=None,
+            mtime:float=None,
+            allocated:int=None,
+            inode:int=None):
+        """
+        An entry of a VFSDiff result. size is the change in size, so
+        folders' aggregates add up to their size change, and their counts
+        are of changed entries below them.
+        """
+        super().__init__(init_path, entry_type, size, mtime, allocated, inode)
+        self.change = VFSDiffEntry.changes.NONE
+        self.old_size = 0
+        self.new_size = 0
+        self.old_allocated_size = 0
+        self.children_scanned = True # never listed from disk
+
+    def get_status(self):
+        return self.change
+    status = property(fget=get_status)
+
+    def get_change_string(self) -> str:
+        """e.g. 'Resized: 1.2 MB -> 3 MB (+1.8 MB)'"""
+        old_best = unit.Bytes(self.old_size, unit.Bytes.B).get_best()
+        new_best = unit.Bytes(self.new_size, unit.Bytes.B).get_best()
+        delta_best = unit.Bytes(self.size, unit.Bytes.B).get_best()
+        sign = '+' if self.size >= 0 else ''
+        s = '{} -> {} ({}{})'.format(old_best, new_best, sign, delta_best)
+        if self.change == VFSDiffEntry.changes.NONE:
+            return s
+        return self.change + ': ' + s
+
+
+class VFSDiff:
+
+    def __init__(self, old_vfs, new_vfs, prune=True):
+        """
+        ---
+        Compares two scans of the same roots, e.g. a VFSCache from last week
+        and a fresh VirtualFS. Call compare() for the differences as a
+        VirtualFS of VFSDiffEntrys, which a read-only VFSExplorerView can
+        browse.
+
+        Folders present in both scans with the same mtime and the same
+        aggregates (size, counts and allocated size) are taken as unchanged
+        and not compared further. A file rewritten in place at the same size
+        is then missed, so prune=False compares every entry.
+
+        Either VFS may be a VirtualFS or a CompactVirtualFS.
+        ---
+        Args:
+            old_vfs: the earlier scan.
+            new_vfs: the later scan.
+            prune (default=True): skip unchanged folders by mtime and
+                aggregates.
+        """
+        self.old_vfs = old_vfs
+        self.new_vfs = new_vfs
+        self.prune = prune
+        self.result:VirtualFS|None = None
+        self.added = 0
+        self.removed = 0
+        self.resized = 0
+        self.modified = 0
+        self.replaced = 0
+        self.size_delta = 0
+        self.compared = 0 # entry pairs compared
+        self.pruned = 0 # folders skipped as unchanged
+        self._replaced_dirs:list[VFSDiffEntry] = [] # files that became folders
+
+    def from_caches(old_cache_path, new_cache_path, prune=True) -> VFSDiff:
+        """A VFSDiff of two VFSCache files, loaded as they are without revalidating"""
+        old_vfs = VirtualFS()
+        new_vfs = VirtualFS()
+        for cache_path, vfs in ((old_cache_path, old_vfs), (new_cache_path, new_vfs)):
+            if not VFSCache(cache_path).load(vfs):
+                raise ValueError('Not a usable VFS cache: {}'.format(cache_path))
+        return VFSDiff(old_vfs, new_vfs, prune)
+
+    # Comparing
+
+    def compare(self) -> VirtualFS:
+        """Compare the scans. The result is also kept as self.result."""
+        result = VirtualFS()
+        old_roots = {os.path.normcase(e.path): e for e in self.old_vfs.get_root_entries()}
+        new_roots = {os.path.normcase(e.path): e for e in self.new_vfs.get_root_entries()}
+        roots = []
+        for key, old_root in old_roots.items():
+            root = self._diff_pair(old_root, new_roots.get(key))
+            if root != None:
+                roots.append(root)
+        for key, new_root in new_roots.items():
+            if key not in old_roots:
+                roots.append(self._diff_pair(None, new_root))
+        for root in roots:
+            root.calc_aggregates()
+        # calc_aggregates() sums folders from their children, so the old
+        # file's bytes are taken off afterwards
+        for diff in self._replaced_dirs:
+            diff._add_aggregates((-diff.old_size, 0, 0, 0, 0, 0, -diff.old_allocated_size))
+        for root in roots:
+            result.root_entries[os.path.normcase(root.path)] = root
+            result._index_entries(root)
+        self.result = result
+        return result
+
+    def _is_unchanged(self, old, new) -> bool:
+        return self.prune \
+            and old.mtime == new.mtime \
+            and old.get_subtree_aggregates() == new.get_subtree_aggregates()
+
+    def _diff_pair(self, old, new) -> VFSDiffEntry|None:
+        """Diff entry for old vs new (either may be None), None if unchanged"""
+        changes = VFSDiffEntry.changes
+        if old == None:
+            return self._copy_subtree(new, changes.ADDED)
+        if new == None:
+            return self._copy_subtree(old, changes.REMOVED)
+        if old.entry_type != new.entry_type:
+            self.replaced += 1
+            diff = self._copy_subtree(new, changes.REPLACED)
+            old_size = old.get_size()
+            diff.old_size = old_size
+            self.size_delta -= old_size
+            if diff.is_dir():
+                if not old.hardlink:
+                    diff.old_allocated_size = old.get_allocated_size()
+                self._replaced_dirs.append(diff)
+            else:
+                diff.size -= old_size
+                diff.allocated_size -= old.get_allocated_size()
+            return diff
+        if not new.is_dir():
+            return self._diff_file(old, new)
+        # folders, depth first, dropping folders with no changes below
+        root = self._new_entry(new, 0)
+        stack = [(old, new, root)]
+        folders = []
+        while stack:
+            old_folder, new_folder, diff_folder = stack.pop()
+            folders.append(diff_folder)
+            self.compared += 1
+            if self._is_unchanged(old_folder, new_folder):
+                self.pruned += 1
+                continue
+            diff_folder.old_size = old_folder.get_size()
+            diff_folder.new_size = new_folder.get_size()
+            old_children = {c.name: c for c in old_folder.get_children()}
+            for new_child in new_folder.get_children():
+                old_child = old_children.pop(new_child.name, None)
+                if old_child != None and old_child.is_dir() and new_child.is_dir():
+                    diff_child = self._new_entry(new_child, 0)
+                    diff_folder.connect_child(diff_child, update_aggregates=False)
+                    stack.append((old_child, new_child, diff_child))
+                    continue
+                diff_child = self._diff_pair(old_child, new_child)
+                if diff_child != None:
+                    diff_folder.connect_child(diff_child, update_aggregates=False)
+            for old_child in old_children.values():
+                diff_folder.connect_child(
+                    self._copy_subtree(old_child, changes.REMOVED), update_aggregates=False)
+        # children come after their folders
+        for diff_folder in reversed(folders):
+            if diff_folder.children or diff_folder is root:
+                continue
+            diff_folder.parent.children.remove(diff_folder)
+            diff_folder.parent = None
+        if not root.children:
+            return None
+        return root
+
+    def _diff_file(self, old, new) -> VFSDiffEntry|None:
+        self.compared += 1
+        old_size = old.get_size()
+        new_size = new.get_size()
+        changes = VFSDiffEntry.changes
+        if old_size != new_size:
+            change = changes.RESIZED
+            self.resized += 1
+        elif old.mtime != new.mtime:
+            change = changes.MODIFIED
+            self.modified += 1
+        else:
+            return None
+        diff = self._new_entry(new, new_size - old_size,
+            new.get_allocated_size() - old.get_allocated_size())
+        diff.change = change
+        diff.old_size = old_size
+        diff.new_size = new_size
+        self.size_delta += new_size - old_size
+        return diff
+
+    def _new_entry(self, source, size, allocated=0) -> VFSDiffEntry:
+        return VFSDiffEntry(source.path, source.entry_type, size, source.mtime, allocated)
+
+    def _copy_subtree(self, source, change) -> VFSDiffEntry:
+        """Copy a subtree that's only in one scan, sizes signed by change"""
+        sign = -1 if change == VFSDiffEntry.changes.REMOVED else 1
+        copy_root = None
+        stack = [(source, None)]
+        while stack:
+            entry, diff_parent = stack.pop()
+            size = entry.get_size() if not entry.is_dir() else 0
+            diff = self._new_entry(entry, sign * size, sign * entry.get_allocated_size()
+                if not entry.is_dir() else 0)
+            diff.change = change
+            if sign < 0:
+                diff.old_size = entry.get_size()
+            else:
+                diff.new_size = entry.get_size()
+            if diff_parent == None:
+                copy_root = diff
+            else:
+                diff_parent.connect_child(diff, update_aggregates=False)
+            if change == VFSDiffEntry.changes.ADDED or change == VFSDiffEntry.changes.REPLACED:
+                self.added += 1
+            else:
+                self.removed += 1
+            stack.extend([(child, diff) for child in reversed(entry.get_children())])
+        self.size_delta += sign * source.get_size()
+        if change == VFSDiffEntry.changes.REPLACED:
+            self.added -= 1 # counted in replaced
+        return copy_root
+
+    # Results
+
+    def get_summary(self) -> str:
+        sign = '+' if self.size_delta >= 0 else ''
+        delta_best = unit.Bytes(self.size_delta, unit.Bytes.B).get_best()
+        return ('{} added, {} removed, {} resized, {} modified, {} replaced, {}{} total. '
+            '{} compared, {} unchanged folders skipped').format(
+            self.added, self.removed, self.resized, self.modified, self.replaced,
+            sign, delta_best, self.compared, self.pruned)
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
+
+from psgu.data import units as unit
+from psgu.fs.vfs_scanner import CancelToken
+
+
+__all__ = [
+    'DupeProgress',
+    'VFSDupeFinder'
+]
+
+
+class DupeProgress:
+
+    class stages:
+        SIZE = 'Grouping by size'
+        PARTIAL = 'Hashing heads and tails'
+        FULL = 'Hashing whole files'
+
+    def __init__(self):
+        self.stage = DupeProgress.stages.SIZE
+        self.files_seen = 0
+        self.files_to_hash = 0 # in this stage
+        self.files_hashed = 0 # in this stage
+        self.bytes_hashed = 0 # all stages
+        self.errors = 0 # files that couldn't be read
+        self.current_path = ''
+        self.done = False
+        self.cancelled = False
+
+    def get_fraction(self) -> float:
+        """Fraction of the current stage done, stages run one after another"""
+        if self.done:
+            return 1.0
+        if not self.files_to_hash:
+            return 0.0
+        return self.files_hashed / self.files_to_hash
+
+    def to_string(self) -> str:
+        hashed_best = unit.Bytes(self.bytes_hashed, degree_name=unit.Bytes.BYTE).get_best()
+        s = '{}: {} of {} files, {} read'.format(
+            self.stage, self.files_hashed, self.files_to_hash, hashed_best)
+        if self.errors:
+            s += ', {} unreadable'.format(self.errors)
+        if self.cancelled:
+            return s + ' (cancelled)'
+        if self.done:
+            return s
+        return s + ': ' + self.current_path
+
+
+class VFSDupeFinder:
+
+    def __init__(self, workers=4, min_size=1, partial_bytes=64 << 10, chunk_bytes=1 << 20):
+        """
+        ---
+        Finds files with the same contents in a VFS, narrowing the
+        candidates in stages so most files are never read:
+
+        1. Files are grouped by size, files with a size of their own can't
+        have duplicates.
+        2. Files left are grouped by a hash of their first and last
+        partial_bytes. Files no bigger than 2 * partial_bytes are read whole
+        here, and need no third stage.
+        3. Files still in groups are hashed in full, chunk_bytes at a time.
+
+        Files are read on a thread pool, reading and hashing release the GIL.
+        Hardlinks counted at another path are left out, as are files the VFS
+        hasn't found a size for. Files that can't be read are skipped.
+        ---
+        Args:
+            workers (default=4): max files read at once.
+            min_size (default=1): smaller files are ignored. Empty files are
+                all the same.
+            partial_bytes (default=64 KB): bytes hashed from each end in the
+                second stage.
+            chunk_bytes (default=1 MB): read size when hashing.
+        """
+        self.workers = workers if workers > 0 else 1
+        self.min_size = max(min_size, 1)
+        self.partial_bytes = partial_bytes
+        self.chunk_bytes = chunk_bytes
+        self.groups:list[list] = [] # results of the last find, see iter_find()
+
+    def hash_file(path, size:int, partial_bytes:int, chunk_bytes:int) -> tuple[bytes, int]:
+        """
+        (digest, bytes read). With partial_bytes, only the first and last
+        partial_bytes are hashed, unless the file is no bigger than twice
+        that. size is hashed too, in case the file changed since it was
+        scanned.
+        """
+        h = hashlib.blake2b(size.to_bytes(8, 'little', signed=True), digest_size=20)
+        read = 0
+        with open(path, 'rb') as f:
+            if partial_bytes and size > 2 * partial_bytes:
+                head = f.read(partial_bytes)
+                f.seek(-partial_bytes, 2)
+                tail = f.read(partial_bytes)
+                h.update(head)
+                h.update(tail)
+                return h.digest(), len(head) + len(tail)
+            while True:
+                chunk = f.read(chunk_bytes)
+                if not chunk:
+                    break
+                h.update(chunk)
+                read += len(chunk)
+        return h.digest(), read
+
+    def get_wasted_size(group:list) -> int:
+        """Bytes that removing all but one of group would free"""
+        return group[0].get_size() * (len(group) - 1)
+
+    def find(self, vfs, path=None) -> list[list]:
+        for _ in self.iter_find(vfs, path):
+            pass
+        return self.groups
+
+    def iter_find(self,
+            vfs,
+            path=None,
+            cancel_token:CancelToken=None,
+            interval=0.1) -> Iterator[DupeProgress]:
+        """
+        Find duplicates in vfs (a VirtualFS or CompactVirtualFS), under path
+        if given. Yields a DupeProgress at most every interval seconds and
+        once more when done or cancelled, the same one each time.
+
+        When done, self.groups holds lists of entries with the same contents,
+        most wasted bytes first, entries in each group by path. A cancelled
+        find leaves self.groups empty.
+        """
+        progress = DupeProgress()
+        self.groups = []
+        # 1. sizes
+        by_size = {}
+        for entry in self._iter_files(vfs, path):
+            progress.files_seen += 1
+            by_size.setdefault(entry.get_size(), []).append(entry)
+        groups = [group for group in by_size.values() if len(group) > 1]
+        by_size = None
+        # 2. heads and tails
+        progress.stage = DupeProgress.stages.PARTIAL
+        groups = yield from self._split_groups(
+            groups, self.partial_bytes, progress, cancel_token, interval)
+        # 3. whole files, for groups not already read whole
+        progress.stage = DupeProgress.stages.FULL
+        partial_limit = 2 * self.partial_bytes
+        done_groups = [group for group in groups if group[0].get_size() <= partial_limit]
+        groups = [group for group in groups if group[0].get_size() > partial_limit]
+        groups = yield from self._split_groups(
+            groups, 0, progress, cancel_token, interval)
+        progress.cancelled = cancel_token != None and cancel_token.is_cancelled()
+        if not progress.cancelled:
+            groups.extend(done_groups)
+            for group in groups:
+                group.sort(key=lambda e: e.path)
+            groups.sort(key=VFSDupeFinder.get_wasted_size, reverse=True)
+            self.groups = groups
+        progress.done = True
+        yield progress
+
+    def _iter_files(self, vfs, path=None):
+        if path != None:
+            entry = vfs.find_entry(path)
+            roots = [entry] if entry != None else []
+        else:
+            roots = vfs.get_root_entries()
+        min_size = self.min_size
+        for root in roots:
+            for entry in root.walk():
+                if entry.is_file() and not entry.hardlink and entry.get_size() >= min_size:
+                    yield entry
+
+    def _split_groups(self, groups, partial_bytes, progress, cancel_token, interval):
+        """
+        Hash the files of groups, regrouping them by digest. Generator that
+        yields progress and returns the groups of 2 or more.
+        """
+        files = [entry for group in groups for entry in group]
+        progress.files_to_hash = len(files)
+        progress.files_hashed = 0
+        by_digest = {}
+        next_report = time.monotonic() + interval
+        chunk_bytes = self.chunk_bytes
+        max_in_flight = self.workers * 2
+        file_iter = iter(files)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = {}
+            while True:
+                if cancel_token != None and cancel_token.is_cancelled():
+                    for future in in_flight:
+                        future.cancel()
+                    return []
+                for entry in file_iter:
+                    in_flight[executor.submit(VFSDupeFinder.hash_file, entry.path,
+                        entry.get_size(), partial_bytes, chunk_bytes)] = entry
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entry = in_flight.pop(future)
+                    progress.files_hashed += 1
+                    progress.current_path = entry.path
+                    try:
+                        digest, read = future.result()
+                    except OSError:
+                        progress.errors += 1
+                        continue
+                    progress.bytes_hashed += read
+                    by_digest.setdefault(digest, []).append(entry)
+                now = time.monotonic()
+                if now >= next_report:
+                    next_report = now + interval
+                    yield progress
+        return [group for group in by_digest.values() if len(group) > 1]
@@ -1,6 +1,11 @@
+from __future__ import annotations
+
 import os
+import sys
 from os.path import normpath
 
+from psgu.fs.vfs_inodes import VFSInodeTracker
+
 
 class VFSEntry:
     
@@ -8,13 +13,51 @@ class VFSEntry:
         DIR = 'dir'
         FILE = 'file'
     
-    def __init__(self, init_path):
+    def __init__(self,
+            init_path,
+            entry_type:str=None,
+            size:int=None,
+            mtime:float=None,
+            allocated:int=None,
+            inode:int=None):
+        """
+        entry_type, size, mtime and allocated may be given when already
+        known, e.g. from a scan, to skip the stat calls that would find them.
+        inode: VFSInodeTracker key, for hardlinked files and for folders
+        when symlinks are followed.
+        """
         self.path:str = normpath(init_path)
         self.parent:VFSEntry = None
         self.children:list[VFSEntry] = []
-        self.entry_type = VFSEntry.path_to_type(self.path)
-        self.size:int = 0
-        self.name:str = os.path.basename(self.path)
+        if entry_type == None:
+            entry_type = VFSEntry.path_to_type(self.path)
+        self.entry_type = entry_type
+        self.size:int = size if size != None else 0
+        self.size_known = (size != None) # if False, calc_size() must stat
+        self.mtime:float|None = mtime
+        self.inode:int|None = inode
+        self.hardlink = False # another link to this file counts its bytes
+        self.name:str = sys.intern(os.path.basename(self.path))
+        self.vfs = None # VirtualFS indexing this entry, if any
+        self.excluded = False
+        self.children_scanned = False # folder listed, see scan_children()
+        self.stale = False # children not yet checked against the filesystem
+        # Change counters, for caches of sort orders and display rows.
+        # version: this entry's own fields or aggregates changed.
+        # children_version: children were added or removed, or any child's
+        # version changed. See touch()
+        self.version = 0
+        self.children_version = 0
+
+        # Aggregates. size, allocated_size and excluded_size include this
+        # entry, counts are of descendants only. Kept up to date
+        # incrementally, see _add_aggregates()
+        self.allocated_size:int = allocated if allocated != None else self.size
+        self.folder_count = 0
+        self.file_count = 0
+        self.excluded_size = 0
+        self.excluded_folder_count = 0
+        self.excluded_file_count = 0
     
     def path_to_type(path):
         if os.path.isdir(path):
@@ -23,15 +66,122 @@ class VFSEntry:
             return VFSEntry.entry_types.FILE
         return ''
     
+    def list_dir(path, follow_symlinks=False) -> list[tuple]:
+        """
+        (path, entry_type, size, mtime, allocated, inode) of each of a
+        folder's children, from a single os.scandir() listing. Touches no
+        entries, so it may be run on another thread and the result passed
+        to scan_children().
+        """
+        with os.scandir(path) as dir_entries:
+            return [(normpath(dir_entry.path),
+                    *VFSEntry.dir_entry_to_info(dir_entry, follow_symlinks))
+                for dir_entry in dir_entries]
+    
+    def dir_entry_to_info(dir_entry:os.DirEntry, follow_symlinks=False) -> tuple:
+        """
+        Type, size, mtime, allocated size and inode key (see
+        VFSInodeTracker) from an os.DirEntry, with one stat at most.
+        Symlinks are entries of no type unless follow_symlinks is True.
+        Only hardlinked files get an inode key, or every file and folder
+        when following symlinks, since a link reaches the same inode.
+        """
+        try:
+            if dir_entry.is_dir(follow_symlinks=follow_symlinks):
+                stat_result = dir_entry.stat(follow_symlinks=follow_symlinks)
+                inode = VFSInodeTracker.inode_key(stat_result) if follow_symlinks else None
+                return VFSEntry.entry_types.DIR, 0, stat_result.st_mtime, 0, inode
+            if dir_entry.is_file(follow_symlinks=follow_symlinks):
+                stat_result = dir_entry.stat(follow_symlinks=follow_symlinks)
+                inode = None
+                if stat_result.st_nlink > 1 or follow_symlinks:
+                    inode = VFSInodeTracker.inode_key(stat_result)
+                return (VFSEntry.entry_types.FILE, stat_result.st_size, stat_result.st_mtime,
+                    VFSInodeTracker.stat_to_allocated(stat_result), inode)
+        except OSError:
+            pass
+        return '', None, None, None, None
+    
     @classmethod
     def from_parent(cls, parent, init_path):
-        child = VFSEntry(init_path)
-        parent.connect_child()
+        child = cls(init_path)
+        parent.connect_child(child)
         return child
     
-    def connect_child(self, child):
+    def connect_child(self, child, update_aggregates=True):
+        """
+        update_aggregates: add the child's aggregates to this entry and its
+        parents. Scans turn this off and call refresh_aggregates() once
+        when finished instead.
+        """
         child.parent = self
         self.children.append(child)
+        self.children_version += 1
+        if self.vfs != None and child.vfs is not self.vfs:
+            self.vfs._index_entries(child)
+        if update_aggregates:
+            self._add_aggregates(child.get_subtree_aggregates())
+    
+    def disconnect(self):
+        """Detach this entry's subtree from its parent, updating aggregates"""
+        if self.parent == None:
+            return
+        self.parent._add_aggregates(
+            tuple([-n for n in self.get_subtree_aggregates()]))
+        self.parent.children.remove(self)
+        self.parent.children_version += 1
+        self.parent = None
+    
+    def walk(self, include_self=True):
+        """Yield entries depth-first, each folder before its children"""
+        if include_self:
+            stack = [self]
+        else:
+            stack = self.children[::-1]
+        while stack:
+            entry = stack.pop()
+            yield entry
+            if entry.children:
+                stack.extend(reversed(entry.children))
+    
+    def iter_children(self, recurse=True, include_self=False):
+        """
+        Yield entries in for_children() order: a folder's children are all
+        yielded before any of their own children
+        """
+        if include_self:
+            yield self
+        if not recurse:
+            yield from self.children
+            return
+        stack = [self]
+        while stack:
+            entry = stack.pop()
+            yield from entry.children
+            for child in reversed(entry.children):
+                if child.children:
+                    stack.append(child)
+    
+    def iter_children_where(self,
+            func_cond,
+            recurse=True,
+            include_self=True):
+        """
+        Yield entries where func_cond(entry) is True. If recurse is False,
+        the children of matching entries are not searched.
+        """
+        if include_self:
+            stack = [self]
+        else:
+            stack = self.children[::-1]
+        while stack:
+            entry = stack.pop()
+            if func_cond(entry):
+                yield entry
+                if not recurse:
+                    continue
+            if entry.children:
+                stack.extend(reversed(entry.children))
     
     def find_children_where(self,
             func_cond, 
@@ -39,34 +189,42 @@ class VFSEntry:
             recurse=True, 
             include_self=True):
         found = []
-        if include_self and func_cond(self):
+        for entry in self.iter_children_where(func_cond, recurse, include_self):
+            found.append(entry)
             if func_found:
-                func_found(self)
-            if not recurse:
-                return found
-        children = self.children.copy()
-        for child in children:
-            found_child = child.find_children_where(
-                func_cond, func_found, recurse)
-            found.extend(found_child)
+                func_found(entry)
         return found
     
+    def iter_parents(self, include_self=True):
+        entry = self if include_self else self.parent
+        while entry != None:
+            yield entry
+            entry = entry.parent
+    
+    def iter_parents_where(self,
+            func_cond,
+            recurse=True,
+            include_self=True):
+        """
+        Yield parents where func_cond(entry) is True, nearest first.
+        If recurse is False, stops at the first match.
+        """
+        for entry in self.iter_parents(include_self):
+            if func_cond(entry):
+                yield entry
+                if not recurse:
+                    return
+    
     def find_parents_where(self,
             func_cond,
             func_found=None,
             recurse=True, 
             include_self=True):
         found = []
-        if include_self and func_cond(self):
-            found.append(self)
+        for entry in self.iter_parents_where(func_cond, recurse, include_self):
+            found.append(entry)
             if func_found:
-                func_found(self)
-            if not recurse:
-                return found
-        if self.parent:
-            found_parent = self.parent.find_parents_where(
-                func_cond, func_found, recurse)
-            found.extend(found_parent)
+                func_found(entry)
         return found
     
     def for_children(self,
@@ -81,20 +239,10 @@ class VFSEntry:
         if kwargs == None:
             kwargs = {}
         rvs = []
-        if include_self:
-            rv = func(self, *args, **kwargs)
+        for entry in self.iter_children(recurse, include_self):
+            rv = func(entry, *args, **kwargs)
             if rv != None or return_nones:
                 rvs.append(rv)
-        for child in self.children:
-            rv = func(child, *args, **kwargs)
-            if rv != None or return_nones:
-                rvs.append(rv)
-        if recurse:
-            for child in self.children:
-                child_rvs = child.for_children(func,
-                    args=args, kwargs=kwargs, recurse=recurse,
-                    include_self=False, return_nones=return_nones)
-                rvs.extend(child_rvs)
         return rvs
     
     def for_parents(self,
@@ -109,25 +257,31 @@ class VFSEntry:
         if kwargs == None:
             kwargs = {}
         rvs = []
-        if include_self:
-            rv = func(self)
+        entries = self.iter_parents(include_self)
+        if not recurse:
+            entries = [self] if include_self else []
+        for entry in entries:
+            rv = func(entry, *args, **kwargs)
             if rv != None or return_nones:
                 rvs.append(rv)
-        if recurse:
-            parent_rvs = self.parent.for_parents(func,
-                recurse=recurse, include_self=False,
-                return_nones=return_nones)
-            rvs.extend(parent_rvs)
         return rvs
     
     def print_tree(self, indent=0):
-        print(' ' * indent + self.name)
-        for child in self.children:
-            child.print_tree(indent+2)
+        stack = [(self, indent)]
+        while stack:
+            entry, entry_indent = stack.pop()
+            print(' ' * entry_indent + entry.name)
+            for child in reversed(entry.children):
+                stack.append((child, entry_indent + 2))
     
     def delete_self(self):
+        if self.vfs != None:
+            self.vfs._unindex_entries(self)
         if self.parent:
+            self.parent._add_aggregates(
+                tuple([-n for n in self.get_subtree_aggregates()]))
             self.parent.children.remove(self)
+            self.parent.children_version += 1
         for child in self.children:
             child.parent = None
         self.children.clear()
@@ -135,12 +289,28 @@ class VFSEntry:
         self.parent = None
         self.entry_type = ''
         self.size = 0
+        self.size_known = False
+        self.mtime = None
+        self.inode = None
+        self.hardlink = False
+        self.children_scanned = False
+        self.stale = False
         self.name = ''
+        self.excluded = False
+        self.allocated_size = 0
+        self.folder_count = 0
+        self.file_count = 0
+        self.excluded_size = 0
+        self.excluded_folder_count = 0
+        self.excluded_file_count = 0
         return
     
     def delete_all(self):
-        all = self.collect_entries()
-        for entry in all:
+        """Delete this entry and all of its descendants"""
+        stack = [self]
+        while stack:
+            entry = stack.pop()
+            stack.extend(entry.children)
             entry.delete_self()
         return
     
@@ -152,27 +322,63 @@ class VFSEntry:
     def adopt_orphan(self, orphan):
         pass
     
-    def create_children(self, orphans:dict=None):
-        if not self.is_dir():
-            return
+    def scan_children(self, orphans:dict=None, listing:list=None) -> list:
+        """
+        Create entries for this folder's direct children from a single
+        os.scandir() listing, or from listing (see list_dir()) if given.
+        Children whose paths are in orphans (path -> VFSEntry) are
+        reconnected instead of created. Does nothing if already scanned.
+        Returns the created children.
+        Aggregates are not updated, see refresh_aggregates().
+
+        Symlinks are only followed if the VirtualFS has follow_symlinks
+        set. Then a folder already scanned at another path is left empty,
+        see VFSInodeTracker.
+        """
+        if not self.is_dir() or self.children_scanned:
+            return []
         if orphans == None:
             orphans = {}
-        current_path = self.path
-        fs_child_names = os.listdir(current_path)
+        vfs = self.vfs
+        follow_symlinks = vfs != None and vfs.follow_symlinks
+        if self.mtime == None:
+            stat_result = os.stat(self.path)
+            self.mtime = stat_result.st_mtime
+            if follow_symlinks and self.inode == None:
+                self.inode = VFSInodeTracker.inode_key(stat_result)
+        if follow_symlinks and self.inode != None and not vfs.inodes.claim_dir(self):
+            self.children_scanned = True
+            return []
+        if listing == None:
+            listing = VFSEntry.list_dir(self.path, follow_symlinks)
+        self.children_scanned = True
         children_created = []
-        for fs_child_name in fs_child_names:
-            child_path = os.path.normpath(
-                os.path.join(current_path, fs_child_name))
+        for child_path, entry_type, size, mtime, allocated, inode in listing:
             if child_path in orphans:
-                self.children.append(orphans[child_path])
-                self.connect_child(orphans[child_path])
-                orphans.pop(child_path)
+                self.connect_child(orphans.pop(child_path),
+                    update_aggregates=False)
             else:
-                children_created.append(
-                    self.__class__.from_parent(self, child_path))
-        for child in children_created:
-            if child.is_dir():
-                child.create_children()
+                child = self.__class__(child_path, entry_type, size, mtime, allocated, inode)
+                self.connect_child(child, update_aggregates=False)
+                children_created.append(child)
+        return children_created
+    
+    def iter_unscanned_folders(self):
+        """Yield folders in this subtree whose children haven't been scanned"""
+        for entry in self.walk():
+            if entry.is_dir() and not entry.children_scanned:
+                yield entry
+    
+    def create_children(self, orphans:dict=None):
+        if not self.is_dir():
+            return
+        to_scan = [self]
+        while to_scan:
+            entry = to_scan.pop()
+            for child in entry.scan_children(orphans):
+                if child.is_dir():
+                    to_scan.append(child)
+        self.refresh_aggregates()
         return
     
     def is_file(self):
@@ -193,13 +399,12 @@ class VFSEntry:
     def get_path(self):
         return self.path
     
+    def iter_all_paths(self):
+        for entry in self.walk():
+            yield entry.path
+    
     def get_all_paths(self):
-        paths = []
-        paths.append(self.path)
-        for child in self.children:
-            child_paths = child.get_all_paths()
-            paths.extend(child_paths)
-        return paths
+        return list(self.iter_all_paths())
 
     def get_children(self) -> list:
         return self.children.copy()
@@ -207,26 +412,225 @@ class VFSEntry:
     def collect_entries(self, entry_set=None) -> set:
         if not entry_set:
             entry_set = set()
-        entry_set.add(self)
-        for child in self.children:
-            child.collect_entries(entry_set)
+        entry_set.update(self.walk())
         return entry_set
 
     def get_size(self):
         return self.size
-
-    def calc_size(self):
-        if self.is_file():
-            stat_result = os.stat(self.path)
-            self.size = stat_result.st_size
-        elif self.is_dir():
+    
+    def get_allocated_size(self):
+        """Bytes allocated on disk, from st_blocks, vs. the apparent get_size()"""
+        return self.allocated_size
+    
+    def get_folder_count(self):
+        return self.folder_count
+    
+    def get_file_count(self):
+        return self.file_count
+    
+    def get_included_size(self):
+        return self.size - self.excluded_size
+    
+    def get_excluded_size(self):
+        return self.excluded_size
+    
+    def get_included_folder_count(self):
+        return self.folder_count - self.excluded_folder_count
+    
+    def get_included_file_count(self):
+        return self.file_count - self.excluded_file_count
+    
+    def get_excluded_folder_count(self):
+        return self.excluded_folder_count
+    
+    def get_excluded_file_count(self):
+        return self.excluded_file_count
+    
+    def is_excluded(self):
+        return self.excluded
+    
+    def get_status(self):
+        """'Excluded', 'Partial' for folders with excluded descendants, or ''"""
+        if self.excluded:
+            return 'Excluded'
+        if self.excluded_folder_count or self.excluded_file_count:
+            return 'Partial'
+        return ''
+    status = property(fget=get_status)
+    
+    # Aggregates
+    
+    def get_subtree_aggregates(self) -> tuple[int, int, int, int, int, int, int]:
+        """
+        (size, folder_count, file_count,
+            excluded_size, excluded_folder_count, excluded_file_count,
+            allocated_size)
+        of this entry and its descendants, i.e. what it adds to its parent
+        """
+        is_dir = self.is_dir()
+        is_file = self.is_file()
+        return (
+            self.size,
+            self.folder_count + is_dir,
+            self.file_count + is_file,
+            self.excluded_size,
+            self.excluded_folder_count + (is_dir and self.excluded),
+            self.excluded_file_count + (is_file and self.excluded),
+            self.allocated_size)
+    
+    def touch(self):
+        """Mark this entry as changed, see version"""
+        self.version += 1
+        if self.parent != None:
+            self.parent.children_version += 1
+    
+    def set_mtime(self, mtime:float|None):
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.touch()
+    
+    def _add_aggregates(self, delta:tuple):
+        """Add a delta (see get_subtree_aggregates()) to this entry and its parents"""
+        d_size, d_folders, d_files, d_exc_size, d_exc_folders, d_exc_files, d_allocated = delta
+        entry = self
+        while entry != None:
+            entry.size += d_size
+            entry.allocated_size += d_allocated
+            entry.folder_count += d_folders
+            entry.file_count += d_files
+            entry.excluded_size += d_exc_size
+            entry.excluded_folder_count += d_exc_folders
+            entry.excluded_file_count += d_exc_files
+            entry.touch()
+            entry = entry.parent
+    
+    def set_size(self, size:int, allocated:int=None):
+        """
+        Set a file's size, and allocated size if given, updating parents'
+        aggregates. Hardlinks stay at 0, another link counts the bytes.
+        """
+        self.size_known = True
+        if self.hardlink:
+            return
+        if allocated == None:
+            allocated = self.allocated_size
+        d_size = size - self.size
+        d_allocated = allocated - self.allocated_size
+        if d_size == 0 and d_allocated == 0:
+            return
+        d_exc_size = d_size if self.excluded else 0
+        self._add_aggregates((d_size, 0, 0, d_exc_size, 0, 0, d_allocated))
+    
+    def set_hardlink(self, hardlink:bool):
+        """
+        Mark this file as a link whose bytes another entry counts, or not.
+        Only for entries not yet in any aggregates, see VirtualFS._index_entries()
+        """
+        if hardlink == self.hardlink:
+            return
+        self.hardlink = hardlink
+        if hardlink:
             self.size = 0
-            for child in self.children:
-                self.size += child.calc_size()
+            self.allocated_size = 0
+        else:
+            self.size_known = False # stat'd again by calc_aggregates()
+        self.touch()
+    
+    def set_excluded(self, excluded:bool, update_aggregates=True):
+        """
+        Set whether this entry alone is excluded.
+        update_aggregates: False when setting many entries at once, then
+        call refresh_aggregates() on their common parent.
+        """
+        excluded = bool(excluded)
+        if excluded == self.excluded:
+            return
+        sign = 1 if excluded else -1
+        self.excluded = excluded
+        self.touch()
+        if not update_aggregates:
+            return
+        if self.is_dir():
+            delta = (0, 0, 0, 0, sign, 0, 0)
+            if self.parent:
+                self.parent._add_aggregates(delta)
+        else:
+            d_exc_files = sign if self.is_file() else 0
+            self._add_aggregates((0, 0, 0, sign * self.size, 0, 0, 0))
+            if self.parent and d_exc_files:
+                self.parent._add_aggregates((0, 0, 0, 0, 0, d_exc_files, 0))
+    
+    def calc_aggregates(self, restat=False):
+        """
+        Recalculate the aggregates of this entry's subtree from scratch,
+        bottom up. Parents are not updated, see refresh_aggregates().
+        Files are only stat'd if their size was not found when scanned, or
+        if restat is True. Only entries whose aggregates changed are touched.
+        """
+        stack = [(self, False)]
+        while stack:
+            entry, children_done = stack.pop()
+            if entry.is_dir():
+                if not children_done:
+                    stack.append((entry, True))
+                    stack.extend([(child, False) for child in entry.children])
+                    continue
+                before = entry.get_subtree_aggregates()
+                size = folders = files = exc_size = exc_folders = exc_files = allocated = 0
+                for child in entry.children:
+                    c_size, c_folders, c_files, c_exc_size, c_exc_folders, c_exc_files, \
+                        c_allocated = child.get_subtree_aggregates()
+                    size += c_size
+                    allocated += c_allocated
+                    folders += c_folders
+                    files += c_files
+                    exc_size += c_exc_size
+                    exc_folders += c_exc_folders
+                    exc_files += c_exc_files
+                entry.size = size
+                entry.allocated_size = allocated
+                entry.folder_count = folders
+                entry.file_count = files
+                entry.excluded_size = exc_size
+                entry.excluded_folder_count = exc_folders
+                entry.excluded_file_count = exc_files
+                if entry.get_subtree_aggregates() != before:
+                    entry.touch()
+            else:
+                before = entry.get_subtree_aggregates()
+                if entry.is_file() and (restat or not entry.size_known):
+                    stat_result = os.stat(entry.path)
+                    entry.size_known = True
+                    if not entry.hardlink:
+                        entry.size = stat_result.st_size
+                        entry.allocated_size = VFSInodeTracker.stat_to_allocated(stat_result)
+                entry.excluded_size = entry.size if entry.excluded else 0
+                if entry.get_subtree_aggregates() != before:
+                    entry.touch()
+    
+    def refresh_aggregates(self, restat=False):
+        """
+        Recalculate this subtree's aggregates, then pass the difference
+        on to the parents, e.g. after a scan
+        """
+        before = self.get_subtree_aggregates()
+        self.calc_aggregates(restat)
+        if self.parent:
+            after = self.get_subtree_aggregates()
+            self.parent._add_aggregates(
+                tuple([a - b for a, b in zip(after, before)]))
+    
+    def calc_size(self, restat=False):
+        """
+        Recalculate sizes (and other aggregates) of this subtree.
+        Files are only stat'd if their size was not found when scanned, or
+        if restat is True.
+        """
+        self.refresh_aggregates(restat)
         return self.size
     
     def calc_all(self):
         """
         Meant to be overridden with subclass-specific calculated variables
         """
-        self.calc_size()
\ No newline at end of file
+        self.calc_size()
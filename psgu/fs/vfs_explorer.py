@@ -2,43 +2,91 @@ from psgu.fs.vfs import VFS
 
 
 class VFSExplorer:
-    
-    def __init__(self, vfs, script_data):
+
+    class sort_keys:
+        NAME = 'name'
+        SIZE = 'size'
+        FILE_COUNT = 'file_count'
+        MTIME = 'mtime'
+
+    # Ties are broken by name, so orders don't depend on listing order
+    _sort_key_funcs = {
+        sort_keys.NAME: lambda e: (e.name.casefold(), e.name),
+        sort_keys.SIZE: lambda e: (-e.get_included_size(), e.name.casefold(), e.name),
+        sort_keys.FILE_COUNT: lambda e: (-e.get_included_file_count(), e.name.casefold(), e.name),
+        sort_keys.MTIME: lambda e: (-(e.mtime or 0), e.name.casefold(), e.name)
+    }
+
+    max_cached_orders = 32
+
+    def __init__(self, vfs, script_data, sort_key='size', sort_reverse=False):
+        """
+        sort_key: one of sort_keys. Sizes, counts and mtimes sort largest
+        or newest first, names A-Z. Folders always come before files.
+
+        Sorted children are cached per folder, and only sorted again when
+        the folder's children_version changes (see VFSEntry.version).
+        """
         self.current_dir_entry = None
         self.current_dir_children = []
         self.vfs:VFS = vfs
         self.script_data = script_data
+        self.sort_key = sort_key
+        self.sort_reverse = sort_reverse
+        self._sorted_cache = {} # folder -> (children_version, sorted children)
 
-    def sort_children(self):
+    def set_sort(self, sort_key, reverse=False):
+        if sort_key not in VFSExplorer._sort_key_funcs:
+            raise ValueError('Unknown sort key: {}'.format(sort_key))
+        if (sort_key, reverse) == (self.sort_key, self.sort_reverse):
+            return
+        self.sort_key = sort_key
+        self.sort_reverse = reverse
+        self._sorted_cache.clear()
+        self.refresh_current_dir()
+
+    def sort_entries(self, entries:list) -> list:
+        """Folders then files, each sorted by the current sort key"""
         folders = []
         files = []
-        for child in self.current_dir_children:
-            if child.is_dir():
-                folders.append(child)
+        for entry in entries:
+            if entry.is_dir():
+                folders.append(entry)
             else:
-                files.append(child)
-        
-        def compare_children(e):
-            return e.get_included_size()
-        
-        folders.sort(key=compare_children, reverse=True)
-        files.sort(key=compare_children, reverse=True)
-        self.current_dir_children = folders + files
-    
+                files.append(entry)
+        key = VFSExplorer._sort_key_funcs[self.sort_key]
+        folders.sort(key=key, reverse=self.sort_reverse)
+        files.sort(key=key, reverse=self.sort_reverse)
+        return folders + files
+
+    def get_sorted_children(self, entry) -> list:
+        """entry's children in display order. The list is shared, don't modify it."""
+        cached = self._sorted_cache.pop(entry, None)
+        if cached != None and cached[0] == entry.children_version:
+            sorted_children = cached[1]
+        else:
+            sorted_children = self.sort_entries(entry.get_children())
+        self._sorted_cache[entry] = (entry.children_version, sorted_children)
+        if len(self._sorted_cache) > VFSExplorer.max_cached_orders:
+            del self._sorted_cache[next(iter(self._sorted_cache))]
+        return sorted_children
+
+    def sort_children(self):
+        self.current_dir_children = self.sort_entries(self.current_dir_children)
+
     def refresh_current_dir(self):
         if self.current_dir_entry == None:
-            children = self.vfs.get_root_entries()
+            self.current_dir_children = self.sort_entries(self.vfs.get_root_entries())
         else:
-            children = self.current_dir_entry.get_children()
-        self.current_dir_children = children
-        self.sort_children()
-    
+            self.current_dir_children = self.get_sorted_children(self.current_dir_entry)
+
     # Navigation
-    
+
     def open_folder(self, path):
         folder_entry = self.vfs.find_entry(path)
         if not folder_entry.is_dir():
             return
+        self.vfs.materialize(folder_entry)
         self.current_dir_entry = folder_entry
         self.refresh_current_dir()
 
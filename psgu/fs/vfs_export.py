@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+
+
+__all__ = [
+    'VFSExport'
+]
+
+
+class VFSExport:
+
+    class formats:
+        JSONL = 'jsonl'
+        CSV = 'csv'
+
+    fields = [
+        'path', 'type', 'size', 'allocated_size', 'mtime',
+        'folder_count', 'file_count',
+        'excluded_size', 'excluded_folder_count', 'excluded_file_count',
+        'status', 'excluded', 'scanned', 'hardlink', 'inode'
+    ]
+    # CSV fields that aren't strings, read back from text
+    _csv_ints = {
+        'size', 'allocated_size', 'folder_count', 'file_count',
+        'excluded_size', 'excluded_folder_count', 'excluded_file_count', 'inode'
+    }
+    _csv_bools = {'excluded', 'scanned', 'hardlink'}
+
+    def __init__(self, format:str=formats.JSONL):
+        """
+        ---
+        Writes a VFS's trees to a text stream one record per entry, and
+        reads them back into a VirtualFS. Both directions walk the trees
+        iteratively and never hold a list of records, so exports of very
+        large trees take no more memory than the tree itself.
+
+        Records are in walk() order, each folder before its children, with
+        the fields in VFSExport.fields. size and allocated_size of folders
+        are of the whole subtree, counts are of descendants. mtime and inode
+        are empty (null) where unknown.
+
+        jsonl: one JSON object per line.
+        csv: a header row of field names, then one row per entry. Open the
+        stream with newline=''.
+        ---
+        Args:
+            format (default='jsonl'): one of VFSExport.formats.
+        """
+        if format not in (VFSExport.formats.JSONL, VFSExport.formats.CSV):
+            raise ValueError('Unknown export format: {}'.format(format))
+        self.format = format
+
+    def entry_to_record(entry) -> list:
+        return [
+            entry.path,
+            entry.entry_type,
+            entry.get_size(),
+            entry.get_allocated_size(),
+            entry.mtime,
+            entry.get_folder_count(),
+            entry.get_file_count(),
+            entry.get_excluded_size(),
+            entry.get_excluded_folder_count(),
+            entry.get_excluded_file_count(),
+            entry.get_status(),
+            entry.is_excluded(),
+            entry.children_scanned,
+            entry.hardlink,
+            entry.inode
+        ]
+
+    def iter_records(vfs):
+        for root in vfs.get_root_entries():
+            for entry in root.walk():
+                yield VFSExport.entry_to_record(entry)
+
+    # Writing
+
+    def write(self, vfs, stream) -> int:
+        """Write vfs's entries to stream. vfs may be compact. Returns the number written."""
+        count = 0
+        if self.format == VFSExport.formats.JSONL:
+            fields = VFSExport.fields
+            for record in VFSExport.iter_records(vfs):
+                stream.write(json.dumps(dict(zip(fields, record)), separators=(',', ':')))
+                stream.write('\n')
+                count += 1
+        else:
+            writer = csv.writer(stream)
+            writer.writerow(VFSExport.fields)
+            for record in VFSExport.iter_records(vfs):
+                writer.writerow(['' if v == None else int(v) if isinstance(v, bool) else v
+                    for v in record])
+                count += 1
+        return count
+
+    # Reading
+
+    def _iter_jsonl(stream):
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+    def _iter_csv(stream):
+        ints = VFSExport._csv_ints
+        bools = VFSExport._csv_bools
+        reader = csv.reader(stream)
+        header = next(reader, None)
+        if header == None:
+            return
+        for row in reader:
+            record = {}
+            for field, value in zip(header, row):
+                if field in ints:
+                    value = int(value) if value != '' else None
+                elif field in bools:
+                    value = value not in ('', '0', 'False')
+                elif field == 'mtime':
+                    value = float(value) if value != '' else None
+                record[field] = value
+            yield record
+
+    def read(self, vfs, stream) -> list:
+        """
+        Add the exported trees in stream to vfs (a VirtualFS) as roots, see
+        VirtualFS._add_loaded_root(). Returns the roots added.
+        """
+        if self.format == VFSExport.formats.JSONL:
+            records = VFSExport._iter_jsonl(stream)
+        else:
+            records = VFSExport._iter_csv(stream)
+        entry_class = vfs.entry_class
+        roots = []
+        ancestors = [] # (path key, folder) from the current root down
+        for record in records:
+            path = record['path']
+            entry = entry_class(path, record['type'], record['size'], record['mtime'],
+                record['allocated_size'], record['inode'])
+            entry.folder_count = record['folder_count']
+            entry.file_count = record['file_count']
+            entry.excluded_size = record['excluded_size']
+            entry.excluded_folder_count = record['excluded_folder_count']
+            entry.excluded_file_count = record['excluded_file_count']
+            entry.excluded = record['excluded']
+            entry.children_scanned = record['scanned']
+            entry.hardlink = record['hardlink']
+            entry.stale = entry.children_scanned
+            parent_key = os.path.normcase(os.path.dirname(entry.path))
+            while ancestors and ancestors[-1][0] != parent_key:
+                ancestors.pop()
+            if ancestors:
+                ancestors[-1][1].connect_child(entry, update_aggregates=False)
+            else:
+                roots.append(entry)
+            if entry.is_dir():
+                ancestors.append((os.path.normcase(entry.path), entry))
+        added = []
+        for root in roots:
+            if vfs._add_loaded_root(root):
+                added.append(root)
+        return added
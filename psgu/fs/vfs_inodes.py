@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import os
+import threading
+
+
+__all__ = [
+    'VFSInodeTracker'
+]
+
+
+class VFSInodeTracker:
+
+    def inode_key(stat_result:os.stat_result) -> int|None:
+        """(st_dev, st_ino) packed into one int, None where the OS gives no inode numbers"""
+        if not stat_result.st_ino:
+            return None
+        return (stat_result.st_dev << 64) | stat_result.st_ino
+
+    def stat_to_allocated(stat_result:os.stat_result) -> int:
+        """Bytes allocated on disk, or st_size where st_blocks isn't available"""
+        blocks = getattr(stat_result, 'st_blocks', None)
+        if blocks == None:
+            return stat_result.st_size
+        return blocks * 512
+
+    def __init__(self):
+        """
+        ---
+        Tracks the (st_dev, st_ino) of a VirtualFS's entries, packed into
+        single ints, where one file or folder can appear at several paths:
+
+        Hardlinked files (st_nlink > 1), and all files when symlinks are
+        followed: the first entry indexed counts the bytes, later links are
+        marked VFSEntry.hardlink and count 0. When the counting entry is
+        removed, the next link takes over.
+
+        Folders, only when symlinks are followed: a folder already scanned
+        at another path isn't scanned again, so symlink loops end.
+
+        Other entries have no inode key and aren't tracked. Thread safe,
+        scanner threads claim folders.
+        ---
+        """
+        self._lock = threading.Lock()
+        self._dirs:dict[int, object] = {} # key -> entry that scanned the folder
+        self._owners:dict[int, object] = {} # key -> entry counting the bytes
+        self._links:dict[int, list] = {} # key -> other entries of the file
+
+    def __len__(self):
+        return len(self._dirs) + len(self._owners)
+
+    def claim_dir(self, entry) -> bool:
+        """False if the folder was already claimed by another entry"""
+        with self._lock:
+            owner = self._dirs.setdefault(entry.inode, entry)
+        return owner is entry
+
+    def release_dir(self, entry):
+        with self._lock:
+            if self._dirs.get(entry.inode) is entry:
+                del self._dirs[entry.inode]
+
+    def add_file(self, entry) -> bool:
+        """
+        Register a hardlinked file. True if entry counts the bytes, False if
+        another entry already does, or entry is already marked a hardlink.
+        """
+        key = entry.inode
+        with self._lock:
+            if not entry.hardlink and key not in self._owners:
+                self._owners[key] = entry
+                return True
+            self._links.setdefault(key, []).append(entry)
+            return False
+
+    def remove_file(self, entry):
+        """Unregister a file. Returns the link that counts the bytes now, if it changed."""
+        key = entry.inode
+        with self._lock:
+            links = self._links.get(key)
+            if self._owners.get(key) is entry:
+                del self._owners[key]
+                if not links:
+                    return None
+                promoted = links.pop(0)
+                if not links:
+                    del self._links[key]
+                self._owners[key] = promoted
+                return promoted
+            if links != None and entry in links:
+                links.remove(entry)
+                if not links:
+                    del self._links[key]
+            return None
+
+    def settle_files(self, entries:list) -> list[tuple]:
+        """
+        Reorder the links of files in entries so the first of them, in the
+        order given, counts the bytes. Only where the entry counting them
+        now is in entries too, i.e. is also not yet in any aggregates.
+        Returns (new counting entry, old counting entry) pairs.
+        """
+        fresh = set(map(id, entries))
+        by_key:dict[int, list] = {}
+        for entry in entries:
+            by_key.setdefault(entry.inode, []).append(entry)
+        swaps = []
+        with self._lock:
+            for key, key_entries in by_key.items():
+                owner = self._owners.get(key)
+                if owner == None or id(owner) not in fresh:
+                    continue
+                links = [e for e in self._links.get(key, []) if id(e) not in fresh]
+                links.extend(key_entries[1:])
+                if links:
+                    self._links[key] = links
+                if key_entries[0] is not owner:
+                    self._owners[key] = key_entries[0]
+                    swaps.append((key_entries[0], owner))
+        return swaps
+
+    def clear(self):
+        with self._lock:
+            self._dirs.clear()
+            self._owners.clear()
+            self._links.clear()
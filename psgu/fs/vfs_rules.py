@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import weakref
+
+
+__all__ = [
+    'VFSRule',
+    'VFSRuleSet'
+]
+
+
+_case_insensitive = os.path.normcase('A') == 'a'
+
+
+class VFSRule:
+
+    class actions:
+        INCLUDE = 'include'
+        EXCLUDE = 'exclude'
+
+    def __init__(self,
+            action='exclude',
+            glob:str=None,
+            regex:str=None,
+            min_size:int=None,
+            max_size:int=None,
+            min_mtime:float=None,
+            max_mtime:float=None,
+            entry_type:str=None,
+            match_path=False):
+        """
+        ---
+        One include or exclude rule. An entry matches if it matches every
+        predicate given. A rule with no predicates matches everything.
+        ---
+        Args:
+            action (default='exclude'): 'include' or 'exclude'.
+            glob (default=None): fnmatch pattern for the name.
+            regex (default=None): re.search pattern for the name.
+            min_size, max_size (default=None): bytes, inclusive. Folders
+                use their total size.
+            min_mtime, max_mtime (default=None): timestamps, inclusive.
+            entry_type (default=None): VFSEntry.entry_types.DIR or FILE.
+            match_path (default=False): match glob and regex against the
+                full path instead of the name.
+        """
+        if action not in (VFSRule.actions.INCLUDE, VFSRule.actions.EXCLUDE):
+            raise ValueError('Unknown rule action: {}'.format(action))
+        self.action = action
+        self.glob = glob
+        self.regex = regex
+        self.min_size = min_size
+        self.max_size = max_size
+        self.min_mtime = min_mtime
+        self.max_mtime = max_mtime
+        self.entry_type = entry_type
+        self.match_path = match_path
+        flags = re.IGNORECASE if _case_insensitive else 0
+        self._glob_re = re.compile(fnmatch.translate(glob), flags) if glob != None else None
+        self._regex_re = re.compile(regex, flags) if regex != None else None
+
+    def is_name_only(self):
+        """True if only the name decides a match, see VFSRuleSet"""
+        return (not self.match_path
+            and self.min_size == None and self.max_size == None
+            and self.min_mtime == None and self.max_mtime == None
+            and self.entry_type == None)
+
+    def can_combine(self) -> bool:
+        """
+        True if the name pattern can go in a combined regex. Groups would
+        be renumbered there, breaking backreferences like (a)\1.
+        """
+        return self.is_name_only() and (self._regex_re == None or self._regex_re.groups == 0)
+
+    def get_name_pattern(self) -> str:
+        """One regex, matched from the start of the name, for glob and regex"""
+        parts = []
+        if self.glob != None:
+            parts.append('(?={})'.format(fnmatch.translate(self.glob)))
+        if self.regex != None:
+            parts.append('(?=.*?(?:{}))'.format(self.regex))
+        if not parts:
+            return ''
+        return ''.join(parts)
+
+    def matches(self, entry) -> bool:
+        if self.entry_type != None and entry.entry_type != self.entry_type:
+            return False
+        if self._glob_re != None or self._regex_re != None:
+            s = entry.path if self.match_path else entry.name
+            if self._glob_re != None and not self._glob_re.match(s):
+                return False
+            if self._regex_re != None and not self._regex_re.search(s):
+                return False
+        if self.min_size != None or self.max_size != None:
+            size = entry.get_size()
+            if self.min_size != None and size < self.min_size:
+                return False
+            if self.max_size != None and size > self.max_size:
+                return False
+        if self.min_mtime != None or self.max_mtime != None:
+            mtime = entry.mtime
+            if mtime == None:
+                return False
+            if self.min_mtime != None and mtime < self.min_mtime:
+                return False
+            if self.max_mtime != None and mtime > self.max_mtime:
+                return False
+        return True
+
+
+class VFSRuleSet:
+
+    bulk_threshold = 1000
+
+    def __init__(self, rules:list[VFSRule]=None, default='include'):
+        """
+        ---
+        An ordered list of VFSRules, compiled into one matcher. The last
+        rule matching an entry decides it, default if none do.
+
+        Rules that only look at names are combined into a single regex,
+        ordered so its first matching alternative is the last matching
+        rule. Only the other rules after that one are then checked. Regexes
+        with groups are checked on their own.
+
+        apply() sets entries' excluded flags from the rules. An excluded
+        folder's whole subtree is excluded without being checked. Each
+        folder's children are only checked again if the rules, the folder
+        or its children (see VFSEntry.children_version) have changed since,
+        and a folder's subtree is skipped if the folder's version hasn't
+        changed either, as entries added, removed or resized below it change
+        its aggregates. mtime changes don't reach parents, so subtrees are
+        never skipped while a rule checks mtimes.
+        Folders of a CompactVirtualFS aren't cached, their views all share
+        one version.
+        ---
+        Args:
+            rules (default=None): VFSRules, lowest priority first.
+            default (default='include'): action when no rule matches.
+        """
+        self.rules:list[VFSRule] = list(rules) if rules != None else []
+        self.default = default
+        self.version = 0
+        self._folder_cache = weakref.WeakKeyDictionary()
+        self._compile()
+
+    # Rules
+
+    def add_rule(self, rule:VFSRule):
+        self.rules.append(rule)
+        self._changed()
+
+    def remove_rule(self, rule:VFSRule):
+        self.rules.remove(rule)
+        self._changed()
+
+    def clear(self):
+        self.rules.clear()
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        self._folder_cache = weakref.WeakKeyDictionary()
+        self._compile()
+
+    def _compile(self):
+        self._name_re = None
+        name_patterns = []
+        self._other_rules = []
+        for i, rule in enumerate(self.rules):
+            if rule.can_combine():
+                name_patterns.append((i, rule.get_name_pattern()))
+            else:
+                self._other_rules.append((i, rule))
+        self._other_rules.reverse()
+        self._skip_subtrees = not any([
+            rule.min_mtime != None or rule.max_mtime != None for rule in self.rules])
+        if name_patterns:
+            flags = re.DOTALL | (re.IGNORECASE if _case_insensitive else 0)
+            pattern = '|'.join(['(?P<r{}>{})'.format(i, p) for i, p in reversed(name_patterns)])
+            try:
+                self._name_re = re.compile(pattern, flags)
+            except re.error:
+                # e.g. clashing group names, check these rules one by one
+                self._other_rules = sorted(
+                    [(i, rule) for i, rule in enumerate(self.rules)],
+                    key=lambda t: t[0], reverse=True)
+
+    # Matching
+
+    def get_action(self, entry) -> str:
+        best = -1
+        if self._name_re != None:
+            m = self._name_re.match(entry.name)
+            if m != None:
+                best = int(m.lastgroup[1:])
+        for i, rule in self._other_rules:
+            if i <= best:
+                break
+            if rule.matches(entry):
+                best = i
+                break
+        if best == -1:
+            return self.default
+        return self.rules[best].action
+
+    def is_excluded(self, entry) -> bool:
+        return self.get_action(entry) == VFSRule.actions.EXCLUDE
+
+    # Applying
+
+    def apply(self, entry) -> int:
+        """
+        Set excluded flags in entry's subtree from the rules, updating
+        aggregates. Returns how many entries changed.
+        """
+        parent = entry.parent
+        in_excluded = parent != None and parent.is_excluded()
+        changes = []
+        decided = {} # folder -> excluded after apply
+        excluded = in_excluded or self.is_excluded(entry)
+        if excluded != entry.is_excluded():
+            changes.append((entry, excluded))
+        visited = []
+        if entry.is_dir():
+            decided[entry] = excluded
+            stack = [entry]
+        else:
+            stack = []
+        # compact views are made on demand and all share the compact VFS's
+        # version, so there's nothing to cache for them
+        cache = self._folder_cache if getattr(entry, 'cache_rules', True) else None
+        while stack:
+            folder = stack.pop()
+            folder_excluded = decided.pop(folder)
+            # (version, children_version, excluded)
+            cached = cache.get(folder) if cache != None else None
+            if self._skip_subtrees \
+                    and cached == (folder.version, folder.children_version, folder_excluded):
+                continue
+            visited.append((folder, folder_excluded))
+            up_to_date = cached != None \
+                and cached[1:] == (folder.children_version, folder_excluded)
+            for child in folder.get_children():
+                if up_to_date:
+                    child_excluded = child.is_excluded()
+                else:
+                    child_excluded = folder_excluded or self.is_excluded(child)
+                    if child_excluded != child.is_excluded():
+                        changes.append((child, child_excluded))
+                if child.is_dir():
+                    decided[child] = child_excluded
+                    stack.append(child)
+        if len(changes) > VFSRuleSet.bulk_threshold:
+            # entry's own flag counts in its parent's aggregates, which
+            # refresh_aggregates() only passes the subtree's difference to
+            for changed, excluded in changes:
+                changed.set_excluded(excluded, update_aggregates=changed is entry)
+            entry.refresh_aggregates()
+        else:
+            for changed, excluded in changes:
+                changed.set_excluded(excluded)
+        if cache != None:
+            for folder, folder_excluded in visited:
+                cache[folder] = (folder.version, folder.children_version, folder_excluded)
+        return len(changes)
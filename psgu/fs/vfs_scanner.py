@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator
+
+from psgu.data import units as unit
+from psgu.fs.vfs_entry import VFSEntry
+
+
+__all__ = [
+    'CancelToken',
+    'ScanProgress',
+    'VFSScanner'
+]
+
+
+class CancelToken:
+    """Set from any thread to stop a scan after the folders being listed"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+
+class ScanProgress:
+
+    def __init__(self):
+        self.dirs_visited = 0
+        self.dirs_queued = 0
+        self.files_seen = 0
+        self.bytes_total = 0
+        self.errors = 0 # folders that couldn't be listed
+        self.current_path = ''
+        self.done = False
+        self.cancelled = False
+        self._fraction = 0.0
+
+    def get_fraction(self) -> float:
+        """
+        Rough fraction done, from folders visited vs known about. Never goes
+        down, but jumps as big folders are found.
+        """
+        if self.done:
+            return 1.0
+        known = self.dirs_visited + self.dirs_queued
+        if known:
+            self._fraction = max(self._fraction, self.dirs_visited / known)
+        return self._fraction
+
+    def to_string(self) -> str:
+        size_best = unit.Bytes(self.bytes_total, degree_name=unit.Bytes.BYTE).get_best()
+        s = '{} folders, {} files, {}'.format(
+            self.dirs_visited, self.files_seen, size_best)
+        if self.errors:
+            s += ', {} unreadable'.format(self.errors)
+        if self.cancelled:
+            return s + ' (cancelled)'
+        if self.done:
+            return s
+        return s + ': ' + self.current_path
+
+
+class VFSScanner:
+
+    def __init__(self, workers=1):
+        """
+        ---
+        Builds VFSEntry trees from the filesystem.
+
+        With workers > 1, sibling folders are listed concurrently on a
+        thread pool (os.scandir releases the GIL while it waits on the
+        filesystem). Each folder's children are created by the single task
+        that listed it, in listing order, so the tree comes out the same as
+        a serial scan no matter which task finishes first.
+
+        Folders that can't be listed, e.g. for lack of permission, are left
+        empty and their errors kept in self.errors, so one unreadable folder
+        doesn't stop the scan.
+
+        Aggregates are not calculated, call refresh_aggregates() on the
+        scanned entry afterwards.
+        ---
+        Args:
+            workers (default=1): max threads listing folders at once.
+                1 scans serially on the calling thread.
+        """
+        self.workers = workers if workers > 0 else 1
+        self.errors:list[OSError] = [] # of the last scan, see _skip_folder()
+
+    def scan(self, entry:VFSEntry, orphans:dict=None):
+        """Create entry's children, recursing into all created folders"""
+        for _ in self._iter_listed(entry, orphans):
+            pass
+
+    def iter_scan(self,
+            entry:VFSEntry,
+            orphans:dict=None,
+            cancel_token:CancelToken=None,
+            interval=0.1) -> Iterator[ScanProgress]:
+        """
+        scan() as a generator. Yields a ScanProgress at most every interval
+        seconds, and once more when done or cancelled. The same ScanProgress
+        is updated and yielded each time.
+
+        Folders are listed as the generator is advanced, so a serial scan
+        pauses between yields. A cancelled scan leaves a partial tree.
+        """
+        progress = ScanProgress()
+        next_report = time.monotonic() + interval
+        for folder, children, queued in self._iter_listed(entry, orphans, cancel_token):
+            progress.dirs_visited += 1
+            progress.dirs_queued = queued
+            progress.errors = len(self.errors)
+            progress.current_path = folder.path
+            for child in children:
+                if child.is_file():
+                    progress.files_seen += 1
+                    progress.bytes_total += child.size
+            now = time.monotonic()
+            if now >= next_report:
+                next_report = now + interval
+                yield progress
+        progress.cancelled = cancel_token != None and cancel_token.is_cancelled()
+        progress.done = True
+        yield progress
+
+    def _iter_listed(self, entry:VFSEntry, orphans:dict=None, cancel_token:CancelToken=None):
+        """Yield (folder, created children, folders queued) as each folder is listed"""
+        self.errors = []
+        if not entry.is_dir():
+            return
+        if self.workers == 1:
+            yield from self._iter_serial(entry, orphans, cancel_token)
+        else:
+            yield from self._iter_parallel(entry, orphans, cancel_token)
+
+    def _iter_serial(self, entry:VFSEntry, orphans:dict=None, cancel_token:CancelToken=None):
+        to_scan = [entry]
+        while to_scan:
+            if cancel_token != None and cancel_token.is_cancelled():
+                return
+            dir_entry = to_scan.pop()
+            try:
+                children = dir_entry.scan_children(orphans)
+            except OSError as e:
+                children = self._skip_folder(dir_entry, e)
+            for child in children:
+                if child.is_dir():
+                    to_scan.append(child)
+            yield dir_entry, children, len(to_scan)
+
+    def _iter_parallel(self, entry:VFSEntry, orphans:dict=None, cancel_token:CancelToken=None):
+        max_in_flight = self.workers * 2
+        to_scan = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = {executor.submit(entry.scan_children, orphans): entry}
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_entry = in_flight.pop(future)
+                    try:
+                        children = future.result()
+                    except OSError as e:
+                        children = self._skip_folder(dir_entry, e)
+                    for child in children:
+                        if child.is_dir():
+                            to_scan.append(child)
+                    yield dir_entry, children, len(to_scan) + len(in_flight)
+                if cancel_token != None and cancel_token.is_cancelled():
+                    to_scan.clear()
+                while to_scan and len(in_flight) < max_in_flight:
+                    dir_entry = to_scan.popleft()
+                    in_flight[executor.submit(dir_entry.scan_children, orphans)] = dir_entry
+
+    def _skip_folder(self, folder:VFSEntry, error:OSError) -> list:
+        """Leave a folder that couldn't be listed empty, keeping the error"""
+        folder.children_scanned = True
+        self.errors.append(error)
+        return []
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+
+__all__ = [
+    'VFSNameQuery',
+    'VFSNameIndex'
+]
+
+
+def _trigrams(s:str) -> set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class VFSNameQuery:
+
+    _glob_chars = re.compile(r'\*|\?|\[[^\]]*\]')
+
+    def __init__(self, query:str):
+        """
+        ---
+        A compiled, case-insensitive name search.
+
+        Plain text matches names containing it. Text with *, ? or [...] is
+        a glob matched against whole names. Either may include path
+        separators, e.g. 'src/main', to also match the end of the path
+        leading up to the name.
+        ---
+        Args:
+            query: the search text.
+        """
+        self.query = query
+        q = query.casefold().replace('/', os.sep)
+        self.is_glob = VFSNameQuery._glob_chars.search(q) != None
+        self.has_path = os.sep in q.strip(os.sep)
+        q = q.strip(os.sep) if not self.has_path else q
+        self.text = q
+        name_part = q.rsplit(os.sep, 1)[-1]
+        if self.is_glob:
+            self._name_re = re.compile(fnmatch.translate(name_part), re.DOTALL)
+            self._path_re = re.compile(
+                fnmatch.translate('*' + os.sep + q.lstrip(os.sep)), re.DOTALL) \
+                if self.has_path else None
+            literals = VFSNameQuery._glob_chars.split(name_part)
+            self.literal = max(literals, key=len)
+        else:
+            self.name_part = name_part
+            self.literal = name_part
+
+    def matches_name(self, name_cf:str) -> bool:
+        """Match against a casefolded name only"""
+        if self.is_glob:
+            return self._name_re.match(name_cf) != None
+        return self.name_part in name_cf
+
+    def matches(self, entry) -> bool:
+        if not self.matches_name(entry.name.casefold()):
+            return False
+        if not self.has_path:
+            return True
+        path = entry.path.casefold()
+        if self.is_glob:
+            return self._path_re.match(path) != None
+        # the match must end inside the name, not only in a parent folder
+        i = path.rfind(self.text)
+        return i != -1 and i + len(self.text) > len(path) - len(entry.name)
+
+    def iter_matches(self, entries:Iterable) -> Iterator:
+        """Linear search, for entries without a VFSNameIndex"""
+        for entry in entries:
+            if self.matches(entry):
+                yield entry
+
+
+class VFSNameIndex:
+
+    def __init__(self):
+        """
+        ---
+        Trigram index over entry names, kept up to date by VirtualFS as
+        entries are indexed and unindexed.
+
+        Entries are grouped by casefolded name, and each trigram maps to
+        the names containing it. A query only checks the names under the
+        rarest trigram of its longest literal, so searching millions of
+        entries only looks at a few names. Queries with no literal of 3 or
+        more characters check every distinct name.
+
+        Thread safe, parallel scanner threads add entries. Searches don't
+        hold the lock while yielding results.
+        ---
+        """
+        self._lock = threading.Lock()
+        self._entries_by_name:dict[str, set] = {}
+        self._names_by_trigram:defaultdict[str, set[str]] = defaultdict(set)
+
+    def __len__(self):
+        with self._lock:
+            return sum([len(entries) for entries in self._entries_by_name.values()])
+
+    def add(self, entry):
+        name = entry.name.casefold()
+        with self._lock:
+            entries = self._entries_by_name.get(name)
+            if entries == None:
+                entries = self._entries_by_name[name] = set()
+                names_by_trigram = self._names_by_trigram
+                for i in range(len(name) - 2):
+                    names_by_trigram[name[i:i + 3]].add(name)
+            entries.add(entry)
+
+    def remove(self, entry):
+        name = entry.name.casefold()
+        with self._lock:
+            entries = self._entries_by_name.get(name)
+            if entries == None:
+                return
+            entries.discard(entry)
+            if entries:
+                return
+            del self._entries_by_name[name]
+            for trigram in _trigrams(name):
+                names = self._names_by_trigram.get(trigram)
+                if names == None:
+                    continue
+                names.discard(name)
+                if not names:
+                    del self._names_by_trigram[trigram]
+
+    def clear(self):
+        with self._lock:
+            self._entries_by_name.clear()
+            self._names_by_trigram.clear()
+
+    def _get_candidate_names(self, query:VFSNameQuery) -> list[str]:
+        trigrams = _trigrams(query.literal)
+        with self._lock:
+            if not trigrams:
+                return list(self._entries_by_name)
+            rarest = None
+            for trigram in trigrams:
+                names = self._names_by_trigram.get(trigram)
+                if names == None:
+                    return []
+                if rarest == None or len(names) < len(rarest):
+                    rarest = names
+            return list(rarest)
+
+    def _get_entries(self, name:str) -> list:
+        with self._lock:
+            entries = self._entries_by_name.get(name)
+            return list(entries) if entries != None else []
+
+    def search(self, query:str|VFSNameQuery) -> Iterator:
+        """
+        Yield matching entries as they're found, so results can be shown
+        before the search finishes. See VFSNameQuery for query syntax.
+        """
+        if not isinstance(query, VFSNameQuery):
+            query = VFSNameQuery(query)
+        for name in self._get_candidate_names(query):
+            if not query.matches_name(name):
+                continue
+            entries = self._get_entries(name)
+            if not query.has_path:
+                yield from entries
+                continue
+            for entry in entries:
+                if query.matches(entry):
+                    yield entry
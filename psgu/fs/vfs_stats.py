@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+
+from psgu.data import units as unit
+
+
+__all__ = [
+    'VFSSizeHistogram'
+]
+
+
+class VFSSizeHistogram:
+
+    default_buckets = [0, 4 << 10, 64 << 10, 1 << 20, 16 << 20, 256 << 20, 1 << 30, 16 << 30]
+
+    def __init__(self, buckets:list[int]=None):
+        """
+        ---
+        File counts and total bytes by size range, filled in one pass with
+        add(), see VirtualFS.size_histogram().
+        ---
+        Args:
+            buckets (default=None): ascending lower bounds in bytes, the last
+                bucket has no upper bound. Defaults to default_buckets.
+        """
+        if buckets == None:
+            buckets = VFSSizeHistogram.default_buckets
+        self.buckets = sorted(buckets)
+        if not self.buckets or self.buckets[0] > 0:
+            self.buckets.insert(0, 0)
+        self.counts = [0] * len(self.buckets)
+        self.totals = [0] * len(self.buckets)
+
+    def add(self, size:int):
+        i = bisect_right(self.buckets, size) - 1
+        self.counts[i] += 1
+        self.totals[i] += size
+
+    def get_count(self):
+        return sum(self.counts)
+
+    def get_total(self):
+        return sum(self.totals)
+
+    def get_rows(self) -> list[tuple[int, int|None, int, int]]:
+        """(low, high or None, file count, total bytes) of each bucket, low <= size < high"""
+        highs = self.buckets[1:] + [None]
+        return list(zip(self.buckets, highs, self.counts, self.totals))
+
+    def to_string(self) -> str:
+        lines = []
+        total = self.get_total()
+        for low, high, count, bucket_total in self.get_rows():
+            low_s = unit.Bytes(low, unit.Bytes.B).get_best()
+            if high == None:
+                range_s = '>= ' + low_s
+            else:
+                range_s = low_s + ' - ' + unit.Bytes(high, unit.Bytes.B).get_best()
+            percent = 100 * bucket_total / total if total else 0
+            lines.append('{:>20}  {:>9} files  {:>10}  {:>5.1f}%'.format(
+                range_s, count, unit.Bytes(bucket_total, unit.Bytes.B).get_best(), percent))
+        return '\n'.join(lines)
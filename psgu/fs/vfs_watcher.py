@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable
+
+from psgu.fs.vfs import VirtualFS
+
+
+__all__ = [
+    'VFSWatcher'
+]
+
+
+class _Inotify:
+    """Minimal inotify binding through ctypes"""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    watch_mask = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+        | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+    event_header = struct.Struct('iIII') # wd, mask, cookie, len
+
+    def is_available():
+        if not sys.platform.startswith('linux'):
+            return False
+        libc_name = ctypes.util.find_library('c')
+        try:
+            libc = ctypes.CDLL(libc_name, use_errno=True)
+        except OSError:
+            return False
+        return hasattr(libc, 'inotify_init1')
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self.libc.inotify_init1(_Inotify.IN_NONBLOCK | _Inotify.IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+
+    def add_watch(self, path) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), _Inotify.watch_mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> list[tuple[int, int, str]]:
+        """(wd, mask, name) of each waiting event"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        header = _Inotify.event_header
+        i = 0
+        while i + header.size <= len(data):
+            wd, mask, _, name_len = header.unpack_from(data, i)
+            i += header.size
+            name = os.fsdecode(data[i:i + name_len].rstrip(b'\0'))
+            i += name_len
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class VFSWatcher:
+
+    def __init__(self,
+            vfs:VirtualFS,
+            on_changes:Callable[[list[str]], None],
+            debounce=0.5,
+            max_delay=5.0,
+            poll_interval=2.0,
+            max_watches=8192,
+            use_inotify=True):
+        """
+        ---
+        Watches a VirtualFS's scanned folders for changes on a background
+        thread, and reports the changed paths in batches. Nothing in the VFS
+        is touched from the thread: call update_watches() after the VFS
+        changes, with the folders that changed, and pass reported paths to
+        VirtualFS.apply_changes() on the thread that owns it.
+
+        Uses inotify on Linux. Folders beyond max_watches, or beyond the
+        system's inotify limit, and all folders elsewhere, are polled for
+        mtime changes instead.
+
+        For a window, report through window.write_event_value() and stop()
+        the watcher when the window closes, see VFSExplorerView.
+        ---
+        Args:
+            vfs: the VirtualFS to watch.
+            on_changes: on_changes(paths), called on the watcher thread.
+            debounce (default=0.5): seconds without changes before a batch
+                is reported.
+            max_delay (default=5.0): seconds a batch waits at most while
+                changes keep coming.
+            poll_interval (default=2.0): seconds between polls.
+            max_watches (default=8192): max inotify watches used.
+            use_inotify (default=True): False to always poll.
+        """
+        self.vfs = vfs
+        self.on_changes = on_changes
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.max_watches = max_watches
+        self.use_inotify = use_inotify and _Inotify.is_available()
+
+        self._lock = threading.Lock()
+        # (path under which to replace the watches or None for all, folders
+        # to watch there) from update_watches(), in order
+        self._wanted:list[tuple[str|None, dict[str, float|None]]] = []
+        self._root_paths:list[str] = []
+        self._thread:threading.Thread|None = None
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event() # wakes the thread when polling only
+        self._wake_r = self._wake_w = None # wakes the thread when using inotify
+
+        # owned by the watcher thread
+        self._inotify:_Inotify|None = None
+        self._wd_to_path:dict[int, str] = {}
+        self._path_to_wd:dict[str, int] = {}
+        self._polled:dict[str, float|None] = {}
+        self._next_poll = 0.0
+        self._pending:set[str] = set()
+        self._first_pending = 0.0
+        self._last_pending = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def is_running(self):
+        return self._thread != None and self._thread.is_alive() and not self._stopping.is_set()
+
+    def start(self):
+        if self.is_running():
+            return
+        if self._thread != None:
+            self._thread.join() # still stopping, see stop()
+            self._thread = None
+        self._stopping.clear()
+        if self.use_inotify:
+            self._inotify = _Inotify()
+            self._wake_r, self._wake_w = os.pipe()
+        self.update_watches()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the thread. No more batches are reported. The thread releases
+        its watches as it exits, which may be after this returns if timeout
+        runs out first.
+        """
+        if self._thread == None:
+            return
+        self._stopping.set()
+        self._wake()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._thread = None
+
+    def update_watches(self, entries:list=None, removed_paths:list=None):
+        """
+        Watch the VFS's scanned folders as they are now. Call from the VFS's
+        thread. With entries or removed_paths, only those parts of the VFS
+        are walked again: the subtrees of entries, e.g. folders just listed,
+        synced or added, and nothing at paths just removed from the VFS.
+        """
+        if entries == None and removed_paths == None:
+            updates = [(None, self._get_scanned_folders(self.vfs.get_root_entries()))]
+        else:
+            updates = [(path, {}) for path in removed_paths or []]
+            for entry in entries or []:
+                if entry.vfs is self.vfs and entry.is_dir():
+                    updates.append((entry.path, self._get_scanned_folders([entry])))
+        with self._lock:
+            if updates and updates[0][0] == None:
+                self._wanted = updates
+            else:
+                self._wanted.extend(updates)
+            self._root_paths = [root.path for root in self.vfs.get_root_entries()]
+        self._wake()
+
+    def _get_scanned_folders(self, roots) -> dict[str, float|None]:
+        folders = {}
+        for root in roots:
+            for entry in root.walk():
+                if entry.is_dir() and entry.children_scanned:
+                    folders[entry.path] = entry.mtime
+        return folders
+
+    def _wake(self):
+        self._wakeup.set()
+        with self._lock: # not closed meanwhile, see _release()
+            if self._wake_w != None:
+                try:
+                    os.write(self._wake_w, b'\0')
+                except OSError:
+                    pass
+
+    # Watcher thread
+
+    def _run(self):
+        try:
+            self._watch_loop()
+        finally:
+            self._release()
+
+    def _release(self):
+        """Close the inotify instance and wake pipe, and forget all watches"""
+        with self._lock:
+            wake_r, wake_w = self._wake_r, self._wake_w
+            self._wake_r = self._wake_w = None
+        if self._inotify != None:
+            self._inotify.close()
+            self._inotify = None
+            os.close(wake_r)
+            os.close(wake_w)
+        self._wd_to_path.clear()
+        self._path_to_wd.clear()
+        self._polled.clear()
+        self._pending.clear()
+
+    def _watch_loop(self):
+        while not self._stopping.is_set():
+            self._apply_wanted()
+            now = time.monotonic()
+            timeout = self._get_timeout(now)
+            if self._inotify != None:
+                ready, _, _ = select.select([self._inotify.fd, self._wake_r], [], [], timeout)
+                if self._wake_r in ready:
+                    os.read(self._wake_r, 1024)
+                if self._inotify.fd in ready:
+                    self._read_inotify()
+            else:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            now = time.monotonic()
+            if self._polled and now >= self._next_poll:
+                self._poll()
+                self._next_poll = now + self.poll_interval
+            self._flush_if_due(time.monotonic())
+
+    def _get_timeout(self, now) -> float|None:
+        timeouts = []
+        if self._pending:
+            timeouts.append(min(
+                self._last_pending + self.debounce,
+                self._first_pending + self.max_delay) - now)
+        if self._polled:
+            timeouts.append(self._next_poll - now)
+        if not timeouts:
+            return None
+        return max(0, min(timeouts))
+
+    def _apply_wanted(self):
+        with self._lock:
+            updates = self._wanted
+            self._wanted = []
+        for under_path, wanted in updates:
+            self._unwatch(under_path, wanted)
+            self._watch(wanted)
+
+    def _is_under(path, under_path) -> bool:
+        if path == under_path:
+            return True
+        prefix = under_path if under_path.endswith(os.sep) else under_path + os.sep
+        return path.startswith(prefix)
+
+    def _unwatch(self, under_path:str|None, wanted:dict):
+        """Stop watching folders at or under under_path (all if None) not in wanted"""
+        for path in list(self._path_to_wd):
+            if path in wanted:
+                continue
+            if under_path == None or VFSWatcher._is_under(path, under_path):
+                wd = self._path_to_wd.pop(path)
+                del self._wd_to_path[wd]
+                self._inotify.rm_watch(wd)
+        for path in list(self._polled):
+            if path in wanted:
+                continue
+            if under_path == None or VFSWatcher._is_under(path, under_path):
+                del self._polled[path]
+
+    def _watch(self, wanted:dict):
+        for path, mtime in wanted.items():
+            if path in self._path_to_wd or path in self._polled:
+                continue
+            if self._inotify != None and len(self._path_to_wd) < self.max_watches:
+                try:
+                    wd = self._inotify.add_watch(path)
+                except OSError as e:
+                    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                        self._add_pending(path)
+                        continue
+                    # e.g. ENOSPC, the system's watch limit
+                    self._polled[path] = mtime
+                    continue
+                self._wd_to_path[wd] = path
+                self._path_to_wd[path] = wd
+            else:
+                self._polled[path] = mtime
+
+    def _read_inotify(self):
+        for wd, mask, name in self._inotify.read_events():
+            if mask & _Inotify.IN_Q_OVERFLOW:
+                with self._lock:
+                    root_paths = list(self._root_paths)
+                for path in root_paths:
+                    self._add_pending(path)
+                continue
+            path = self._wd_to_path.get(wd)
+            if path == None:
+                continue
+            if mask & _Inotify.IN_IGNORED:
+                del self._wd_to_path[wd]
+                del self._path_to_wd[path]
+                continue
+            self._add_pending(os.path.join(path, name) if name else path)
+
+    def _poll(self):
+        for path, mtime in list(self._polled.items()):
+            try:
+                new_mtime = os.stat(path).st_mtime
+            except OSError:
+                del self._polled[path]
+                self._add_pending(path)
+                continue
+            if mtime == None:
+                self._polled[path] = new_mtime
+            elif new_mtime != mtime:
+                self._polled[path] = new_mtime
+                self._add_pending(path)
+
+    def _add_pending(self, path):
+        now = time.monotonic()
+        if not self._pending:
+            self._first_pending = now
+        self._last_pending = now
+        self._pending.add(path)
+
+    def _flush_if_due(self, now):
+        if not self._pending:
+            return
+        if now < self._last_pending + self.debounce \
+                and now < self._first_pending + self.max_delay:
+            return
+        paths = sorted(self._pending)
+        self._pending.clear()
+        self.on_changes(paths)
@@ -1,11 +1,19 @@
 import os
+import stat
+import threading
+import time
 
 import PySimpleGUI as sg
 
 from psgu.text import utils as text_utils
 from psgu.data import units as unit
 from psgu.fs.vfs import VFS
+from psgu.fs.vfs_entry import VFSEntry
+from psgu.fs.vfs_diff import VFSDiffEntry
+from psgu.fs.vfs_dupes import VFSDupeFinder
 from psgu.fs.vfs_explorer import VFSExplorer
+from psgu.fs.vfs_scanner import CancelToken
+from psgu.fs.vfs_watcher import VFSWatcher
 from psgu.gui_element import *
 from psgu.popup import popups
 from psgu.sg import wrapped as sg_wrapped
@@ -14,6 +22,7 @@ from psgu import g as psgu_g
 from psgu import ge as psgu_el
 from psgu import sg as psgu_sg
 from psgu.event_context import EventContext
+from psgu.window import ProgressWindow
 
 
 __all__ = ['VFSExplorerView']
@@ -21,14 +30,73 @@ __all__ = ['VFSExplorerView']
 
 class VFSExplorerView(GuiElement.iLayout, GuiElement):
     
-    def __init__(self, object_id, vfs_explorer, read_only=False) -> None:
+    class row_kinds:
+        # what a listbox row is, see resolve_listbox_row()
+        HEADER = -1
+        MORE_ABOVE = -2
+        MORE_BELOW = -3
+
+    list_rows = 12 # rows visible in the listbox
+    list_overscan = 40 # rows formatted past each end of the visible rows
+
+    def __init__(self,
+            object_id,
+            vfs_explorer,
+            read_only=False,
+            prefetch=False,
+            watch=False,
+            virtual_list=False) -> None:
+        """
+        read_only: no adding or removing entries, e.g. to browse a
+        VFSDiff result
+        virtual_list: only format and show a window of rows around the
+        visible ones, list_overscan either side, for folders with very
+        many entries. The window moves when the list is scrolled to either
+        end of it, when the selection nears its ends, or when the row
+        counting the entries past an end is clicked.
+        prefetch: with a lazy VFS, list the current folder's subfolders on a
+        background thread so their sizes fill in without opening them
+        watch: keep the VFS in sync with the filesystem while the window is
+        open, see VFSWatcher
+
+        The search box shows entries anywhere in the VFS whose names match,
+        see VirtualFS.search(). Results are added in chunks between other
+        events, so typing stays responsive while a search runs. The Largest
+        menu shows the biggest files or folders in the same list, and Find
+        Duplicates shows files with the same contents, group by group.
+
+        Details that need the filesystem, like permissions, or a walk of a
+        folder are found on a background thread, see get_entry_extra_details().
+        """
         self.read_only = read_only
+        self.prefetch = prefetch
+        self._prefetching = set() # folders being listed in the background
+        self.watch = watch
+        self.watcher:VFSWatcher|None = None
         super().__init__(object_id)
         self.vfs_explorer:VFSExplorer = vfs_explorer
         self.vfs:VFS = vfs_explorer.vfs
         self.display_list:list[str] = []
         self.selection = None
-        self.selected_row = None
+        self.selected_index = None # position of selection in current_dir_children
+        self.virtual_list = virtual_list
+        self.list_start = 0 # current_dir_children shown in the listbox, see get_list_window()
+        self.list_stop = 0
+        self._list_source = None # what the children are of, the window resets when it changes
+        self._list_scroll_to = None # position to scroll to the top on the next push
+        self.clear_row_cache()
+        self.search_query = ''
+        self.search_results:list|None = None # shown instead of the current folder
+        self.results_title = ''
+        self._search = None # running search generator
+        self._search_generation = 0
+        self.dupe_groups:dict = {} # entry -> its group, from the last Find Duplicates
+        self._details_cache:dict = {} # entry -> (version, extra details), oldest first
+        self._details_condition = threading.Condition()
+        self._details_request = None # (window, entry, version, cancel token) for the worker
+        self._details_pending = None # (entry, version) being found
+        self._details_token:CancelToken|None = None
+        self._details_thread:threading.Thread|None = None
     
     ### GuiElement
 
@@ -57,6 +125,15 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
         ]
         return row_current_path
     
+    def _get_row_search(self):
+        row_search = [
+            sg.Sizer(6, 0),
+            sg.Text('Search'),
+            sg.Sizer(1, 0),
+            sg.Input('', key=self.keys['Search'], enable_events=True, expand_x=True)
+        ]
+        return row_search
+    
     def _get_row_details(self):
         button_root_folder = sg.Button('Root',
             key=self.keys['ExitToRoot'], **self._nav_button_kwargs)
@@ -81,7 +158,7 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
         ])
         right_click_menu = self.right_click_menus['ListboxNone'].get_def()
         right_click_selects = True
-        item_list_size = (psgu_g.explorer_list_width, 12)
+        item_list_size = (psgu_g.explorer_list_width, self.list_rows)
         sge_item_list = sg_wrapped.Listbox(values=[],
             key=self.keys['Listbox'],
             enable_events=True,
@@ -100,10 +177,12 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
     
     def get_layout_explorer(self):
         row_current_path = self._get_row_current_path()
+        row_search = self._get_row_search()
         row_details = self._get_row_details()
         row_listbox = self._get_row_listbox()
         layout = [
             row_current_path,
+            row_search,
             row_details,
             row_listbox,
         ]
@@ -114,7 +193,9 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
             'size': (10, 1)
         }
         row = [
-            sg.Sizer(65, 0),
+            sg.Sizer(52, 0),
+            sg.Button('Refresh',
+                key=self.keys['Refresh'], **control_button_kwargs),
             sg.Button('Add Folder',
                 key=self.keys['AddFolder'], **control_button_kwargs),
             sg.Button('Add Files',
@@ -131,25 +212,35 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
     def _push(self, window:sg.Window):
         self.update_rcm(window)
         self.vfs_explorer.refresh_current_dir()
-        if self.selection:
-            entry_details = self.get_entry_details(self.selection)
-        else:
-            entry_details = ''
-        window[self.keys['Details']](entry_details)
-        if self.vfs_explorer.current_dir_entry == None:
+        if self.search_results != None:
+            self.search_results = [e for e in self.search_results if e.vfs is self.vfs]
+            self.vfs_explorer.current_dir_children = self.search_results
+        self._push_details(window)
+        if self.search_results != None:
+            current_path = '{} ({}{})'.format(self.results_title,
+                len(self.search_results), '...' if self._search != None else '')
+        elif self.vfs_explorer.current_dir_entry == None:
             current_path = ''
         else:
             current_path = self.vfs_explorer.current_dir_entry.get_path()
         self.ges('CurrentPath').update(window, current_path)
-        self.refresh_display_list()
-        window[self.keys['Listbox']](self.get_display_list())
-        if self.selection:
-            window[self.keys['Listbox']].set_value(self.selected_row)
+        self._push_listbox(window)
+        if self.prefetch:
+            self.start_prefetch(window)
     
     def _init_window_finalized(self, window:sg.Window):
         window[self.keys['Listbox']].Widget.config(activestyle='none')
+        if self.virtual_list:
+            for bind_string in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+                window[self.keys['Listbox']].bind(bind_string, '+Scroll')
         self.vfs_explorer.refresh_current_dir()
         self.push(window)
+        if self.watch:
+            self.start_watching(window)
+    
+    def _window_closed(self, window:sg.Window):
+        self.stop_watching()
+        self.stop_extra_details()
     
     def update_rcm(self, window):
         if self.selection:
@@ -176,11 +267,18 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
         self.add_key('AddFiles')
         self.add_key('Remove')
         self.add_key('RemoveAll')
+        self.add_key('Refresh')
         self.add_key('Exclude')
         self.add_key('Include')
         self.add_key('Listbox')
+        self.keys['ListboxScroll'] = self.keys['Listbox'] + '+Scroll' # see sg.Element.bind()
         self.add_key('CurrentPath')
         self.add_key('Details')
+        self.add_key('Prefetched')
+        self.add_key('DetailsFound')
+        self.add_key('FSChanged')
+        self.add_key('Search')
+        self.add_key('SearchMore')
 
     def define_menus(self):
         super().define_menus()
@@ -195,10 +293,73 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
 
         rcms['ListboxFile']['Back']('Back')
         rcms['ListboxFile']['Remove']('Remove', disable_tags=['read_only'])
+
+        for rcm_name in ('ListboxNone', 'ListboxFolder', 'ListboxFile'):
+            rcms[rcm_name]['SortBy']('Sort By')
+            for sort_key, text in self._sort_menu_items:
+                rcms[rcm_name]['SortBy'][sort_key](text)
+            rcms[rcm_name]['Largest']('Largest')
+            rcms[rcm_name]['Largest']['Files']('Files')
+            rcms[rcm_name]['Largest']['Folders']('Folders')
+            rcms[rcm_name]['Histogram']('Size Histogram')
+            rcms[rcm_name]['FindDuplicates']('Find Duplicates')
         rcms.lock()
     
+    _sort_menu_items = [
+        (VFSExplorer.sort_keys.SIZE, 'Size'),
+        (VFSExplorer.sort_keys.FILE_COUNT, 'File Count'),
+        (VFSExplorer.sort_keys.NAME, 'Name'),
+        (VFSExplorer.sort_keys.MTIME, 'Modified')
+    ]
+
     def define_events(self):
         super().define_events()
+
+        for sort_key, _ in self._sort_menu_items:
+            def event_sort_by(event_context:EventContext, sort_key=sort_key):
+                explorer = self.vfs_explorer
+                reverse = False
+                if explorer.sort_key == sort_key:
+                    reverse = not explorer.sort_reverse
+                explorer.set_sort(sort_key, reverse)
+                self.deselect()
+                self.push(event_context.window)
+            events = [self.key_rcm(rcm_name, 'SortBy', sort_key)
+                for rcm_name in ('ListboxNone', 'ListboxFolder', 'ListboxFile')]
+            self.event_method(event_sort_by, *events)
+        
+        for kind, kind_id in ((VFSEntry.entry_types.FILE, 'Files'), (VFSEntry.entry_types.DIR, 'Folders')):
+            def event_largest(event_context:EventContext, kind=kind, kind_id=kind_id):
+                path = self.get_scope_path()
+                entries = self.vfs.top_n(self.top_n_count, kind, path)
+                title = 'Largest {} in {}'.format(kind_id.lower(), path if path != None else 'all')
+                self.show_results(event_context.window, title, entries)
+            events = [self.key_rcm(rcm_name, 'Largest', kind_id)
+                for rcm_name in ('ListboxNone', 'ListboxFolder', 'ListboxFile')]
+            self.event_method(event_largest, *events)
+        
+        @self.eventmethod(*[self.key_rcm(rcm_name, 'Histogram')
+            for rcm_name in ('ListboxNone', 'ListboxFolder', 'ListboxFile')])
+        def event_histogram(event_context:EventContext):
+            path = self.get_scope_path()
+            histogram = self.vfs.size_histogram(path=path)
+            total_best = unit.Bytes(histogram.get_total(), unit.Bytes.B).get_best()
+            text = 'Files in {}: {}, {}\n\n'.format(
+                path if path != None else 'all', histogram.get_count(), total_best)
+            popups.ok_multiline(event_context.window_context, text + histogram.to_string())
+        
+        @self.eventmethod(*[self.key_rcm(rcm_name, 'FindDuplicates')
+            for rcm_name in ('ListboxNone', 'ListboxFolder', 'ListboxFile')])
+        def event_find_duplicates(event_context:EventContext):
+            path = self.get_scope_path()
+            groups = self.find_duplicates_with_progress(event_context, path)
+            if groups == None:
+                return
+            self.dupe_groups = {entry: group for group in groups for entry in group}
+            entries = [entry for group in groups for entry in group]
+            title = 'Duplicates in {}: {} groups'.format(
+                path if path != None else 'all', len(groups))
+            self.show_results(event_context.window, title, entries)
         
         @self.eventmethod(self.keys['Listbox'])
         def event_listbox(event_context:EventContext):
@@ -208,29 +369,39 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
             if not sge_listbox.is_right_click():
                 if self.check_double_click('Listbox'):
                     is_double_click = True
-            item_list = event_context.values[self.keys['Listbox']]
-            if len(item_list) <= 0:
+            indexes = sge_listbox.get_indexes()
+            if len(indexes) <= 0:
                 return
-            if item_list[0][1] == '#':
+            index = self.resolve_listbox_row(indexes[0])
+            if index == self.row_kinds.HEADER:
                 self.deselect()
                 self.push(event_context.window)
                 return
-            listbox_row = item_list[0]
-            same_clicked = (listbox_row == self.selected_row)
+            if index == self.row_kinds.MORE_ABOVE or index == self.row_kinds.MORE_BELOW:
+                self.page_list(event_context.window, index)
+                return
+            same_clicked = (self.selection != None and index == self.selected_index)
             if same_clicked and is_double_click:
                 event_context.event = self.key_rcm('ListboxFolder', 'Open')
                 return self.handle_event(event_context)
             else:
-                self.select(listbox_row)
+                self.select(index)
                 self.push(event_context.window)
         
+        @self.eventmethod(self.keys['ListboxScroll'])
+        def event_listbox_scroll(event_context:EventContext):
+            self.scroll_list(event_context.window)
+        
         @self.eventmethod(self.key_rcm('ListboxFolder', 'Open'))
         def event_open_folder(event_context:EventContext):
             if not self.selection:
                 return
             entry = self.selection
             path = entry.get_path()
+            if self.search_results != None:
+                self.clear_search(event_context.window)
             self.vfs_explorer.open_folder(path)
+            self.update_watches([self.vfs_explorer.current_dir_entry])
             self.deselect()
             self.push(event_context.window)
         
@@ -238,7 +409,10 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
         @self.eventmethod(self.key_rcm('ListboxFile', 'Back'))
         @self.eventmethod(self.keys['ExitFolder'])
         def events_exit_folder(event_context:EventContext):
-            self.vfs_explorer.exit_folder()
+            if self.search_results != None:
+                self.clear_search(event_context.window)
+            else:
+                self.vfs_explorer.exit_folder()
             self.deselect()
             self.push(event_context.window)
 
@@ -250,7 +424,7 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
                 return
             path = self.selection.get_path()
             self.vfs.remove(path)
-            self.vfs.calc_all()
+            self.update_watches(removed_paths=[path])
             self.vfs_explorer.refresh_current_dir()
             self.deselect()
             self.push(event_context.window)
@@ -261,8 +435,8 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
             item_path = psgu_sg.browse_folder(event_context.window)
             if item_path == '':
                 return
-            self.vfs.add_path(item_path)
-            self.vfs.calc_root(item_path)
+            self.add_path_with_progress(event_context, item_path)
+            self.update_watches(self.find_entries([item_path]))
             self.vfs_explorer.exit_to_root()
             self.push(event_context.window)
         
@@ -274,93 +448,657 @@ class VFSExplorerView(GuiElement.iLayout, GuiElement):
                 return
             for item_path in item_paths:
                 self.vfs.add_path(item_path)
-            self.vfs.calc_roots(item_paths)
+            self.update_watches(self.find_entries(item_paths))
             self.vfs_explorer.exit_to_root()
             self.push(event_context.window)
         
+        @self.eventmethod(self.keys['Refresh'])
+        def event_refresh(event_context:EventContext):
+            current_dir_entry = self.vfs_explorer.current_dir_entry
+            if current_dir_entry == None:
+                for entry in self.vfs.get_root_entries():
+                    self.vfs.rescan(entry.get_path())
+                self.update_watches()
+            else:
+                path = current_dir_entry.get_path()
+                self.vfs.rescan(path)
+                if self.vfs.has_path(path):
+                    self.vfs_explorer.open_folder(path)
+                    self.update_watches([self.vfs_explorer.current_dir_entry])
+                else:
+                    self.vfs_explorer.exit_to_root()
+                    self.update_watches(removed_paths=[path])
+            self.deselect()
+            self.push(event_context.window)
+        
         @self.eventmethod(self.keys['ExitToRoot'])
         def events_exit_to_root(event_context:EventContext):
+            self.clear_search(event_context.window)
             self.vfs_explorer.exit_to_root()
             self.deselect()
             self.push(event_context.window)
         
+        @self.eventmethod(self.keys['Prefetched'])
+        def event_prefetched(event_context:EventContext):
+            folder, listing = event_context.values[self.keys['Prefetched']]
+            self._prefetching.discard(folder)
+            if listing == None or folder.vfs is not self.vfs:
+                return
+            self.vfs.materialize(folder, listing=listing)
+            self.update_watches([folder])
+            self.push(event_context.window)
+        
+        @self.eventmethod(self.keys['DetailsFound'])
+        def event_details_found(event_context:EventContext):
+            entry, version, text = event_context.values[self.keys['DetailsFound']]
+            self._cache_details(entry, version, text)
+            with self._details_condition:
+                if self._details_pending == (entry, version):
+                    self._details_pending = None
+            if self.selection == entry and entry.version == version:
+                self._push_details(event_context.window)
+        
+        @self.eventmethod(self.keys['FSChanged'])
+        def event_fs_changed(event_context:EventContext):
+            paths = event_context.values[self.keys['FSChanged']]
+            changed = self.vfs.apply_changes(paths)
+            if not changed:
+                return
+            self.update_watches(changed)
+            current_dir_entry = self.vfs_explorer.current_dir_entry
+            if current_dir_entry != None and current_dir_entry.vfs is not self.vfs:
+                self.vfs_explorer.exit_to_root()
+            if self.selection != None and self.selection.vfs is not self.vfs:
+                self.deselect()
+            if self.is_showing_any(changed):
+                self.push(event_context.window)
+        
+        @self.eventmethod(self.keys['Search'])
+        def event_search(event_context:EventContext):
+            query = event_context.values[self.keys['Search']].strip()
+            self.start_search(event_context.window, query)
+        
+        @self.eventmethod(self.keys['SearchMore'])
+        def event_search_more(event_context:EventContext):
+            generation = event_context.values[self.keys['SearchMore']]
+            self.continue_search(event_context.window, generation)
+        
         @self.eventmethod(self.keys['RemoveAll'])
         def event_remove_all(event_context:EventContext):
             if not popups.confirm(event_context.window_context, 'Remove All?'):
                 return
             self.vfs.remove_all()
+            self.dupe_groups = {}
+            self.update_watches()
             self.vfs_explorer.refresh_current_dir()
             self.deselect()
             self.push(event_context.window)
 
     ### VFSExplorerView
 
+    # Scan
+
+    def add_path_with_progress(self, event_context:EventContext, path):
+        """Add path to the VFS, showing scan progress in a cancelable window"""
+        window_context = event_context.window_context
+        progress_window = ProgressWindow(
+            'ScanProgress' + self.object_id,
+            title='Scanning',
+            header=path,
+            cancelable=True)
+        progress_window.open(window_context)
+        progress_function = progress_window.get_progress_function()
+        cancel_token = CancelToken()
+        for progress in self.vfs.iter_add_path(path, cancel_token, interval=0.5):
+            progress_function(progress.to_string(), progress.get_fraction())
+            if progress_window.is_cancelled():
+                cancel_token.cancel()
+        progress_window.close(window_context)
+
+    # Duplicates
+
+    def find_duplicates_with_progress(self, event_context:EventContext, path=None) -> list|None:
+        """Groups of duplicate files under path (default everywhere), None if cancelled"""
+        window_context = event_context.window_context
+        progress_window = ProgressWindow(
+            'DupeProgress' + self.object_id,
+            title='Finding Duplicates',
+            header=path if path != None else 'All',
+            cancelable=True)
+        progress_window.open(window_context)
+        progress_function = progress_window.get_progress_function()
+        cancel_token = CancelToken()
+        finder = VFSDupeFinder()
+        for progress in finder.iter_find(self.vfs, path, cancel_token, interval=0.5):
+            progress_function(progress.to_string(), progress.get_fraction())
+            if progress_window.is_cancelled():
+                cancel_token.cancel()
+        progress_window.close(window_context)
+        if cancel_token.is_cancelled():
+            return None
+        return finder.groups
+
+    # Watch
+
+    def start_watching(self, window:sg.Window):
+        if self.watcher != None:
+            return
+        def on_changes(paths):
+            window.write_event_value(self.keys['FSChanged'], paths)
+        self.watcher = VFSWatcher(self.vfs, on_changes)
+        self.watcher.start()
+
+    def stop_watching(self):
+        if self.watcher == None:
+            return
+        self.watcher.stop()
+        self.watcher = None
+
+    def update_watches(self, entries:list=None, removed_paths:list=None):
+        """Update the watches where the VFS changed, everywhere if neither is given"""
+        if self.watcher != None:
+            self.watcher.update_watches(entries, removed_paths)
+
+    def find_entries(self, paths:list) -> list:
+        """Entries at paths, leaving out paths not in the VFS"""
+        entries = [self.vfs.find_entry(path) for path in paths]
+        return [entry for entry in entries if entry != None]
+
+    def is_showing_any(self, entries:list) -> bool:
+        """If any of entries' sizes or counts show in the current folder's rows"""
+        current_dir_entry = self.vfs_explorer.current_dir_entry
+        if current_dir_entry == None or self.search_results != None:
+            return True
+        for entry in entries:
+            for parent in entry.iter_parents():
+                if parent == current_dir_entry:
+                    return True
+        return False
+
+    # Search
+
+    search_chunk_secs = 0.02
+    max_search_results = 10000
+
+    def start_search(self, window:sg.Window, query:str):
+        """Show entries matching query, or the current folder again if it's empty"""
+        self._search_generation += 1
+        self.search_query = query
+        self.deselect()
+        if query == '':
+            self._search = None
+            self.search_results = None
+            self.push(window)
+            return
+        self._search = self.vfs.search(query)
+        self.search_results = []
+        self.results_title = 'Search: ' + query
+        self.continue_search(window, self._search_generation)
+
+    def continue_search(self, window:sg.Window, generation:int):
+        """
+        Add results for up to search_chunk_secs, then queue the next chunk
+        behind any waiting events. Chunks of replaced searches are dropped.
+        """
+        if generation != self._search_generation or self._search == None:
+            return
+        stop_time = time.perf_counter() + self.search_chunk_secs
+        results = self.search_results
+        for entry in self._search:
+            results.append(entry)
+            if len(results) >= self.max_search_results:
+                self._search = None
+                break
+            if time.perf_counter() >= stop_time:
+                break
+        else:
+            self._search = None
+        self.push(window)
+        if self._search != None:
+            window.write_event_value(self.keys['SearchMore'], generation)
+
+    top_n_count = 100
+
+    def get_scope_path(self) -> str|None:
+        """Path of the current folder, None at the root"""
+        current_dir_entry = self.vfs_explorer.current_dir_entry
+        if current_dir_entry == None:
+            return None
+        return current_dir_entry.get_path()
+
+    def show_results(self, window:sg.Window, title:str, entries:list):
+        """Show entries in the list instead of the current folder, like search results"""
+        self._search_generation += 1
+        self._search = None
+        self.search_results = list(entries)
+        self.search_query = ''
+        self.results_title = title
+        window[self.keys['Search']]('')
+        self.deselect()
+        self.push(window)
+
+    def clear_search(self, window:sg.Window):
+        self._search_generation += 1
+        self._search = None
+        self.search_results = None
+        self.search_query = ''
+        window[self.keys['Search']]('')
+
+    # Prefetch
+
+    def start_prefetch(self, window:sg.Window):
+        """List unscanned folders in the current folder on a background thread"""
+        folders = [child for child in self.vfs_explorer.current_dir_children
+            if child.is_dir() and not child.children_scanned
+                and child not in self._prefetching]
+        if not folders:
+            return
+        self._prefetching.update(folders)
+        threading.Thread(target=self._prefetch_worker,
+            args=(window, folders), daemon=True).start()
+
+    def _prefetch_worker(self, window:sg.Window, folders:list):
+        """Only lists folders, entries are changed on the event loop's thread"""
+        for folder in folders:
+            try:
+                listing = VFSEntry.list_dir(folder.path, self.vfs.follow_symlinks)
+            except OSError:
+                listing = None
+            window.write_event_value(self.keys['Prefetched'], (folder, listing))
+
+    # Details
+    # The details pane shows get_entry_details() straight away, then adds
+    # get_entry_extra_details() once a worker thread has found them. The
+    # worker only takes the latest selection, after it has stayed selected
+    # for details_delay, so moving through the list quickly doesn't queue
+    # up work. Found details are cached per entry until its version changes.
+
+    details_delay = 0.15
+    details_cache_size = 256
+    details_extensions = 8 # extensions listed for folders
+
+    def _push_details(self, window:sg.Window):
+        entry = self.selection
+        if entry == None:
+            window[self.keys['Details']]('')
+            return
+        s = self.get_entry_details(entry)
+        cached = self._details_cache.get(entry)
+        if cached != None and cached[0] == entry.version:
+            s += cached[1]
+            self.cancel_extra_details()
+        else:
+            self.request_extra_details(window, entry)
+            s += '\n\n...'
+        window[self.keys['Details']](s)
+
+    def request_extra_details(self, window:sg.Window, entry):
+        """Find entry's extra details on the worker thread, cancelling any being found"""
+        request = (entry, entry.version)
+        with self._details_condition:
+            if self._details_token != None:
+                if self._details_pending == request and not self._details_token.is_cancelled():
+                    return
+                self._details_token.cancel()
+            self._details_token = CancelToken()
+            self._details_pending = request
+            self._details_request = (window, entry, entry.version, self._details_token)
+            self._details_condition.notify()
+            if self._details_thread == None:
+                self._details_thread = threading.Thread(target=self._details_worker, daemon=True)
+                self._details_thread.start()
+
+    def cancel_extra_details(self):
+        with self._details_condition:
+            if self._details_token != None:
+                self._details_token.cancel()
+            self._details_request = None
+            self._details_pending = None
+
+    def stop_extra_details(self, timeout=1.0):
+        """Cancel any details being found and end the worker thread"""
+        with self._details_condition:
+            thread = self._details_thread
+            if thread == None:
+                return
+            self._details_thread = None
+            self._details_condition.notify_all()
+        self.cancel_extra_details()
+        thread.join(timeout)
+
+    def _details_worker(self):
+        condition = self._details_condition
+        thread = threading.current_thread()
+        # a stopped worker is no longer self._details_thread
+        stopped = lambda: self._details_thread is not thread
+        has_request = lambda: self._details_request != None or stopped()
+        while True:
+            with condition:
+                condition.wait_for(has_request)
+                if stopped():
+                    return
+                window, entry, version, cancel_token = self._details_request
+                self._details_request = None
+                # a newer selection within details_delay replaces this one
+                if condition.wait_for(has_request, self.details_delay):
+                    continue
+            if cancel_token.is_cancelled():
+                continue
+            try:
+                text = self.get_entry_extra_details(entry, cancel_token)
+            except (RuntimeError, IndexError):
+                # the tree changed on the event loop's thread while walking
+                # it, the next push asks again
+                cancel_token.cancel()
+                continue
+            if text == None or cancel_token.is_cancelled():
+                continue
+            window.write_event_value(self.keys['DetailsFound'], (entry, version, text))
+
+    def _cache_details(self, entry, version:int, text:str):
+        cache = self._details_cache
+        cache.pop(entry, None)
+        if len(cache) >= self.details_cache_size:
+            del cache[next(iter(cache))]
+        cache[entry] = (version, text)
+
+    def get_entry_extra_details(self, entry, cancel_token:CancelToken=None) -> str|None:
+        """
+        Details that need the filesystem or a walk of a folder, found on the
+        details worker thread. None if cancelled.
+        """
+        lines = ['']
+        try:
+            stat_result = os.lstat(entry.path)
+        except OSError as e:
+            lines.append('Not readable on disk: ' + (e.strerror or str(e)))
+        else:
+            lines.append('Modified: ' + time.strftime('%Y-%m-%d %H:%M:%S',
+                time.localtime(stat_result.st_mtime)))
+            lines.append('Permissions: ' + stat.filemode(stat_result.st_mode))
+        if not entry.is_dir():
+            return '\n'.join(lines)
+        by_extension = {} # extension -> [file count, bytes]
+        for i, descendant in enumerate(entry.walk(include_self=False)):
+            if i % 4096 == 0 and cancel_token != None and cancel_token.is_cancelled():
+                return None
+            if not descendant.is_file():
+                continue
+            extension = os.path.splitext(descendant.name)[1].lower() or '(none)'
+            totals = by_extension.setdefault(extension, [0, 0])
+            totals[0] += 1
+            totals[1] += descendant.get_size()
+        if not by_extension:
+            return '\n'.join(lines)
+        extensions = sorted(by_extension.items(), key=lambda item: item[1][1], reverse=True)
+        table = TableList(sep='  ', field_border_l='', field_border_r='',
+            field_aligns=['left', 'right', 'right'])
+        for extension, (count, size) in extensions[:self.details_extensions]:
+            table.add_row([extension, '{} files'.format(count),
+                unit.Bytes(size, unit.Bytes.B).get_best()])
+        rest = extensions[self.details_extensions:]
+        if rest:
+            table.add_row(['{} more'.format(len(rest)),
+                '{} files'.format(sum(count for _, (count, _) in rest)),
+                unit.Bytes(sum(size for _, (_, size) in rest), unit.Bytes.B).get_best()])
+        lines.append('')
+        lines.append('Files by extension:')
+        lines.extend(['    ' + row for row in table.iter_formatted_rows()])
+        return '\n'.join(lines)
+
     # Other
 
     def get_entry_details(self, entry):
+        """What the entry already knows, see get_entry_extra_details() for the rest"""
         name = entry.name
         path = entry.path
         s = name + '   (' + path + ')'
         s += '\n\nType: '
-        if os.path.isdir(path):
+        if entry.is_dir():
             s += 'Folder'
         else:
             s += 'File'
         size_best = unit.Bytes(entry.size, degree_name=unit.Bytes.BYTE) \
             .get_best()
-        s += '\nSize: ' + size_best
+        allocated_best = unit.Bytes(entry.get_allocated_size(), degree_name=unit.Bytes.BYTE) \
+            .get_best()
+        s += '\nSize: ' + size_best + '   (on disk: ' + allocated_best + ')'
+        if entry.hardlink:
+            s += '\nHardlink, counted at another path'
+        if isinstance(entry, VFSDiffEntry):
+            s += '\n' + entry.get_change_string()
+        group = self.dupe_groups.get(entry)
+        if group != None:
+            s += '\nSame contents as:'
+            for other in group:
+                if other != entry:
+                    s += '\n    ' + other.path
         return s
 
+    def get_list_window(self) -> tuple[int, int]:
+        """(start, stop) of the current_dir_children shown in the listbox"""
+        children = self.vfs_explorer.current_dir_children
+        count = len(children) if children != None else 0
+        if not self.virtual_list:
+            return 0, count
+        size = self.list_rows + 2 * self.list_overscan
+        start = max(0, min(self.list_start, count - size))
+        return start, min(count, start + size)
+
+    _list_header = ['#', 'Typ', 'Name', 'Status', 'Inc Size', 'Exc Size', 'I-F', 'I-f', 'E-F', 'E-f']
+
     def refresh_display_list(self):
         self.display_list = []
-        if self.vfs_explorer.current_dir_children == None:
+        children = self.vfs_explorer.current_dir_children
+        if children == None:
+            self.list_start = self.list_stop = 0
             return
-        i = 1
+        source = (self.vfs_explorer.current_dir_entry, self.search_results != None, self.results_title)
+        if source != self._list_source:
+            self._list_source = source
+            self.list_start = 0
+            self.clear_row_cache()
+        if children is not self._row_cache_children:
+            # children added, removed or changed, see VFSExplorer.get_sorted_children()
+            self._row_cache_children = children
+            self._prune_row_cache(children)
+        self.list_start, self.list_stop = self.get_list_window()
+        rows = [self._get_cached_row(children[i]) for i in range(self.list_start, self.list_stop)]
+        max_lens = self._get_max_lens(len(children))
+        # only rows that changed, moved, or are in columns of new widths are formatted
         display_table = TableList()
-        display_table.add_row([
-            '#', 'Typ', 'Name', 'Status', 'Inc Size',
-            'Exc Size', 'I-F', 'I-f', 'E-F', 'E-f'
-        ])
-        for child in self.vfs_explorer.current_dir_children:
-            i_size_value, i_size_symbol = unit.Bytes(int(child.get_included_size()), unit.Bytes.B).find_best(0.1)
-            e_size_value, e_size_symbol = unit.Bytes(int(child.get_excluded_size()), unit.Bytes.B).find_best(0.1)
-            i_size_value = round(i_size_value, 2)
-            e_size_value = round(e_size_value, 2)
-            i_size = text_utils.center_decimal_string(str(i_size_value), 2) + ' ' + i_size_symbol.rjust(2, ' ')
-            e_size = text_utils.center_decimal_string(str(e_size_value), 2) + ' ' + e_size_symbol.rjust(2, ' ')
-            display_table.add_row([
-                str(i),
-                child.get_type_symbol(),
-                child.name,
-                child.status,
-                i_size,
-                e_size,
-                str(child.get_included_folder_count()),
-                str(child.get_included_file_count()),
-                str(child.get_excluded_folder_count()),
-                str(child.get_excluded_file_count())
-            ])
-            i += 1
+        display_table.set_max_lens(max_lens)
+        display_table.add_row(self._list_header)
+        to_format = []
+        for i, row in enumerate(rows, self.list_start):
+            line_key = (i, max_lens)
+            if row[2] != line_key:
+                row[2] = line_key
+                display_table.add_row([str(i + 1)] + row[1])
+                to_format.append(row)
         display_table.trim_fields(psgu_g.explorer_list_width, [(2, 8)])
-        rows = display_table.get_formatted_rows()
-        for row in rows:
-            self.display_list.append(row)
-    
+        lines = display_table.iter_formatted_rows()
+        header = next(lines)
+        for row, line in zip(to_format, lines):
+            row[3] = line
+        self.display_list.append(header)
+        if self.list_start > 0:
+            self.display_list.append('   ... {} more above'.format(self.list_start))
+        self.display_list.extend([row[3] for row in rows])
+        if self.list_stop < len(children):
+            self.display_list.append('   ... {} more below'.format(len(children) - self.list_stop))
+
     def get_display_list(self):
         return self.display_list
-    
-    def resolve_listbox_row(self, listbox_row:str):
-        start = listbox_row.find('[') + 1
-        stop = listbox_row.find(']')
-        index = int(listbox_row[start:stop])
-        return self.vfs_explorer.current_dir_children[index - 1]
-       
-    def select(self, listbox_row):
-        entry = self.resolve_listbox_row(listbox_row)
-        self.selection = entry
-        self.selected_row = listbox_row
+
+    # Row cache
+    # Display fields of each listed entry, other than its number, kept until
+    # its version changes, see VFSEntry.touch(). Rows are
+    # [version, fields, (number, max lens) when formatted, formatted line].
+    # Counts of field lengths give the column widths without going over
+    # every row.
+
+    def clear_row_cache(self):
+        self._row_cache = {}
+        self._row_cache_children = None # the list the cache was last pruned for
+        self._field_len_counts = [{} for _ in self._list_header[1:]]
+
+    def _count_field_lens(self, fields:list[str], delta:int):
+        for field, counts in zip(fields, self._field_len_counts):
+            length = len(field)
+            count = counts.get(length, 0) + delta
+            if count:
+                counts[length] = count
+            else:
+                del counts[length]
+
+    def _get_cached_row(self, entry) -> list:
+        row = self._row_cache.get(entry)
+        version = entry.version
+        if row != None and row[0] == version:
+            return row
+        fields = self._format_row_fields(entry)
+        if row != None:
+            self._count_field_lens(row[1], -1)
+        self._count_field_lens(fields, 1)
+        row = [version, fields, None, None]
+        self._row_cache[entry] = row
+        return row
+
+    def _prune_row_cache(self, children:list):
+        """Drop the rows of entries no longer listed or changed, and count field lengths again"""
+        listed = set(children)
+        self._row_cache = {entry: row for entry, row in self._row_cache.items()
+            if entry in listed and row[0] == entry.version}
+        self._field_len_counts = [{} for _ in self._list_header[1:]]
+        for row in self._row_cache.values():
+            self._count_field_lens(row[1], 1)
+
+    def _get_max_lens(self, count:int) -> tuple:
+        max_lens = [max(1, len(str(count)))]
+        for header, counts in zip(self._list_header[1:], self._field_len_counts):
+            max_lens.append(max(len(header), max(counts, default=0)))
+        return tuple(max_lens)
+
+    def _format_row_fields(self, child) -> list[str]:
+        i_size_value, i_size_symbol = unit.Bytes(int(child.get_included_size()), unit.Bytes.B).find_best(0.1)
+        e_size_value, e_size_symbol = unit.Bytes(int(child.get_excluded_size()), unit.Bytes.B).find_best(0.1)
+        i_size_value = round(i_size_value, 2)
+        e_size_value = round(e_size_value, 2)
+        i_size = text_utils.center_decimal_string(str(i_size_value), 2) + ' ' + i_size_symbol.rjust(2, ' ')
+        e_size = text_utils.center_decimal_string(str(e_size_value), 2) + ' ' + e_size_symbol.rjust(2, ' ')
+        return [
+            child.get_type_symbol(),
+            child.name,
+            child.status,
+            i_size,
+            e_size,
+            str(child.get_included_folder_count()),
+            str(child.get_included_file_count()),
+            str(child.get_excluded_folder_count()),
+            str(child.get_excluded_file_count())
+        ]
+
+    def _push_listbox(self, window:sg.Window):
+        sge_listbox = window[self.keys['Listbox']]
+        self.refresh_display_list()
+        sge_listbox(self.get_display_list())
+        if self._list_scroll_to != None:
+            row = self.child_to_listbox_row(max(self.list_start, self._list_scroll_to))
+            self._list_scroll_to = None
+            if row != None:
+                sge_listbox.update(scroll_to_index=row)
+        index = self._find_selected_index()
+        if index != None:
+            row = self.child_to_listbox_row(index)
+            if row != None:
+                sge_listbox.update(set_to_index=row)
+
+    def resolve_listbox_row(self, listbox_index:int) -> int:
+        """Position in current_dir_children of a listbox row, or one of row_kinds"""
+        if listbox_index == 0:
+            return self.row_kinds.HEADER
+        if self.list_start > 0:
+            if listbox_index == 1:
+                return self.row_kinds.MORE_ABOVE
+            listbox_index -= 1
+        index = self.list_start + listbox_index - 1
+        if index >= self.list_stop:
+            return self.row_kinds.MORE_BELOW
+        return index
+
+    def child_to_listbox_row(self, index:int) -> int|None:
+        """Listbox row of a position in current_dir_children, None if not shown"""
+        if index < self.list_start or index >= self.list_stop:
+            return None
+        return index - self.list_start + 1 + (self.list_start > 0)
+
+    def page_list(self, window:sg.Window, row_kind:int):
+        """Move the window of rows by a page, row_kind being MORE_ABOVE or MORE_BELOW"""
+        page = self.list_rows + self.list_overscan
+        if row_kind == self.row_kinds.MORE_ABOVE:
+            self._list_scroll_to = self.list_start - self.list_rows
+            self.list_start -= page
+        else:
+            self._list_scroll_to = self.list_stop
+            self.list_start += page
+        self.push(window)
+
+    def scroll_list(self, window:sg.Window):
+        """After the listbox is scrolled, move the window of rows if scrolled to an end of it"""
+        children = self.vfs_explorer.current_dir_children
+        if not self.virtual_list or children == None:
+            return
+        widget = window[self.keys['Listbox']].Widget
+        view_top, view_bottom = widget.yview()
+        if view_top <= 0 and self.list_start > 0:
+            shift = -self.list_overscan
+        elif view_bottom >= 1 and self.list_stop < len(children):
+            shift = self.list_overscan
+        else:
+            return
+        # keep the same entry at the top of the view
+        top = self.resolve_listbox_row(widget.nearest(0))
+        if top == self.row_kinds.MORE_BELOW:
+            top = self.list_stop
+        elif top < 0:
+            top = self.list_start
+        self._list_scroll_to = top
+        self.list_start += shift
+        self.push(window)
+
+    def _keep_in_list_window(self, index:int):
+        """Center the window of rows on index if it's near an end with more past it"""
+        children = self.vfs_explorer.current_dir_children
+        near_start = index < self.list_start + self.list_rows and self.list_start > 0
+        near_stop = index >= self.list_stop - self.list_rows and self.list_stop < len(children)
+        if near_start or near_stop:
+            self.list_start = index - (self.list_rows + 2 * self.list_overscan) // 2
+            self._list_scroll_to = index - self.list_rows // 2
+
+    def _find_selected_index(self) -> int|None:
+        """Position of the selection in current_dir_children, None if not there"""
+        children = self.vfs_explorer.current_dir_children
+        if self.selection == None or children == None:
+            return None
+        index = self.selected_index
+        if index != None and index < len(children) and children[index] == self.selection:
+            return index
+        # children changed, e.g. sorted again
+        for index, child in enumerate(children):
+            if child == self.selection:
+                self.selected_index = index
+                return index
+        return None
+
+    def select(self, index:int):
+        self.selection = self.vfs_explorer.current_dir_children[index]
+        self.selected_index = index
+        if self.virtual_list:
+            self._keep_in_list_window(index)
 
     def deselect(self):
         self.selection = None
-        self.selected_row = None
+        self.selected_index = None
+        self.cancel_extra_details()
         
@@ -124,6 +124,10 @@ class GuiElementManager(GuiElementLayoutManager):
         for ge in self.ges.values():
             ge.init_window_finalized(window)
 
+    def for_ges_window_closed(self, window:sg.Window):
+        for ge in self.ges.values():
+            ge.window_closed(window)
+
     def for_ges_pull(self, values):
         for ge in self.ges.values():
             ge.pull(values)
@@ -296,6 +300,9 @@ class GuiElement(EventManager, GuiElementLayoutManager):
     def _init_window_finalized(self, window:sg.Window):
         pass
 
+    def _window_closed(self, window:sg.Window):
+        pass
+
     # Data
     
     def _save(self, data:dict):
@@ -326,6 +333,14 @@ class GuiElement(EventManager, GuiElementLayoutManager):
         self.init_window_finalized_finished = True
         return self
 
+    def window_closed(self, window:sg.Window):
+        """
+        Called once the window is closed, however it was closed. Override
+        `_window_closed()` to e.g. stop background threads.
+        """
+        self._window_closed(window)
+        return self
+
     # Data
 
     def save(self, data):
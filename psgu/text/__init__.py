@@ -1 +1,2 @@
 from .utils import *
+from .column_table import *
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from array import array
+from typing import Any, Callable, Iterable, Iterator
+
+from psgu.data import units as unit
+from psgu.text.utils import TableList, center_decimal_string
+
+
+__all__ = [
+    'format_number',
+    'format_bytes',
+    'Column',
+    'ColumnTable'
+]
+
+
+def format_number(decimal_digits:int|None=None, thousands_sep=False) -> Callable[[Any], str]:
+    """Formatter for ints/floats, rounded to decimal_digits if given"""
+    spec = ',' if thousands_sep else ''
+    if decimal_digits != None:
+        spec += '.{}f'.format(decimal_digits)
+    def f(value):
+        return format(value, spec)
+    return f
+
+
+def format_bytes(decimal_digits=2, minimum=0.1, center_decimal=True) -> Callable[[Any], str]:
+    """Formatter for byte counts, e.g. ' 1.50 MB', using DataBytes"""
+    def f(value):
+        size_value, size_symbol = unit.Bytes(int(value), unit.Bytes.B).find_best(minimum)
+        size_value = round(size_value, decimal_digits)
+        if center_decimal:
+            s = center_decimal_string(str(size_value), decimal_digits)
+        else:
+            s = str(size_value)
+        return s + ' ' + size_symbol.rjust(2, ' ')
+    return f
+
+
+class Column:
+
+    def __init__(self,
+            header='',
+            values:Iterable=None,
+            formatter:Callable[[Any], str]=None,
+            align='left',
+            typecode:str=None):
+        """
+        ---
+        One column of a ColumnTable. Values are stored raw and only
+        formatted into strings when displayed.
+        ---
+        Args:
+            header (default=''): shown above the column if any column has one.
+            values (default=None): initial values.
+            formatter (default=str): value -> str.
+            align (default='left'): 'left', 'right' or 'center'.
+            typecode (default=None): if given, values are stored in an
+                array.array of this typecode instead of a list.
+        """
+        self.header = header
+        self.formatter = formatter if formatter != None else str
+        self.align = align
+        self.typecode = typecode
+        if typecode:
+            self.values = array(typecode, values if values != None else [])
+        else:
+            self.values = list(values) if values != None else []
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def append(self, value):
+        self.values.append(value)
+
+    def format(self, index) -> str:
+        return self.formatter(self.values[index])
+
+
+class ColumnTable:
+
+    def __init__(self,
+            sep='',
+            sep_before_indices=[],
+            field_border_l='[',
+            field_border_r=']',
+            ellipsis=''):
+        """
+        ---
+        Column-oriented alternative to TableList. Each column keeps its
+        own raw values and formatter; cells are only turned into strings
+        for the rows being displayed.
+
+        Usage:
+          ct = ColumnTable()
+          ct.add_column('Name'), ct.add_column('Size', format_bytes(), 'right', 'q')
+          ct.add_row(...), ct.add_row(...), ...
+          ct.sort_by('Size', reverse=True)
+          ct.get_formatted_rows(0, 50)
+        ---
+        Args: Passed to the TableList used for display.
+        """
+        self.sep = sep
+        self.sep_before_indices = sep_before_indices
+        self.field_border_l = field_border_l
+        self.field_border_r = field_border_r
+        self.ellipsis = ellipsis
+        self.columns:list[Column] = []
+        self.order:array|None = None # display index -> row index, None if unsorted
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(self.columns[0])
+
+    def add_column(self,
+            header='',
+            formatter:Callable[[Any], str]=None,
+            align='left',
+            typecode:str=None) -> Column:
+        if self.columns and len(self.columns[0]):
+            raise Exception('Bad Parameter',
+                'Columns must be added before rows')
+        column = Column(header, formatter=formatter, align=align, typecode=typecode)
+        self.columns.append(column)
+        return column
+
+    def get_column(self, column:int|str) -> Column:
+        """Get a column by index or header"""
+        if isinstance(column, int):
+            return self.columns[column]
+        for c in self.columns:
+            if c.header == column:
+                return c
+        raise KeyError(column)
+
+    def add_row(self, row:list):
+        if len(row) != len(self.columns):
+            raise Exception('Bad Parameter',
+                'Expected row of length {}, received row of length {}'.format(
+                    len(self.columns), len(row)))
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        if self.order != None:
+            self.order.append(len(self) - 1)
+
+    def add_rows(self, rows:Iterable[list]):
+        for row in rows:
+            self.add_row(row)
+
+    def get_row(self, index) -> list:
+        """Raw values of a row, by display index"""
+        i_row = self.get_row_index(index)
+        return [column.values[i_row] for column in self.columns]
+
+    def get_row_index(self, index) -> int:
+        """Display index -> row index, the order rows were added in"""
+        if self.order == None:
+            return index
+        return self.order[index]
+
+    def sort_by(self, column:int|str, reverse=False, key:Callable=None):
+        """
+        Stable sort of the display order by a column's raw values.
+        No values are formatted.
+        """
+        values = self.get_column(column).values
+        if key == None:
+            sort_key = values.__getitem__
+        else:
+            def sort_key(i):
+                return key(values[i])
+        self.order = array('q', sorted(range(len(values)), key=sort_key, reverse=reverse))
+
+    def clear_sort(self):
+        self.order = None
+
+    def _has_headers(self):
+        for column in self.columns:
+            if column.header:
+                return True
+        return False
+
+    def to_table_list(self, start=0, stop=None, headers=True) -> TableList:
+        """
+        Format only rows [start, stop) of the display order into a
+        TableList, which may then be trimmed and printed.
+        """
+        n = len(self)
+        if stop == None or stop > n:
+            stop = n
+        tl = TableList(
+            sep=self.sep,
+            sep_before_indices=self.sep_before_indices,
+            field_border_l=self.field_border_l,
+            field_border_r=self.field_border_r,
+            ellipsis=self.ellipsis,
+            field_aligns=[column.align for column in self.columns])
+        if headers and self._has_headers():
+            tl.add_row([column.header for column in self.columns])
+        formatters = [(column.formatter, column.values) for column in self.columns]
+        for index in range(start, stop):
+            i_row = self.get_row_index(index)
+            tl.add_row([formatter(values[i_row]) for formatter, values in formatters])
+        return tl
+
+    def iter_formatted_rows(self, start=0, stop=None, headers=True) -> Iterator[str]:
+        return self.to_table_list(start, stop, headers).iter_formatted_rows()
+
+    def get_formatted_rows(self, start=0, stop=None, headers=True) -> list[str]:
+        return list(self.iter_formatted_rows(start, stop, headers))
+
+    def write_to(self, stream, start=0, stop=None, headers=True, buffer_rows=1024):
+        self.to_table_list(start, stop, headers).write_to(stream, buffer_rows)
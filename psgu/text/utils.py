@@ -1,9 +1,16 @@
-from typing import Iterable
+import sys
+from itertools import chain, islice, zip_longest
+from typing import Iterable, Iterator
 import math
 
 
 __all__ = [
     'center_decimal_string',
+    'solve_trim_longest',
+    'solve_trim_proportional',
+    'solve_trim_priority',
+    'align_field',
+    'fit_field',
     'TableList',
     'PrintColumn'
 ]
@@ -18,9 +25,124 @@ def center_decimal_string(s, side, lpad=' ', rpad='0'):
     return s
 
 
+def _write_lines(stream, lines:Iterable[str], buffer_rows=1024):
+    """Write lines to a text stream in chunks of buffer_rows lines"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= buffer_rows:
+            chunk.append('')
+            stream.write('\n'.join(chunk))
+            chunk.clear()
+    if chunk:
+        chunk.append('')
+        stream.write('\n'.join(chunk))
+
+
+def solve_trim_longest(widths:list[int], to_trim:int, min_widths:list[int]=None) -> list[int]:
+    """
+    Find new widths that trim at least to_trim, by capping the widest
+    columns at the largest common width that achieves it. Binary search
+    over the cap, O(columns * log(width)).
+    """
+    if min_widths == None:
+        min_widths = [0] * len(widths)
+    def trimmed_at(cap):
+        total = 0
+        for width, min_width in zip(widths, min_widths):
+            limit = cap if cap > min_width else min_width
+            if width > limit:
+                total += width - limit
+        return total
+    lo = 0
+    hi = max(widths, default=0)
+    if trimmed_at(lo) < to_trim:
+        hi = lo
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if trimmed_at(mid) >= to_trim:
+            lo = mid
+        else:
+            hi = mid - 1
+    cap = lo
+    return [min(width, max(cap, min_width))
+        for width, min_width in zip(widths, min_widths)]
+
+
+def solve_trim_proportional(widths:list[int], to_trim:int, min_widths:list[int]=None) -> list[int]:
+    """
+    Find new widths that trim at least to_trim, taking from each column
+    in proportion to its width above its min width.
+    """
+    if min_widths == None:
+        min_widths = [0] * len(widths)
+    excess = [max(width - min_width, 0) for width, min_width in zip(widths, min_widths)]
+    total_excess = sum(excess)
+    if total_excess <= to_trim:
+        return [min(width, min_width) for width, min_width in zip(widths, min_widths)]
+    trims = []
+    remainders = []
+    for i, e in enumerate(excess):
+        trim, remainder = divmod(e * to_trim, total_excess)
+        trims.append(trim)
+        remainders.append((remainder, e, -i))
+    # hand out what rounding down left over, largest remainders first
+    left = to_trim - sum(trims)
+    for _, _, neg_i in sorted(remainders, reverse=True)[:left]:
+        trims[-neg_i] += 1
+    return [width - trim for width, trim in zip(widths, trims)]
+
+
+def solve_trim_priority(widths:list[int],
+        to_trim:int,
+        priorities:list[int],
+        min_widths:list[int]=None) -> list[int]:
+    """
+    Find new widths that trim at least to_trim, trimming columns with
+    the lowest priority first and equal priorities longest first.
+    """
+    if min_widths == None:
+        min_widths = [0] * len(widths)
+    new_widths = list(widths)
+    for priority in sorted(set(priorities)):
+        if to_trim <= 0:
+            break
+        group = [i for i, p in enumerate(priorities) if p == priority]
+        group_widths = [new_widths[i] for i in group]
+        group_mins = [min_widths[i] for i in group]
+        trimmed = solve_trim_longest(group_widths, to_trim, group_mins)
+        for i, width in zip(group, trimmed):
+            to_trim -= new_widths[i] - width
+            new_widths[i] = width
+    return new_widths
+
+
+def align_field(field:str, width:int, align='left') -> str:
+    if align == 'right':
+        return field.rjust(width)
+    if align == 'center':
+        return field.center(width)
+    return field.ljust(width)
+
+
+def fit_field(field:str, width:int, ellipsis='') -> str:
+    """Cut field to width, ending it with ellipsis if it was cut"""
+    if len(field) <= width:
+        return field
+    if ellipsis and width > len(ellipsis):
+        return field[:width - len(ellipsis)] + ellipsis
+    return field[:width]
+
+
 class TableList:
 
-    def __init__(self, sep='', sep_before_indices=[], field_border_l='[', field_border_r=']'):
+    def __init__(self,
+            sep='',
+            sep_before_indices=[],
+            field_border_l='[',
+            field_border_r=']',
+            ellipsis='',
+            field_aligns:list[str]=None):
         """
         ---
         Add rows with an equal number of fields, then print/get them as a
@@ -29,19 +151,27 @@ class TableList:
         Usage:
           tl = TableList()
           tl.add_row(...), tl.add_row(...), ...
-          tl.print() OR tl.get_formatted_rows()
+          tl.print() OR tl.get_formatted_rows() OR tl.iter_formatted_rows()
         ---
         Args:
             sep (default=''): inserted between fields.
             sep_before_indices (default=[]): if given, only places sep before these indices.
             field_border_l (default='['): prepended to fields.
             field_border_r (default=']'): appended to fields.
+            ellipsis (default=''): ends fields cut short by trimming.
+            field_aligns (default=None): 'left', 'right' or 'center' for
+                each field. All fields are left aligned if not given.
         """
         self.sep = sep
         self.sep_before_indices = sep_before_indices # list of indices, if len>0 places sep only before these
         self.field_border_l = field_border_l
         self.field_border_r = field_border_r
+        self.ellipsis = ellipsis
+        self.field_aligns = field_aligns
         self.rows:list[list[str]] = [] # list of rows, each row is a list of fields
+        self.field_widths:list[int]|None = None # set by trims, applied when formatting
+        self._trim_ellipsis = ellipsis # of the last trim, applied when formatting
+        self.max_lens:list[int]|None = None # see set_max_lens()
 
     def add_row(self, row: list):
         if self.rows and len(row) != len(self.rows[0]):
@@ -50,6 +180,10 @@ class TableList:
             raise Exception('Bad Parameter',
                 'Expected row of length {}, received row of length {}'.format(expected, actual))
         self.rows.append(row)
+
+    def add_rows(self, rows:Iterable[list]):
+        for row in rows:
+            self.add_row(row)
     
     def empty_row_len(self):
         num_fields = len(self.rows[0])
@@ -64,11 +198,24 @@ class TableList:
 
     def _trim__find_to_trim(self, max_table_width):
         empty_row_len = self.empty_row_len()
-        max_lens = self.find_max_lens()
+        max_lens = self.get_field_widths()
         current_table_len = empty_row_len + sum(max_lens)
         return current_table_len - max_table_width
 
-    def trim_fields(self, max_table_width, fields_to_trim:list[tuple[int, int]]=None):
+    def _trim__set_widths(self, new_max_lens, ellipsis):
+        """ellipsis is only for this trim, None for the table's own"""
+        self._trim_ellipsis = ellipsis if ellipsis != None else self.ellipsis
+        self.field_widths = new_max_lens
+
+    def clear_trim(self):
+        """Undo all trims, e.g. before re-fitting to a wider width"""
+        self.field_widths = None
+        self._trim_ellipsis = self.ellipsis
+
+    def trim_fields(self,
+            max_table_width,
+            fields_to_trim:list[tuple[int, int]]=None,
+            ellipsis=None):
         """
         Make table fit into a max width by trimming fields
         fields_to_trim: (field_index, min_width)
@@ -79,10 +226,7 @@ class TableList:
         """
         if not self.rows:
             return
-                
-        num_fields = len(self.rows[0])
-
-        max_lens = self.find_max_lens()
+        max_lens = self.get_field_widths()
         total_to_trim = self._trim__find_to_trim(max_table_width)
         if total_to_trim < 1:
             return
@@ -91,41 +235,78 @@ class TableList:
             to_trim = max_lens[i_field] - min_field_width
             if to_trim > total_to_trim:
                 to_trim = total_to_trim
+            if to_trim < 1:
+                continue
             new_max_lens[i_field] -= to_trim
             total_to_trim -= to_trim
             if total_to_trim < 1:
                 break
-        for row in self.rows:
-            for i_field in range(num_fields):
-                max_len = new_max_lens[i_field]
-                row[i_field] = row[i_field][:max_len]
+        self._trim__set_widths(new_max_lens, ellipsis)
     
-    def trim_longest(self, max_table_width):
-        max_lens = self.find_max_lens()
+    def trim_longest(self, max_table_width, min_widths:list[int]=None, ellipsis=None):
+        """
+        Make table fit into a max width by trimming the longest fields down
+        to a common width, never below min_widths if given.
+        """
+        if not self.rows:
+            return
         to_trim = self._trim__find_to_trim(max_table_width)
         if to_trim <= 0:
             return
+        max_lens = self.get_field_widths()
+        new_max_lens = solve_trim_longest(max_lens, to_trim, min_widths)
+        self._trim__set_widths(new_max_lens, ellipsis)
 
-        num_fields = len(self.rows[0])
+    def trim_proportional(self, max_table_width, min_widths:list[int]=None, ellipsis=None):
+        """
+        Make table fit into a max width by trimming every field in
+        proportion to its width above min_widths (default 0).
+        """
+        if not self.rows:
+            return
+        to_trim = self._trim__find_to_trim(max_table_width)
+        if to_trim <= 0:
+            return
+        max_lens = self.get_field_widths()
+        new_max_lens = solve_trim_proportional(max_lens, to_trim, min_widths)
+        self._trim__set_widths(new_max_lens, ellipsis)
+
+    def trim_priority(self,
+            max_table_width,
+            priorities:list[int],
+            min_widths:list[int]=None,
+            ellipsis=None):
+        """
+        Make table fit into a max width by trimming the fields with the
+        lowest priority first, down to min_widths (default 0). Fields of
+        equal priority are trimmed longest first.
+        """
+        if not self.rows:
+            return
+        to_trim = self._trim__find_to_trim(max_table_width)
+        if to_trim <= 0:
+            return
+        max_lens = self.get_field_widths()
+        new_max_lens = solve_trim_priority(max_lens, to_trim, priorities, min_widths)
+        self._trim__set_widths(new_max_lens, ellipsis)
 
-        longest = 0
-        for i in range(len(max_lens)):
-            if max_lens[i] > longest:
-                longest = max_lens[i]
-        max_col = longest
-        current_trim = 0
-        while current_trim < to_trim:
-            max_col -= 1
-            current_trim = 0
-            for max in max_lens:
-                if max > max_col:
-                    current_trim += max - max_col
-        for row in self.rows:
-            for i_field in range(num_fields):
-                if len(row[i_field]) > max_col:
-                    row[i_field] = row[i_field][:max_col]
+    def get_field_widths(self):
+        """Max field lengths, after trimming"""
+        max_lens = self.find_max_lens()
+        if self.field_widths != None:
+            max_lens = [min(a, b) for a, b in zip(max_lens, self.field_widths)]
+        return max_lens
+
+    def set_max_lens(self, max_lens:list[int]|None):
+        """
+        Use known max field lengths, e.g. kept up to date as rows change,
+        instead of finding them from every row. None finds them again.
+        """
+        self.max_lens = max_lens
 
     def find_max_lens(self):
+        if self.max_lens != None:
+            return list(self.max_lens)
         num_fields = len(self.rows[0])
         for row in self.rows:
             if len(row) != num_fields:
@@ -141,33 +322,64 @@ class TableList:
                     max_lens[i] = length
         return max_lens
 
+    def _field_prefixes(self, num_fields):
+        """sep (where it applies) + field_border_l, for each field index"""
+        prefixes = []
+        for i_field in range(num_fields):
+            if len(self.sep_before_indices):
+                sep = self.sep if i_field in self.sep_before_indices else ''
+            else:
+                sep = self.sep if i_field > 0 else ''
+            prefixes.append(sep + self.field_border_l)
+        return prefixes
+
     def format_table(self):
+        """Format every row in place. Prefer iter_formatted_rows() for output"""
         num_fields = len(self.rows[0])
-        max_lens = self.find_max_lens()
-
+        max_lens = self.get_field_widths()
+        prefixes = self._field_prefixes(num_fields)
+        border_r = self.field_border_r
+        ellipsis = self._trim_ellipsis
+        aligns = self.field_aligns or ['left'] * num_fields
         for row in self.rows:
             for i_field in range(num_fields):
-                field = row[i_field].ljust(max_lens[i_field])
+                max_len = max_lens[i_field]
+                field = fit_field(row[i_field], max_len, ellipsis)
+                field = align_field(field, max_len, aligns[i_field])
+                row[i_field] = prefixes[i_field] + field + border_r
+        self.clear_trim()
 
-                # set sep to use
-                if len(self.sep_before_indices):
-                    sep = self.sep if i_field in self.sep_before_indices else ''
-                else:
-                    sep = self.sep if i_field > 0 else ''
-                
-                row[i_field] = sep + self.field_border_l + field + self.field_border_r
+    def iter_formatted_rows(self) -> Iterator[str]:
+        """
+        Yield each row as a formatted string. Rows are not modified, so this
+        may be called any number of times.
+        """
+        if not self.rows:
+            return
+        max_lens = self.get_field_widths()
+        prefixes = self._field_prefixes(len(max_lens))
+        border_r = self.field_border_r
+        if self.field_widths == None and not self.field_aligns:
+            for row in self.rows:
+                yield ''.join([prefix + field.ljust(max_len) + border_r
+                    for prefix, field, max_len in zip(prefixes, row, max_lens)])
+            return
+        ellipsis = self._trim_ellipsis
+        aligns = self.field_aligns or ['left'] * len(max_lens)
+        for row in self.rows:
+            yield ''.join([
+                prefix + align_field(fit_field(field, max_len, ellipsis), max_len, align) + border_r
+                for prefix, field, max_len, align in zip(prefixes, row, max_lens, aligns)])
 
     def get_formatted_rows(self) -> list:
-        self.format_table()
-        row_strings = []
-        for row in self.rows:
-            row_strings.append(''.join(row))
-        return row_strings
+        return list(self.iter_formatted_rows())
+
+    def write_to(self, stream, buffer_rows=1024):
+        """Write formatted rows to a text stream, buffer_rows lines per write"""
+        _write_lines(stream, self.iter_formatted_rows(), buffer_rows)
 
     def print(self):
-        rows = self.get_formatted_rows()
-        for row in rows:
-            print(row)
+        self.write_to(sys.stdout)
 
 
 cmd_width = 120
@@ -211,47 +423,60 @@ class PrintColumn:
         for k, v in d.items():
             self.add_row([k, v])
 
-    def print(self):
-        for row in self.rows:
-            print(row)
+    def write_to(self, stream, buffer_rows=1024):
+        """Write rows to a text stream, buffer_rows lines per write"""
+        _write_lines(stream, (str(row) for row in self.rows), buffer_rows)
 
-    def print_section(columns: list, max_table_width=cmd_width, sep=' | '):
+    def print(self):
+        self.write_to(sys.stdout)
+
+    def _iter_fields(column) -> Iterator[list]:
+        """Iterate a PrintColumn or an iterable of rows as lists of fields"""
+        if isinstance(column, PrintColumn):
+            if column.num_fields:
+                return iter(column.rows)
+            return ([row] for row in column.rows)
+        return ([row] if isinstance(row, str) or not isinstance(row, Iterable)
+            else [str(field) for field in row] for row in column)
+
+    def print_section(columns: list,
+            max_table_width=cmd_width,
+            sep=' | ',
+            stream=None):
         """
         ---
         Print PrintColumn objects side-by-side
         
         ---
         Args:
-            columns: list of PrintColumn objects
+            columns: list of PrintColumn objects, or iterables of rows.
+                Columns are read once and left unmodified, shorter
+                columns are filled with blank fields as rows are joined.
+            stream (default=sys.stdout): text stream to write to
         """
-        longest_col = 0
-        for col in columns:
-            if len(col.rows) > longest_col:
-                longest_col = len(col.rows)
-        for col in columns:
-            for i in range(longest_col - len(col.rows)):
-                col.add_blank_row()
-
-        column_count = len(columns)
-        row_count = len(columns[0].rows)
-        tl_rows = []
-        for i_row in range(row_count):
-            tl_row = []
-            for i_col in range(column_count):
-                if columns[i_col].num_fields:
-                    for field in columns[i_col][i_row]:
-                        tl_row.append(field)
-                else:
-                    tl_row.append(columns[i_col][i_row])
-            tl_rows.append(tl_row)
-        
-        # Create Borders between columns
+        iters = []
         field_counts = []
-        for pcol in columns:
-            if pcol.num_fields:
-                field_counts.append(len(pcol.rows[0]))
+        for col in columns:
+            it = PrintColumn._iter_fields(col)
+            first = next(it, None)
+            if first is not None:
+                field_counts.append(len(first))
+                it = chain([first], it)
+            elif isinstance(col, PrintColumn):
+                field_counts.append(col.num_fields or 1)
             else:
                 field_counts.append(1)
+            iters.append(it)
+        blanks = [[''] * count for count in field_counts]
+
+        def iter_tl_rows():
+            for parts in zip_longest(*iters):
+                tl_row = []
+                for i_col, fields in enumerate(parts):
+                    tl_row.extend(blanks[i_col] if fields is None else fields)
+                yield tl_row
+        
+        # Create Borders between columns
         sep_before_indices = []
         i = 0
         for field_count in field_counts:
@@ -262,16 +487,16 @@ class PrintColumn:
         # format columns
         tl = TableList(field_border_l='', field_border_r='', sep=sep, 
             sep_before_indices=sep_before_indices)
-        for tl_row in tl_rows:
-            tl.add_row(tl_row)
+        tl.add_rows(iter_tl_rows())
         tl.trim_longest(max_table_width)
-        tl.print()
+        tl.write_to(stream if stream is not None else sys.stdout)
 
     def split_print_section(self,
             column_count,
             max_table_width=cmd_width,
             split_type='alternate',
-            sep=' | '):
+            sep=' | ',
+            stream=None):
         """
         ---
         Split the column into multiple columns, then print them side-by-side
@@ -282,24 +507,24 @@ class PrintColumn:
             split_type: alternate/divide
                 alternate: every other row
                 divide: divide evenly
+            stream (default=sys.stdout): text stream to write to
         """
         columns = []
         row_count = len(self.rows)
+        if self.num_fields:
+            rows = self.rows
+        else:
+            rows = [[row] for row in self.rows]
 
-        # create PrintColumns to split into
-        for i in range(column_count):
-            columns.append(PrintColumn(num_fields=self.num_fields))
-            current = 0
-            r = range(row_count)
-        
-        # split columns
+        # split columns as lazy slices of rows
         if split_type == 'alternate':
-            for i in r:
-                columns[i % column_count].add_row(self.rows[i])
-                current = (current + 1) % column_count
+            for i in range(column_count):
+                columns.append(islice(rows, i, None, column_count))
         elif split_type == 'divide':
             rows_per_col = math.ceil(row_count / column_count)
-            for i in r:
-                columns[int(i / rows_per_col)].add_row(self.rows[i])
+            for i in range(column_count):
+                start = i * rows_per_col
+                columns.append(islice(rows, start, start + rows_per_col))
         
-        return PrintColumn.print_section(columns, max_table_width=max_table_width, sep=sep)
+        return PrintColumn.print_section(columns,
+            max_table_width=max_table_width, sep=sep, stream=stream)
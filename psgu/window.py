@@ -85,6 +85,9 @@ class AbstractWindow(EventManager, GuiElementLayoutManager):
     def init_window_finalized(self, window:sg.Window):
         self.gem.for_ges_init_window_finalized(window)
 
+    def window_closed(self, window:sg.Window):
+        self.gem.for_ges_window_closed(window)
+
     # Other
 
     @abstractmethod
@@ -195,6 +198,7 @@ class AbstractBlockingWindow(AbstractWindow, WindowContext.iBlockingWindow):
         psgu_sg.center_window(self.window)
         event_loop = EventLoop(self)
         rv = event_loop.run(window_context)
+        self.window_closed(self.window)
         rv.closed_window()
 
         # save if successful
@@ -245,6 +249,7 @@ class AbstractAsyncWindow(AbstractWindow, WindowContext.iAsyncWindow):
         if not self.window:
             return
         self.window.close()
+        self.window_closed(self.window)
         self.window = None
         window_context.remove_async(self.window_id)
     
@@ -269,10 +274,14 @@ class ProgressWindow(AbstractAsyncWindow):
     
     def __init__(
             self, window_id, title='Progress', header='Progress', 
-            no_meter=False, no_text=False) -> None:
+            no_meter=False, no_text=False, cancelable=False) -> None:
+        """cancelable: show a Cancel button, see is_cancelled()"""
         self.header = header
         self.is_progress_visible = (not no_meter)
         self.is_out_visible = (not no_text)
+        self.cancelable = cancelable
+        self.cancelled = False
+        self.user_closed = False
         super().__init__(window_id, title)
     
     ### NBWindow
@@ -290,11 +299,17 @@ class ProgressWindow(AbstractAsyncWindow):
             sg.Progress(1000, orientation='h', size=(1, 15),
                 expand_x=True, key=self.keys['Progress'])
         ])
+        if self.cancelable:
+            layout.append([
+                sg.Push(),
+                sg.Button('Cancel', key=self.keys['Cancel'])
+            ])
         return layout
 
     def define_keys(self):
         self.add_key('Out')
         self.add_key('Progress')
+        self.add_key('Cancel')
         
     def define_events(self):
         super().define_events()
@@ -304,6 +319,17 @@ class ProgressWindow(AbstractAsyncWindow):
     def __getitem__(self, key_name):
         return self.keys[key_name]
     
+    def update(self):
+        event, values = self.window.read(10)
+        if event == sg.WIN_CLOSED:
+            self.user_closed = True
+        if event in (self.keys['Cancel'], sg.WIN_CLOSED):
+            self.cancelled = True
+    
+    def is_cancelled(self):
+        """True once Cancel is pressed or the window is closed"""
+        return self.cancelled
+    
     def update_progress(self, progress:float):
         self.window[self.keys['Progress']].UpdateBar(progress * 1000)
     
@@ -314,6 +340,8 @@ class ProgressWindow(AbstractAsyncWindow):
         self.window[self.keys['Out']].print(text)
     
     def progress_function(self, append_text=None, progress=None):
+        if self.user_closed:
+            return
         if append_text:
             self.append_text(append_text)
         if progress:
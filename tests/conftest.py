@@ -0,0 +1,77 @@
+import os
+import stat
+
+import pytest
+
+
+def make_tree(root):
+    """
+    A small tree with nested folders, empty folders and files, a
+    hardlinked file and a symlink. Returns root.
+    """
+    files = {
+        'a/one.txt': 10,
+        'a/two.log': 200,
+        'a/b/three.txt': 3000,
+        'a/b/c/four.bin': 40000,
+        'a/b/c/five.log': 5,
+        'd/six.txt': 600,
+        'skip/seven.txt': 70,
+        'skip/deep/eight.log': 8,
+        'nine.txt': 9,
+    }
+    for rel_path, size in files.items():
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+    os.makedirs(os.path.join(root, 'empty', 'inner'))
+    os.link(os.path.join(root, 'a', 'b', 'c', 'four.bin'), os.path.join(root, 'd', 'four_link.bin'))
+    os.symlink(os.path.join(root, 'a'), os.path.join(root, 'd', 'a_symlink'))
+    return str(root)
+
+
+def walk_aggregates(root, is_excluded=None):
+    """
+    (size, folder_count, file_count, excluded_size, excluded_folder_count,
+    excluded_file_count) of root's descendants from os.walk(), as a VFS
+    should find them: symlinks aren't followed or counted, and hardlinked
+    files' bytes are counted once. is_excluded(path) excludes a path and
+    everything below it.
+    """
+    size = folders = files = exc_size = exc_folders = exc_files = 0
+    inodes = set()
+    excluded_dirs = set()
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_excluded = dir_path in excluded_dirs
+        for name in dir_names + file_names:
+            path = os.path.join(dir_path, name)
+            st = os.lstat(path)
+            excluded = dir_excluded or (is_excluded != None and is_excluded(path))
+            if stat.S_ISDIR(st.st_mode):
+                folders += 1
+                if excluded:
+                    exc_folders += 1
+                    excluded_dirs.add(path)
+            elif stat.S_ISREG(st.st_mode):
+                files += 1
+                key = (st.st_dev, st.st_ino)
+                file_size = st.st_size if key not in inodes else 0
+                inodes.add(key)
+                size += file_size
+                if excluded:
+                    exc_files += 1
+                    exc_size += file_size
+    return size, folders, files, exc_size, exc_folders, exc_files
+
+
+def get_aggregates(entry):
+    """The VFS entry's aggregates in walk_aggregates() order"""
+    return (entry.get_size(), entry.get_folder_count(), entry.get_file_count(),
+        entry.get_excluded_size(), entry.get_excluded_folder_count(),
+        entry.get_excluded_file_count())
+
+
+@pytest.fixture
+def tree(tmp_path):
+    return make_tree(tmp_path / 'tree')
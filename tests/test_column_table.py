@@ -0,0 +1,66 @@
+import io
+
+from psgu.text.column_table import ColumnTable, format_bytes, format_number
+
+
+def make_table():
+    ct = ColumnTable(sep=' ')
+    ct.add_column('Name')
+    ct.add_column('Size', format_number(), 'right', 'q')
+    ct.add_rows([['b', 20], ['a', 300], ['c', 1], ['d', 20]])
+    return ct
+
+
+def test_sort_is_stable_and_by_raw_values():
+    ct = make_table()
+    ct.sort_by('Size', reverse=True)
+    assert [ct.get_row(i) for i in range(len(ct))] \
+        == [['a', 300], ['b', 20], ['d', 20], ['c', 1]]
+    ct.sort_by(0)
+    assert [ct.get_row(i)[0] for i in range(len(ct))] == ['a', 'b', 'c', 'd']
+    ct.clear_sort()
+    assert ct.get_row(0) == ['b', 20]
+
+
+def test_rows_added_after_sort_go_last():
+    ct = make_table()
+    ct.sort_by('Size')
+    ct.add_row(['e', 0])
+    assert ct.get_row(len(ct) - 1) == ['e', 0]
+
+
+def test_slices_format_only_their_rows():
+    ct = make_table()
+    calls = []
+    def formatter(value):
+        calls.append(value)
+        return str(value)
+    ct.columns[1].formatter = formatter
+    ct.sort_by('Size')
+    rows = ct.get_formatted_rows(1, 3)
+    assert sorted(calls) == [20, 20]
+    assert len(rows) == 3 # header and two rows
+    assert rows[0].startswith('[Name]')
+    assert rows[1].rstrip().endswith('20]')
+
+
+def test_slices_match_the_whole_table():
+    ct = make_table()
+    whole = ct.get_formatted_rows(headers=False)
+    for start in range(len(ct)):
+        for stop in range(start, len(ct) + 2):
+            part = ct.get_formatted_rows(start, stop, headers=False)
+            assert [line.split()[0] for line in part] \
+                == [line.split()[0] for line in whole[start:stop]]
+
+
+def test_write_to_and_formatters():
+    ct = ColumnTable()
+    ct.add_column('Bytes', format_bytes(), 'right')
+    ct.add_row([1536])
+    stream = io.StringIO()
+    ct.write_to(stream)
+    lines = stream.getvalue().splitlines()
+    assert lines[0] == '[   Bytes]'
+    assert lines[1].endswith('KB]')
+    assert format_number(2, True)(1234.5) == '1,234.50'
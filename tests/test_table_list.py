@@ -0,0 +1,119 @@
+import io
+import random
+
+from psgu.text.utils import (PrintColumn, TableList, solve_trim_longest,
+    solve_trim_priority, solve_trim_proportional)
+
+
+def make_table(rows=5):
+    tl = TableList(sep=' ')
+    tl.add_row(['Name', 'Size'])
+    for i in range(rows):
+        tl.add_row(['file{}'.format(i) * (i + 1), str(i * 100)])
+    return tl
+
+
+def test_iter_formatted_rows_leaves_rows_unmodified():
+    tl = make_table()
+    rows_before = [list(row) for row in tl.rows]
+    first = list(tl.iter_formatted_rows())
+    second = list(tl.iter_formatted_rows())
+    assert first == second == tl.get_formatted_rows()
+    assert tl.rows == rows_before
+    assert len({len(line) for line in first}) == 1
+
+
+def test_write_to_matches_formatted_rows_for_any_buffer_size():
+    tl = make_table(10)
+    expected = ''.join([line + '\n' for line in tl.get_formatted_rows()])
+    for buffer_rows in (1, 3, 11, 1024):
+        stream = io.StringIO()
+        tl.write_to(stream, buffer_rows)
+        assert stream.getvalue() == expected
+
+
+def test_empty_table_writes_nothing():
+    stream = io.StringIO()
+    TableList().write_to(stream)
+    assert stream.getvalue() == ''
+
+
+def test_print_section_reads_generators_once():
+    left = PrintColumn(2)
+    left.add_dict({'a': 1, 'b': 2, 'c': 3})
+    right = (['row{}'.format(i)] for i in range(5))
+    stream = io.StringIO()
+    PrintColumn.print_section([left, right], max_table_width=80, stream=stream)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith('a') and lines[0].rstrip().endswith('row0')
+    assert lines[4].rstrip().endswith('row4')
+    # the shorter column is padded, and left as it was
+    assert len(left.rows) == 3
+
+
+def test_print_column_write_to():
+    column = PrintColumn(0)
+    column.add_row('x')
+    column.add_row('y')
+    stream = io.StringIO()
+    column.write_to(stream, buffer_rows=1)
+    assert stream.getvalue() == 'x\ny\n'
+
+
+# Trimming
+
+def brute_trim_longest(widths, to_trim, min_widths):
+    for cap in range(max(widths), -1, -1):
+        new_widths = [min(w, max(cap, m)) for w, m in zip(widths, min_widths)]
+        if sum(widths) - sum(new_widths) >= to_trim:
+            return new_widths
+    return [min(w, m) for w, m in zip(widths, min_widths)]
+
+
+def test_solve_trim_longest_matches_brute_force():
+    rng = random.Random(3)
+    for _ in range(500):
+        n = rng.randint(1, 6)
+        widths = [rng.randint(0, 40) for _ in range(n)]
+        min_widths = [rng.randint(0, 10) for _ in range(n)]
+        to_trim = rng.randint(0, sum(widths) + 5)
+        assert solve_trim_longest(widths, to_trim, min_widths) \
+            == brute_trim_longest(widths, to_trim, min_widths)
+
+
+def test_solve_trim_proportional():
+    assert solve_trim_proportional([10, 30], 8) == [8, 24]
+    new_widths = solve_trim_proportional([10, 21, 5], 7, [2, 2, 5])
+    assert sum([10, 21, 5]) - sum(new_widths) == 7
+    assert all([w >= m for w, m in zip(new_widths, [2, 2, 5])])
+    # more than there is to take leaves every column at its min
+    assert solve_trim_proportional([10, 30], 100, [3, 4]) == [3, 4]
+
+
+def test_solve_trim_priority():
+    # lowest priority first, then the next
+    assert solve_trim_priority([20, 20, 20], 5, [2, 1, 3]) == [20, 15, 20]
+    assert solve_trim_priority([20, 20, 20], 25, [2, 1, 3], [0, 5, 0]) == [10, 5, 20]
+    # equal priorities are trimmed longest first
+    assert solve_trim_priority([30, 10], 10, [1, 1]) == [20, 10]
+
+
+def test_trims_fit_the_table_width():
+    for trim in ('trim_longest', 'trim_proportional'):
+        tl = make_table(10)
+        getattr(tl, trim)(30)
+        assert {len(line) for line in tl.iter_formatted_rows()} == {30}
+    tl = make_table(10)
+    tl.trim_priority(30, [1, 2])
+    assert {len(line) for line in tl.iter_formatted_rows()} == {30}
+
+
+def test_trim_ellipsis_is_per_call():
+    tl = TableList()
+    tl.add_row(['abcdefghij', 'x'])
+    tl.trim_fields(8, [(0, 3)], ellipsis='..')
+    assert tl.get_formatted_rows() == ['[a..][x]']
+    tl.clear_trim()
+    tl.trim_fields(8, [(0, 3)])
+    assert tl.get_formatted_rows() == ['[abc][x]']
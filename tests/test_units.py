@@ -0,0 +1,20 @@
+from psgu.data import units as unit
+
+
+def best(n, **kwargs):
+    return unit.Bytes(n, unit.Bytes.B).get_best(**kwargs)
+
+
+def test_whole_numbers_keep_their_zeros():
+    assert best(10) == '10 B'
+    assert best(100) == '100 B'
+    assert best(0) == '0 B'
+    assert best(2048) == '2 KB'
+    assert best(1536) == '1.5 KB'
+
+
+def test_negative_values_use_the_same_unit_as_positive():
+    for n in (10, 1536, 5 * 1024 ** 2, 3 * 1024 ** 3):
+        assert best(-n) == '-' + best(n)
+    value, symbol = unit.Bytes(-5 * 1024 ** 2, unit.Bytes.B).find_best()
+    assert (value, symbol) == (-5, unit.Bytes(5 * 1024 ** 2, unit.Bytes.B).find_best()[1])
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+@pytest.mark.parametrize('make_vfs', [
+    lambda: VirtualFS(),
+    lambda: VirtualFS(scan_workers=4),
+    lambda: CompactVirtualFS(),
+], ids=['serial', 'parallel', 'compact'])
+def test_aggregates_match_os_walk(tree, make_vfs):
+    vfs = make_vfs()
+    root = vfs.add_path(tree)
+    assert get_aggregates(root) == walk_aggregates(tree)
+    # which link of a hardlinked file counts its bytes depends on scan order,
+    # so below the root only the counts are compared
+    for dir_path, _, _ in os.walk(tree):
+        assert get_aggregates(vfs.find_entry(dir_path))[1:] == walk_aggregates(dir_path)[1:]
+
+
+def test_lazy_aggregates_match_os_walk(tree):
+    vfs = VirtualFS(lazy=True)
+    root = vfs.add_path(tree)
+    vfs.materialize(root, recurse=True)
+    assert get_aggregates(root) == walk_aggregates(tree)
+
+
+def test_refresh_aggregates_only_touches_changed_entries(tree):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    versions = {entry.path: (entry.version, entry.children_version) for entry in root.walk()}
+    root.refresh_aggregates(restat=True)
+    assert {entry.path: (entry.version, entry.children_version) for entry in root.walk()} == versions
+
+    with open(os.path.join(tree, 'a', 'b', 'three.txt'), 'ab') as f:
+        f.write(b'y' * 7)
+    root.refresh_aggregates(restat=True)
+    changed = {path for path, (version, _) in versions.items()
+        if vfs.find_entry(path).version != version}
+    assert changed == {tree, os.path.join(tree, 'a'), os.path.join(tree, 'a', 'b'),
+        os.path.join(tree, 'a', 'b', 'three.txt')}
+    assert get_aggregates(root) == walk_aggregates(tree)
+
+
+def test_changes_update_aggregates_without_stats(tree, monkeypatch):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    excluded = {os.path.join(tree, 'd', 'six.txt'), os.path.join(tree, 'nine.txt')}
+    resized = os.path.join(tree, 'a', 'one.txt')
+    with open(resized, 'ab') as f:
+        f.write(b'y' * 90)
+
+    def no_stat(*args, **kwargs):
+        raise AssertionError('aggregates should be updated from deltas')
+    for name in ['stat', 'lstat', 'scandir']:
+        monkeypatch.setattr(os, name, no_stat)
+    vfs.remove(os.path.join(tree, 'skip'))
+    vfs.remove(os.path.join(tree, 'a', 'two.log'))
+    for path in excluded:
+        vfs.find_entry(path).set_excluded(True)
+    vfs.find_entry(resized).set_size(100)
+    monkeypatch.undo()
+
+    shutil.rmtree(os.path.join(tree, 'skip'))
+    os.remove(os.path.join(tree, 'a', 'two.log'))
+    assert get_aggregates(root) == walk_aggregates(tree, lambda path: path in excluded)
+    for dir_path, _, _ in os.walk(tree):
+        assert get_aggregates(vfs.find_entry(dir_path))[1:] \
+            == walk_aggregates(dir_path, lambda path: path in excluded)[1:]
@@ -0,0 +1,75 @@
+import gzip
+import json
+import os
+
+from psgu.fs import VFSCache, VFSExport, VirtualFS
+
+from conftest import walk_aggregates
+
+
+def get_records(vfs):
+    return list(VFSExport.iter_records(vfs))
+
+
+def test_cache_round_trip(tree, tmp_path):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    cache_path = str(tmp_path / 'tree.cache')
+    VFSCache(cache_path).save(vfs)
+    loaded = VirtualFS()
+    assert VFSCache(cache_path).load(loaded)
+    assert get_records(loaded) == get_records(vfs)
+
+
+def test_cache_revalidates_after_changes(tree, tmp_path):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    cache_path = str(tmp_path / 'tree.cache')
+    VFSCache(cache_path).save(vfs)
+    with open(os.path.join(tree, 'd', 'new.txt'), 'wb') as f:
+        f.write(b'y' * 123)
+    os.remove(os.path.join(tree, 'a', 'one.txt'))
+    loaded = VirtualFS()
+    VFSCache(cache_path).load(loaded)
+    root = loaded.find_entry(tree)
+    loaded.materialize(root, recurse=True)
+    size, folders, files, _, _, _ = walk_aggregates(tree)
+    assert (root.get_size(), root.get_folder_count(), root.get_file_count()) \
+        == (size, folders, files)
+
+
+def test_missing_cache_loads_nothing(tmp_path):
+    vfs = VirtualFS()
+    assert not VFSCache(str(tmp_path / 'missing.cache')).load(vfs)
+    assert vfs.get_root_entries() == []
+
+
+def test_unusable_cache_loads_nothing(tree, tmp_path):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    cache_path = str(tmp_path / 'tree.cache')
+    VFSCache(cache_path).save(vfs)
+    with gzip.open(cache_path, 'rb') as gz:
+        data = json.loads(gz.read())
+    data['version'] = VFSCache.version - 1
+    with gzip.open(cache_path, 'wb') as gz:
+        gz.write(json.dumps(data).encode('utf-8'))
+    assert not VFSCache(cache_path).load(VirtualFS())
+    with open(cache_path, 'wb') as f:
+        f.write(b'not gzip')
+    assert not VFSCache(cache_path).load(VirtualFS())
+
+
+def test_loaded_folders_revalidate_when_opened(tree, tmp_path):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    cache_path = str(tmp_path / 'tree.cache')
+    VFSCache(cache_path).save(vfs)
+    loaded = VirtualFS()
+    VFSCache(cache_path).load(loaded)
+    folder = loaded.find_entry(os.path.join(tree, 'a'))
+    assert folder.stale
+    loaded.materialize(folder)
+    assert not folder.stale
+    # only the opened folder was checked
+    assert loaded.find_entry(os.path.join(tree, 'a', 'b')).stale
@@ -0,0 +1,116 @@
+import os
+import time
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VFSRule, VFSRuleSet, VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+def make_rules():
+    return VFSRuleSet([VFSRule(glob='*.log'), VFSRule(glob='skip', entry_type='dir')])
+
+
+def get_rows(vfs):
+    """
+    path -> what a CompactVirtualFS and a VirtualFS of the same tree
+    should agree on. Which link of a hardlinked file counts its bytes
+    depends on scan order, so folder sizes are left out.
+    """
+    rows = {}
+    for root in vfs.get_root_entries():
+        for entry in root.walk():
+            size = None
+            if entry.is_file() and os.lstat(entry.path).st_nlink == 1:
+                size = entry.get_size()
+            rows[entry.path] = (entry.entry_type, size, entry.get_folder_count(),
+                entry.get_file_count(), entry.get_excluded_folder_count(),
+                entry.get_excluded_file_count(), entry.is_excluded())
+    return rows
+
+
+def check_matches_fresh_scan(compact, tree):
+    vfs = VirtualFS()
+    vfs.set_rules(make_rules())
+    vfs.add_path(tree)
+    assert get_rows(compact) == get_rows(vfs)
+    assert get_aggregates(compact.find_entry(tree))[:3] == walk_aggregates(tree)[:3]
+
+
+def change_tree(tree):
+    """Add, remove and resize entries. Returns the paths changed."""
+    # folder mtimes must differ from the scan's
+    time.sleep(0.01)
+    new_file = os.path.join(tree, 'a', 'b', 'new.txt')
+    with open(new_file, 'wb') as f:
+        f.write(b'z' * 77)
+    new_folder = os.path.join(tree, 'd', 'new_dir')
+    os.makedirs(os.path.join(new_folder, 'inner'))
+    with open(os.path.join(new_folder, 'inner', 'deep.log'), 'wb') as f:
+        f.write(b'z' * 5)
+    resized = os.path.join(tree, 'a', 'one.txt')
+    with open(resized, 'ab') as f:
+        f.write(b'z' * 1000)
+    removed = os.path.join(tree, 'skip', 'deep', 'eight.log')
+    os.remove(removed)
+    return [new_file, new_folder, resized, removed]
+
+
+def test_compact_matches_virtual_fs(tree):
+    compact = CompactVirtualFS()
+    compact.set_rules(make_rules())
+    compact.add_path(tree)
+    check_matches_fresh_scan(compact, tree)
+
+
+@pytest.mark.parametrize('check_files', [True, False])
+def test_rescan_is_incremental(tree, check_files):
+    compact = CompactVirtualFS()
+    compact.set_rules(make_rules())
+    compact.add_path(tree)
+    rows = len(compact)
+    change_tree(tree)
+    assert compact.rescan(tree, check_files)
+    if not check_files:
+        # editing a file doesn't change its folder's mtime
+        compact.rescan(os.path.join(tree, 'a', 'one.txt'))
+    # only the new entries got rows
+    assert len(compact) == rows + 4
+    check_matches_fresh_scan(compact, tree)
+
+
+def test_apply_changes(tree):
+    compact = CompactVirtualFS()
+    compact.set_rules(make_rules())
+    compact.add_path(tree)
+    rows = len(compact)
+    changed = compact.apply_changes(change_tree(tree))
+    assert {entry.path for entry in changed} == {
+        os.path.join(tree, 'a', 'b'), os.path.join(tree, 'd'),
+        os.path.join(tree, 'a', 'one.txt'), os.path.join(tree, 'skip', 'deep')}
+    assert len(compact) == rows + 4
+    check_matches_fresh_scan(compact, tree)
+
+
+def test_add_path_absorbs_roots_below(tree):
+    compact = CompactVirtualFS()
+    compact.set_rules(make_rules())
+    compact.add_path(os.path.join(tree, 'a', 'b'))
+    compact.add_path(os.path.join(tree, 'd'))
+    compact.add_path(tree)
+    assert [root.path for root in compact.get_root_entries()] == [tree]
+    check_matches_fresh_scan(compact, tree)
+
+
+def test_add_path_under_root(tree):
+    compact = CompactVirtualFS()
+    compact.set_rules(make_rules())
+    compact.add_path(tree)
+    file_count = compact.find_entry(tree).get_file_count()
+    new_file = change_tree(tree)[0]
+    entry = compact.add_path(new_file)
+    assert entry != None and entry.path == new_file
+    assert [root.path for root in compact.get_root_entries()] == [tree]
+    # only the folder above it was synced
+    assert compact.find_entry(tree).get_file_count() == file_count + 1
@@ -0,0 +1,61 @@
+import os
+import shutil
+
+from psgu.fs import VFSDiff, VFSDiffEntry, VirtualFS
+
+from conftest import walk_aggregates
+
+
+def scan(path):
+    vfs = VirtualFS()
+    vfs.add_path(path)
+    return vfs
+
+
+def test_diff_of_unchanged_trees_is_empty(tree):
+    diff = VFSDiff(scan(tree), scan(tree))
+    result = diff.compare()
+    assert result.get_root_entries() == []
+    assert (diff.added, diff.removed, diff.resized, diff.modified, diff.replaced) == (0, 0, 0, 0, 0)
+
+
+def test_diff_counts_and_size(tree):
+    old_vfs = scan(tree)
+    old_size = walk_aggregates(tree)[0]
+    with open(os.path.join(tree, 'd', 'new.txt'), 'wb') as f:
+        f.write(b'y' * 50)
+    os.remove(os.path.join(tree, 'a', 'one.txt'))
+    with open(os.path.join(tree, 'a', 'b', 'three.txt'), 'ab') as f:
+        f.write(b'z' * 7)
+    os.remove(os.path.join(tree, 'nine.txt'))
+    os.makedirs(os.path.join(tree, 'nine.txt'))
+    shutil.rmtree(os.path.join(tree, 'skip'))
+    new_vfs = scan(tree)
+    new_size = walk_aggregates(tree)[0]
+
+    for prune in (True, False):
+        diff = VFSDiff(old_vfs, new_vfs, prune)
+        result = diff.compare()
+        assert diff.added == 1
+        # one.txt, and skip with its folder and both files
+        assert diff.removed == 1 + 4
+        assert diff.resized == 1
+        assert diff.replaced == 1
+        assert diff.size_delta == new_size - old_size
+        root = result.find_entry(tree)
+        assert root.get_size() == new_size - old_size
+        assert result.find_entry(os.path.join(tree, 'nine.txt')).change \
+            == VFSDiffEntry.changes.REPLACED
+        assert result.find_entry(os.path.join(tree, 'd', 'six.txt')) == None
+
+
+def test_change_strings(tree):
+    old_vfs = scan(tree)
+    with open(os.path.join(tree, 'a', 'b', 'c', 'four.bin'), 'r+b') as f:
+        f.truncate(1536)
+    os.remove(os.path.join(tree, 'nine.txt'))
+    result = VFSDiff(old_vfs, scan(tree)).compare()
+    resized = result.find_entry(os.path.join(tree, 'a', 'b', 'c', 'four.bin'))
+    assert resized.get_change_string() == 'Resized: 39.06 KB -> 1.5 KB (-37.56 KB)'
+    removed = result.find_entry(os.path.join(tree, 'nine.txt'))
+    assert removed.get_change_string() == 'Removed: 9 B -> 0 B (-9 B)'
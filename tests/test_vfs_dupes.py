@@ -0,0 +1,112 @@
+import hashlib
+import os
+import random
+from collections import defaultdict
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VFSDupeFinder, VirtualFS
+from psgu.fs.vfs_scanner import CancelToken
+
+
+def make_dupes(root):
+    """
+    Files sharing contents, sizes or heads and tails, so each stage of
+    VFSDupeFinder has something to rule out
+    """
+    rng = random.Random(5)
+    big = bytes(rng.getrandbits(8) for _ in range(3000))
+    middle_changed = big[:1500] + b'!' + big[1501:]
+    contents = {
+        'one/a.bin': big,
+        'two/a_copy.bin': big,
+        'two/deep/a_copy2.bin': big,
+        'one/middle.bin': middle_changed,
+        'small1.txt': b'hello',
+        'one/small2.txt': b'hello',
+        'other_small.txt': b'world',
+        'unique.bin': big[:2999],
+        'empty1': b'',
+        'empty2': b'',
+    }
+    for rel_path, data in contents.items():
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    os.link(os.path.join(root, 'one', 'a.bin'), os.path.join(root, 'a_link.bin'))
+    return str(root)
+
+
+def brute_force_groups(root, min_size=1):
+    """Groups of paths with the same contents, hardlinks counted once"""
+    by_digest = defaultdict(list)
+    inodes = set()
+    for dir_path, _, file_names in os.walk(root):
+        for name in sorted(file_names):
+            path = os.path.join(dir_path, name)
+            st = os.lstat(path)
+            if st.st_size < min_size or (st.st_dev, st.st_ino) in inodes:
+                continue
+            inodes.add((st.st_dev, st.st_ino))
+            with open(path, 'rb') as f:
+                by_digest[hashlib.sha256(f.read()).digest()].append(path)
+    return [group for group in by_digest.values() if len(group) > 1]
+
+
+@pytest.mark.parametrize('make_vfs', [VirtualFS, CompactVirtualFS], ids=['vfs', 'compact'])
+@pytest.mark.parametrize('partial_bytes', [0, 100, 1 << 16])
+def test_matches_brute_force(tmp_path, make_vfs, partial_bytes):
+    root = make_dupes(tmp_path / 'dupes')
+    vfs = make_vfs()
+    vfs.add_path(root)
+    finder = VFSDupeFinder(workers=3, partial_bytes=partial_bytes, chunk_bytes=512)
+    groups = finder.find(vfs)
+    expected = brute_force_groups(root)
+    assert sorted([len(g) for g in groups]) == sorted([len(g) for g in expected])
+    small = {os.path.join(root, 'small1.txt'), os.path.join(root, 'one', 'small2.txt')}
+    assert small in [{entry.path for entry in group} for group in groups]
+    # most wasted bytes first, paths in order
+    wasted = [VFSDupeFinder.get_wasted_size(group) for group in groups]
+    assert wasted == sorted(wasted, reverse=True)
+    for group in groups:
+        paths = [entry.path for entry in group]
+        assert paths == sorted(paths)
+
+
+def test_min_size_and_path(tmp_path):
+    root = make_dupes(tmp_path / 'dupes')
+    vfs = VirtualFS()
+    vfs.add_path(root)
+    groups = VFSDupeFinder(min_size=100).find(vfs)
+    assert [len(group) for group in groups] == [3]
+    groups = VFSDupeFinder().find(vfs, os.path.join(root, 'two'))
+    assert [sorted([entry.name for entry in group]) for group in groups] \
+        == [['a_copy.bin', 'a_copy2.bin']]
+
+
+def test_unreadable_files_are_skipped(tmp_path, monkeypatch):
+    root = make_dupes(tmp_path / 'dupes')
+    vfs = VirtualFS()
+    vfs.add_path(root)
+    hash_file = VFSDupeFinder.hash_file
+    def failing_hash_file(path, *args):
+        if path.endswith('small2.txt'):
+            raise PermissionError(13, 'Permission denied', path)
+        return hash_file(path, *args)
+    monkeypatch.setattr(VFSDupeFinder, 'hash_file', failing_hash_file)
+    finder = VFSDupeFinder()
+    progress = list(finder.iter_find(vfs))[-1]
+    assert progress.done and progress.errors == 1
+    assert [len(group) for group in finder.groups] == [3]
+
+
+def test_cancelled_find_has_no_groups(tmp_path):
+    root = make_dupes(tmp_path / 'dupes')
+    vfs = VirtualFS()
+    vfs.add_path(root)
+    cancel_token = CancelToken()
+    cancel_token.cancel()
+    finder = VFSDupeFinder()
+    progress = list(finder.iter_find(vfs, cancel_token=cancel_token))[-1]
+    assert progress.cancelled and finder.groups == []
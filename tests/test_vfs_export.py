@@ -0,0 +1,76 @@
+import io
+import json
+import os
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VFSExport, VirtualFS
+
+from conftest import walk_aggregates
+
+
+def get_records(vfs):
+    return list(VFSExport.iter_records(vfs))
+
+
+@pytest.mark.parametrize('format', [VFSExport.formats.JSONL, VFSExport.formats.CSV])
+def test_export_round_trip(tree, format):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    stream = io.StringIO(newline='')
+    count = vfs.export(stream, format)
+    assert count == len(get_records(vfs))
+    stream.seek(0)
+    loaded = VirtualFS()
+    roots = loaded.load_export(stream, format)
+    assert [root.path for root in roots] == [tree]
+    assert get_records(loaded) == get_records(vfs)
+
+
+def test_compact_export_matches_os_walk(tree):
+    vfs = CompactVirtualFS()
+    vfs.add_path(tree)
+    stream = io.StringIO()
+    vfs.export(stream)
+    stream.seek(0)
+    loaded = VirtualFS()
+    root = loaded.load_export(stream)[0]
+    assert (root.get_size(), root.get_folder_count(), root.get_file_count()) \
+        == walk_aggregates(tree)[:3]
+
+
+@pytest.mark.parametrize('format', [VFSExport.formats.JSONL, VFSExport.formats.CSV])
+def test_awkward_names_round_trip(tree, format):
+    for name in ('comma, "quoted".txt', 'new\nline.txt', 'ünïcødé.txt'):
+        with open(os.path.join(tree, 'a', name), 'wb') as f:
+            f.write(b'x')
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    stream = io.StringIO(newline='')
+    vfs.export(stream, format)
+    stream.seek(0)
+    loaded = VirtualFS()
+    loaded.load_export(stream, format)
+    assert get_records(loaded) == get_records(vfs)
+
+
+def test_jsonl_records(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    stream = io.StringIO()
+    vfs.export(stream)
+    lines = stream.getvalue().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [list(record) for record in records[:1]] == [VFSExport.fields]
+    # each folder before its children
+    seen = set()
+    for record in records:
+        parent = os.path.dirname(record['path'])
+        assert record['path'] == tree or parent in seen
+        seen.add(record['path'])
+    assert len(records) == len(vfs.all_entries)
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        VFSExport('xml')
@@ -0,0 +1,114 @@
+import io
+import os
+
+from psgu.fs import VFSCache, VFSRule, VFSRuleSet, VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+def get_root_paths(vfs):
+    return [root.path for root in vfs.get_root_entries()]
+
+
+def check_index(vfs):
+    """Every entry indexed once, under its own path"""
+    entries = [e for root in vfs.get_root_entries() for e in root.walk()]
+    assert len(entries) == len(vfs.all_entries)
+    for entry in entries:
+        assert vfs.find_entry(entry.path) is entry and entry.vfs is vfs
+
+
+def test_find_entry(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    check_index(vfs)
+    entry = vfs.find_entry(os.path.join(tree, 'a', 'b', '.', 'three.txt'))
+    assert entry != None and entry.name == 'three.txt'
+    assert vfs.find_entry(os.path.join(tree, 'missing')) == None
+
+
+def test_remove_and_add_subpath(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    for removed, added in [('a/b', 'a/b'), ('a', 'a/b/c'), ('nine.txt', 'nine.txt')]:
+        vfs.remove(os.path.join(tree, removed))
+        entry = vfs.add_path(os.path.join(tree, added))
+        assert entry != None and entry.vfs is vfs
+        assert get_root_paths(vfs) == [tree]
+        assert get_aggregates(vfs.find_entry(tree)) == walk_aggregates(tree)
+        check_index(vfs)
+
+
+def test_remove_root_only_drops_its_own_key(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    vfs.remove(os.path.join(tree, 'd'))
+    assert vfs.has_path(tree)
+    assert len(vfs.root_entries) == 1
+
+
+def test_add_path_absorbs_roots_below(tree):
+    vfs = VirtualFS()
+    vfs.add_path(os.path.join(tree, 'a', 'b'))
+    vfs.add_path(os.path.join(tree, 'd'))
+    vfs.add_path(tree)
+    assert get_root_paths(vfs) == [tree]
+    assert get_aggregates(vfs.find_entry(tree)) == walk_aggregates(tree)
+    check_index(vfs)
+
+
+def save_cache(path, cache_path):
+    vfs = VirtualFS()
+    vfs.add_path(path)
+    VFSCache(cache_path).save(vfs)
+
+
+def test_cache_load_absorbs_roots_below(tree, tmp_path):
+    cache_path = str(tmp_path / 'tree.cache')
+    save_cache(tree, cache_path)
+    vfs = VirtualFS()
+    kept = vfs.add_path(os.path.join(tree, 'a', 'b'))
+    assert VFSCache(cache_path).load(vfs)
+    assert get_root_paths(vfs) == [tree]
+    # the live root takes the place of the cached one
+    assert vfs.find_entry(kept.path) is kept
+    assert get_aggregates(vfs.find_entry(tree)) == walk_aggregates(tree)
+    check_index(vfs)
+
+
+def test_cache_load_skips_trees_under_roots(tree, tmp_path):
+    cache_path = str(tmp_path / 'a.cache')
+    save_cache(os.path.join(tree, 'a'), cache_path)
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    entries = dict(vfs.all_entries)
+    assert VFSCache(cache_path).load(vfs)
+    assert get_root_paths(vfs) == [tree]
+    assert vfs.all_entries == entries
+    check_index(vfs)
+
+
+def test_export_read_absorbs_roots_below(tree):
+    source = VirtualFS()
+    source.add_path(tree)
+    stream = io.StringIO()
+    source.export(stream)
+    stream.seek(0)
+    vfs = VirtualFS()
+    vfs.add_path(os.path.join(tree, 'skip'))
+    added = vfs.load_export(stream)
+    assert [root.path for root in added] == [tree]
+    assert get_root_paths(vfs) == [tree]
+    check_index(vfs)
+    stream.seek(0)
+    assert vfs.load_export(stream) == []
+
+
+def test_loaded_trees_use_current_rules(tree, tmp_path):
+    cache_path = str(tmp_path / 'tree.cache')
+    save_cache(tree, cache_path)
+    vfs = VirtualFS()
+    vfs.set_rules(VFSRuleSet([VFSRule(glob='*.log')]))
+    VFSCache(cache_path).load(vfs)
+    is_excluded = lambda path: path.endswith('.log')
+    assert get_aggregates(vfs.find_entry(tree))[3:] == walk_aggregates(tree, is_excluded)[3:]
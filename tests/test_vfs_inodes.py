@@ -0,0 +1,71 @@
+import os
+
+from psgu.fs import VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+def add_links(tree):
+    """A file symlink, and a broken one, next to the tree's folder symlink"""
+    os.symlink(os.path.join(tree, 'a', 'b', 'three.txt'), os.path.join(tree, 'd', 'file_symlink'))
+    os.symlink(os.path.join(tree, 'missing'), os.path.join(tree, 'd', 'broken_symlink'))
+    return [os.path.join(tree, 'd', name)
+        for name in ('a_symlink', 'file_symlink', 'broken_symlink')]
+
+
+def test_hardlinks_counted_once(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    original = vfs.find_entry(os.path.join(tree, 'a', 'b', 'c', 'four.bin'))
+    link = vfs.find_entry(os.path.join(tree, 'd', 'four_link.bin'))
+    assert [original.hardlink, link.hardlink].count(True) == 1
+    assert original.get_size() + link.get_size() == 40000
+    # removing the link that counts the bytes passes them to the other
+    counting = link if not link.hardlink else original
+    other = original if counting is link else link
+    vfs.remove(counting.path)
+    assert not other.hardlink and other.get_size() == 40000
+    root = vfs.find_entry(tree)
+    size, _, file_count, _, _, _ = walk_aggregates(tree)
+    assert root.get_size() == size
+    assert root.get_file_count() == file_count - 1
+
+
+def test_symlinks_not_followed(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    link = vfs.find_entry(os.path.join(tree, 'd', 'a_symlink'))
+    assert link != None
+    assert not link.is_dir() and not link.is_file()
+    assert link.get_children() == []
+
+
+def test_rechecking_links_changes_nothing(tree):
+    links = add_links(tree)
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    aggregates = get_aggregates(root)
+    assert aggregates == walk_aggregates(tree)
+    hardlink = [e for e in root.walk() if e.hardlink][0]
+    version = hardlink.version
+    vfs.rescan(tree, check_files=True)
+    vfs.apply_changes(links + [hardlink.path])
+    assert get_aggregates(root) == aggregates
+    assert all([vfs.has_path(path) for path in links])
+    # links whose bytes another entry counts aren't touched
+    assert hardlink.version == version and hardlink.get_size() == 0
+
+
+def test_symlink_loop_followed_once(tree):
+    os.symlink(tree, os.path.join(tree, 'a', 'b', 'loop'))
+    vfs = VirtualFS(follow_symlinks=True, scan_workers=4)
+    root = vfs.add_path(tree)
+    loop = vfs.find_entry(os.path.join(tree, 'a', 'b', 'loop'))
+    symlink = vfs.find_entry(os.path.join(tree, 'd', 'a_symlink'))
+    assert loop.is_dir() and symlink.is_dir()
+    # folders already scanned at another path are left empty
+    assert loop.get_children() == [] and symlink.get_children() == []
+    # every file reached through the links is the same file, counted once
+    assert root.get_size() == walk_aggregates(tree)[0]
+    vfs.rescan(tree, check_files=True)
+    assert root.get_size() == walk_aggregates(tree)[0]
@@ -0,0 +1,69 @@
+import os
+import time
+
+from psgu.fs import VFSEntry, VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+def count_listings(monkeypatch):
+    """Paths listed from now on"""
+    listed = []
+    list_dir = VFSEntry.list_dir
+    def counting_list_dir(path, follow_symlinks=False):
+        listed.append(path)
+        return list_dir(path, follow_symlinks)
+    monkeypatch.setattr(VFSEntry, 'list_dir', counting_list_dir)
+    return listed
+
+
+def test_rescan_unchanged_lists_nothing(tree, monkeypatch):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    entries = list(root.walk())
+    listed = count_listings(monkeypatch)
+    assert vfs.rescan(tree)
+    assert listed == []
+    assert list(root.walk()) == entries
+
+
+def test_rescan_lists_changed_folders_only(tree, monkeypatch):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    kept = vfs.find_entry(os.path.join(tree, 'a', 'b', 'c', 'four.bin'))
+    time.sleep(0.01)
+    with open(os.path.join(tree, 'a', 'b', 'new.txt'), 'wb') as f:
+        f.write(b'z' * 50)
+    os.remove(os.path.join(tree, 'd', 'six.txt'))
+    os.makedirs(os.path.join(tree, 'new_dir', 'inner'))
+    listed = count_listings(monkeypatch)
+    vfs.rescan(tree)
+    # new folders are scanned, listing them too
+    assert sorted(listed) == sorted([tree, os.path.join(tree, 'a', 'b'), os.path.join(tree, 'd'),
+        os.path.join(tree, 'new_dir'), os.path.join(tree, 'new_dir', 'inner')])
+    assert vfs.find_entry(kept.path) is kept
+    assert get_aggregates(root) == walk_aggregates(tree)
+
+
+def test_rescan_check_files(tree):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    time.sleep(0.01)
+    with open(os.path.join(tree, 'a', 'one.txt'), 'ab') as f:
+        f.write(b'z' * 1000)
+    vfs.rescan(tree)
+    assert root.get_size() != walk_aggregates(tree)[0]
+    vfs.rescan(tree, check_files=True)
+    assert get_aggregates(root) == walk_aggregates(tree)
+
+
+def test_rescan_removed_root(tree):
+    vfs = VirtualFS()
+    vfs.add_path(os.path.join(tree, 'skip'))
+    os.remove(os.path.join(tree, 'skip', 'seven.txt'))
+    os.remove(os.path.join(tree, 'skip', 'deep', 'eight.log'))
+    os.rmdir(os.path.join(tree, 'skip', 'deep'))
+    os.rmdir(os.path.join(tree, 'skip'))
+    assert vfs.rescan(os.path.join(tree, 'skip'))
+    assert vfs.get_root_entries() == [] and vfs.all_entries == {}
+    assert not vfs.rescan(os.path.join(tree, 'skip'))
@@ -0,0 +1,145 @@
+import fnmatch
+import os
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VFSRule, VFSRuleSet, VirtualFS
+
+from conftest import walk_aggregates
+
+
+def get_excluded(entry):
+    return (entry.get_excluded_size(), entry.get_excluded_folder_count(),
+        entry.get_excluded_file_count())
+
+
+def make_rules():
+    return VFSRuleSet([
+        VFSRule(glob='*.log'),
+        VFSRule(glob='skip', entry_type='dir'),
+    ])
+
+
+def is_excluded(path):
+    name = os.path.basename(path)
+    return fnmatch.fnmatch(name, '*.log') or (name == 'skip' and os.path.isdir(path))
+
+
+@pytest.mark.parametrize('make_vfs', [VirtualFS, CompactVirtualFS], ids=['vfs', 'compact'])
+def test_exclusion_counts_match_os_walk(tree, make_vfs):
+    vfs = make_vfs()
+    vfs.set_rules(make_rules())
+    root = vfs.add_path(tree)
+    assert get_excluded(root) == walk_aggregates(tree, is_excluded)[3:]
+
+
+def test_rules_set_after_scan(tree):
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    vfs.set_rules(make_rules())
+    assert get_excluded(root) == walk_aggregates(tree, is_excluded)[3:]
+    vfs.set_rules(VFSRuleSet())
+    assert get_excluded(root) == (0, 0, 0)
+
+
+def test_bulk_apply_keeps_parent_aggregates(tree, monkeypatch):
+    monkeypatch.setattr(VFSRuleSet, 'bulk_threshold', 1)
+    vfs = VirtualFS()
+    root = vfs.add_path(tree)
+    rules = VFSRuleSet([VFSRule(glob='skip')])
+    # applied to the folder it excludes, which changes the parents too
+    changed = rules.apply(vfs.find_entry(os.path.join(tree, 'skip')))
+    assert changed > VFSRuleSet.bulk_threshold
+    expected = walk_aggregates(tree, lambda path: os.path.basename(path) == 'skip')[3:]
+    assert get_excluded(root) == expected
+    before = root.get_subtree_aggregates()
+    root.calc_aggregates()
+    assert root.get_subtree_aggregates() == before
+
+
+def test_apply_again_after_changes(tree):
+    vfs = VirtualFS()
+    vfs.set_rules(make_rules())
+    root = vfs.add_path(tree)
+    with open(os.path.join(tree, 'a', 'b', 'new.log'), 'wb') as f:
+        f.write(b'x' * 11)
+    vfs.rescan(os.path.join(tree, 'a', 'b'))
+    vfs.rules.apply(root)
+    assert get_excluded(root) == walk_aggregates(tree, is_excluded)[3:]
+
+
+def test_regex_backreference():
+    rules = VFSRuleSet([VFSRule(regex=r'(a)\1'), VFSRule(glob='*.txt', action='include')])
+    class Entry:
+        entry_type = 'file'
+        mtime = None
+        def __init__(self, name):
+            self.name = name
+            self.path = name
+        def get_size(self):
+            return 0
+    assert rules.is_excluded(Entry('xaay'))
+    assert not rules.is_excluded(Entry('xaay.txt'))
+    assert not rules.is_excluded(Entry('xay'))
+
+
+def count_checks(monkeypatch):
+    """Names of entries checked against rules from now on"""
+    checked = []
+    get_action = VFSRuleSet.get_action
+    def counting_get_action(self, entry):
+        checked.append(entry.name)
+        return get_action(self, entry)
+    monkeypatch.setattr(VFSRuleSet, 'get_action', counting_get_action)
+    return checked
+
+
+def test_unchanged_folders_not_checked_again(tree, monkeypatch):
+    vfs = VirtualFS()
+    vfs.set_rules(make_rules())
+    root = vfs.add_path(tree)
+    checked = count_checks(monkeypatch)
+    assert vfs.rules.apply(root) == 0
+    # only the root itself, every folder below it is skipped
+    assert checked == [root.name]
+    del checked[:]
+    with open(os.path.join(tree, 'a', 'b', 'new.log'), 'wb') as f:
+        f.write(b'x' * 11)
+    vfs.rescan(os.path.join(tree, 'a', 'b'))
+    # the rescan applied the rules to the changed folder
+    assert sorted(checked) == sorted(['b', 'c', 'new.log', 'three.txt'])
+    del checked[:]
+    vfs.rules.apply(root)
+    # then only children of the folders above it, whose aggregates changed
+    expected = [root.name] + [e.name for e in root.children] \
+        + [e.name for e in vfs.find_entry(os.path.join(tree, 'a')).children]
+    assert sorted(checked) == sorted(expected)
+    assert get_excluded(root) == walk_aggregates(tree, is_excluded)[3:]
+
+
+def test_mtime_rules_see_files_deep_below(tree):
+    old_file = os.path.join(tree, 'a', 'b', 'c', 'five.log')
+    vfs = VirtualFS()
+    vfs.set_rules(VFSRuleSet([VFSRule(max_mtime=1000)]))
+    root = vfs.add_path(tree)
+    assert get_excluded(root) == (0, 0, 0)
+    # a new mtime changes no sizes, so doesn't reach the folders above
+    os.utime(old_file, (1000, 1000))
+    vfs.rescan(tree, check_files=True)
+    vfs.rules.apply(root)
+    assert vfs.find_entry(old_file).is_excluded()
+    assert get_excluded(root) == (5, 0, 1)
+
+
+def test_changed_rules_check_everything(tree, monkeypatch):
+    vfs = VirtualFS()
+    vfs.set_rules(make_rules())
+    root = vfs.add_path(tree)
+    vfs.rules.add_rule(VFSRule(glob='*.txt'))
+    checked = count_checks(monkeypatch)
+    vfs.rules.apply(root)
+    # all but what's below the excluded folder
+    skip = vfs.find_entry(os.path.join(tree, 'skip'))
+    assert len(checked) == len(list(root.walk())) - len(list(skip.walk(include_self=False)))
+    assert get_excluded(root) == walk_aggregates(tree, lambda path:
+        is_excluded(path) or path.endswith('.txt'))[3:]
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from psgu.fs import VFSEntry, VFSExport, VFSScanner, VirtualFS
+from psgu.fs.vfs_scanner import CancelToken
+
+
+def get_records(vfs):
+    return list(VFSExport.iter_records(vfs))
+
+
+def test_parallel_scan_matches_serial(tree):
+    serial = VirtualFS()
+    serial.add_path(tree)
+    for workers in (2, 4, 16):
+        parallel = VirtualFS(scan_workers=workers)
+        parallel.add_path(tree)
+        # same entries, children in the same order
+        assert get_records(parallel) == get_records(serial)
+
+
+def test_scan_progress(tree):
+    vfs = VirtualFS(scan_workers=4)
+    progress = list(vfs.iter_add_path(tree, interval=0))[-1]
+    assert progress.done and not progress.cancelled
+    root = vfs.find_entry(tree)
+    assert progress.dirs_visited == root.get_folder_count() + 1
+    assert progress.files_seen == root.get_file_count()
+
+
+def test_cancelled_scan_leaves_nothing(tree):
+    vfs = VirtualFS(scan_workers=4)
+    cancel_token = CancelToken()
+    cancel_token.cancel()
+    progress = list(vfs.iter_add_path(tree, cancel_token))[-1]
+    assert progress.cancelled
+    assert vfs.get_root_entries() == [] and vfs.all_entries == {}
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_unreadable_folder_is_skipped(tree, monkeypatch, workers):
+    unreadable = os.path.join(tree, 'a', 'b')
+    list_dir = VFSEntry.list_dir
+    def failing_list_dir(path, follow_symlinks=False):
+        if path == unreadable:
+            raise PermissionError(13, 'Permission denied', path)
+        return list_dir(path, follow_symlinks)
+    monkeypatch.setattr(VFSEntry, 'list_dir', failing_list_dir)
+    vfs = VirtualFS(scan_workers=workers)
+    progress = list(vfs.iter_add_path(tree))[-1]
+    assert progress.errors == 1
+    folder = vfs.find_entry(unreadable)
+    assert folder != None and folder.get_children() == []
+    assert not vfs.has_path(os.path.join(unreadable, 'three.txt'))
+    assert vfs.find_entry(os.path.join(tree, 'd', 'six.txt')) != None
+
+
+def test_failed_scan_is_rolled_back(tree, monkeypatch):
+    vfs = VirtualFS(scan_workers=4, index_names=True)
+    vfs.add_path(os.path.join(tree, 'a', 'b'))
+    def failing_scan_children(self, orphans=None, listing=None):
+        raise RuntimeError('scan failed')
+    monkeypatch.setattr(VFSEntry, 'scan_children', failing_scan_children)
+    with pytest.raises(RuntimeError):
+        vfs.add_path(tree)
+    monkeypatch.undo()
+    # the absorbed root is a root again, and nothing else is left indexed
+    assert [root.path for root in vfs.get_root_entries()] == [os.path.join(tree, 'a', 'b')]
+    assert all([key.startswith(os.path.join(tree, 'a', 'b')) for key in vfs.all_entries])
+    assert len(vfs.name_index) == len(vfs.all_entries)
+
+
+def test_scanner_errors():
+    scanner = VFSScanner(2)
+    entry = VFSEntry('/nonexistent/psgu/test', VFSEntry.entry_types.DIR)
+    scanner.scan(entry)
+    assert len(scanner.errors) == 1 and isinstance(scanner.errors[0], FileNotFoundError)
+
+
+def test_parallel_scan_counts_same_hardlinks(tree):
+    names = {'four.bin', 'four_link.bin'}
+    for workers in (1, 16):
+        vfs = VirtualFS(scan_workers=workers)
+        vfs.add_path(tree)
+        links = [e for e in vfs.find_entry(tree).walk() if e.name in names]
+        # the first link in walk order counts the bytes
+        assert [e.hardlink for e in links] == [False, True]
+        assert links[0].get_size() == 40000
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from psgu.fs import CompactVirtualFS, VFSNameQuery, VirtualFS
+
+
+queries = [
+    'txt', 'ONE', 'o', 'four', 'ab', '*.log', 'f*', '?i*', '[st]*',
+    'b/three', 'a/b/*', 'c/f', 'missing', 'a_sym',
+]
+
+
+def search_paths(vfs, query):
+    paths = [entry.path for entry in vfs.search(query)]
+    assert len(paths) == len(set(paths))
+    return set(paths)
+
+
+@pytest.mark.parametrize('query', queries)
+def test_index_matches_linear_search(tree, query):
+    indexed = VirtualFS(index_names=True)
+    indexed.add_path(tree)
+    linear = VirtualFS()
+    linear.add_path(tree)
+    compact = CompactVirtualFS()
+    compact.add_path(tree)
+    expected = set(VFSNameQuery(query).iter_matches(linear.find_entry(tree).walk()))
+    expected = {entry.path for entry in expected}
+    assert search_paths(indexed, query) == expected
+    assert search_paths(linear, query) == expected
+    assert search_paths(compact, query) == expected
+
+
+def test_query_semantics(tree):
+    vfs = VirtualFS(index_names=True)
+    vfs.add_path(tree)
+    def names(query):
+        return sorted([os.path.basename(path) for path in search_paths(vfs, query)])
+    assert names('ONE.TXT') == ['one.txt']
+    assert names('*.log') == ['eight.log', 'five.log', 'two.log']
+    # globs match whole names
+    assert names('*.lo') == []
+    # path queries must end in the name, not only in a parent folder
+    assert names('b/c') == ['c']
+    assert names('a/b') == ['b']
+
+
+def test_index_follows_changes(tree):
+    vfs = VirtualFS(index_names=True)
+    vfs.add_path(tree)
+    vfs.remove(os.path.join(tree, 'a', 'b'))
+    assert search_paths(vfs, 'three') == set()
+    new_path = os.path.join(tree, 'd', 'three_new.txt')
+    with open(new_path, 'wb') as f:
+        f.write(b'x')
+    vfs.apply_changes([new_path])
+    assert search_paths(vfs, 'three') == {new_path}
+    vfs.add_path(os.path.join(tree, 'a', 'b'))
+    assert search_paths(vfs, 'three') == {new_path, os.path.join(tree, 'a', 'b', 'three.txt')}
+    assert len(vfs.name_index) == len(vfs.all_entries)
+    vfs.remove_all()
+    assert search_paths(vfs, 'three') == set() and len(vfs.name_index) == 0
+
+
+def test_name_index_with_parallel_scan(tmp_path):
+    root = tmp_path / 'many'
+    for i in range(20):
+        for j in range(10):
+            folder = root / 'dir{}'.format(i) / 'sub{}'.format(j)
+            folder.mkdir(parents=True)
+            for k in range(5):
+                (folder / 'file{}_{}.txt'.format(j, k)).touch()
+    vfs = VirtualFS(scan_workers=8, index_names=True)
+    vfs.add_path(str(root))
+    entries = list(vfs.find_entry(str(root)).walk())
+    assert len(vfs.name_index) == len(entries)
+    found = {entry.path for entry in vfs.search('file3_')}
+    expected = {entry.path for entry in entries if 'file3_' in entry.name}
+    assert found == expected and len(found) == 20 * 5
@@ -0,0 +1,143 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from psgu.fs import VFSWatcher, VirtualFS
+
+from conftest import get_aggregates, walk_aggregates
+
+
+inotify_available = VFSWatcher(VirtualFS(), print).use_inotify
+
+
+class Batches:
+    """on_changes for a VFSWatcher, keeping each batch and when it came"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __call__(self, paths):
+        self.queue.put((time.monotonic(), paths))
+
+    def get(self, timeout=5.0):
+        return self.queue.get(timeout=timeout)
+
+    def is_empty(self, wait=0.0):
+        try:
+            self.queue.get(timeout=wait)
+        except queue.Empty:
+            return True
+        return False
+
+
+def write_file(path, size=1):
+    with open(path, 'wb') as f:
+        f.write(b'w' * size)
+
+
+def test_apply_changes_after_deletions_only(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    deleted_file = os.path.join(tree, 'a', 'b', 'three.txt')
+    os.remove(deleted_file)
+    changed = vfs.apply_changes([deleted_file])
+    assert [entry.path for entry in changed] == [os.path.join(tree, 'a', 'b')]
+    assert not vfs.has_path(deleted_file)
+    assert get_aggregates(vfs.find_entry(tree)) == walk_aggregates(tree)
+
+
+@pytest.mark.parametrize('use_inotify', [
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(not inotify_available, reason='no inotify')),
+], ids=['poll', 'inotify'])
+def test_burst_reported_in_one_batch(tree, use_inotify):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    batches = Batches()
+    watcher = VFSWatcher(vfs, batches, debounce=0.2, poll_interval=0.05,
+        use_inotify=use_inotify)
+    with watcher:
+        time.sleep(0.1) # watches are added on the watcher thread
+        for name in ('x.txt', 'y.txt', 'z.txt'):
+            write_file(os.path.join(tree, 'a', 'b', name), 100)
+            time.sleep(0.02)
+        os.remove(os.path.join(tree, 'd', 'six.txt'))
+        _, paths = batches.get()
+        assert batches.is_empty(wait=0.4)
+    if use_inotify:
+        assert paths == sorted([os.path.join(tree, 'a', 'b', name)
+            for name in ('x.txt', 'y.txt', 'z.txt')] + [os.path.join(tree, 'd', 'six.txt')])
+    else:
+        # polling only sees the folders' mtimes change
+        assert paths == [os.path.join(tree, 'a', 'b'), os.path.join(tree, 'd')]
+    vfs.apply_changes(paths)
+    assert get_aggregates(vfs.find_entry(tree)) == walk_aggregates(tree)
+
+
+@pytest.mark.skipif(not inotify_available, reason='no inotify')
+def test_max_delay_reports_during_bursts(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    batches = Batches()
+    with VFSWatcher(vfs, batches, debounce=0.2, max_delay=0.3):
+        time.sleep(0.1)
+        start = time.monotonic()
+        for i in range(40):
+            write_file(os.path.join(tree, 'a', 'f{}.txt'.format(i)))
+            time.sleep(0.02)
+        reported, _ = batches.get()
+    # changes never stopped for debounce seconds, max_delay ended the batch
+    assert reported - start < 0.6
+
+
+@pytest.mark.skipif(not inotify_available, reason='no inotify')
+def test_update_watches_for_new_folders(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    batches = Batches()
+    with VFSWatcher(vfs, batches, debounce=0.05) as watcher:
+        time.sleep(0.1) # watches are added on the watcher thread
+        new_dir = os.path.join(tree, 'new_dir')
+        os.mkdir(new_dir)
+        changed = vfs.apply_changes(batches.get()[1])
+        watcher.update_watches(changed)
+        time.sleep(0.1)
+        write_file(os.path.join(new_dir, 'new.txt'))
+        assert batches.get()[1] == [os.path.join(new_dir, 'new.txt')]
+        vfs.remove(new_dir)
+        watcher.update_watches(removed_paths=[new_dir])
+        time.sleep(0.1)
+        write_file(os.path.join(new_dir, 'other.txt'))
+        assert batches.is_empty(wait=0.3)
+
+
+@pytest.mark.skipif(not inotify_available, reason='no inotify')
+def test_stop_releases_after_thread_exits(tree):
+    vfs = VirtualFS()
+    vfs.add_path(tree)
+    blocked = threading.Event()
+    release = threading.Event()
+    def on_changes(paths):
+        blocked.set()
+        release.wait(5.0)
+    watcher = VFSWatcher(vfs, on_changes, debounce=0.01)
+    watcher.start()
+    time.sleep(0.1)
+    write_file(os.path.join(tree, 'new.txt'))
+    assert blocked.wait(5.0)
+    thread = watcher._thread
+    watcher.stop(timeout=0.05)
+    assert thread.is_alive() and not watcher.is_running()
+    # the thread may still be using them
+    assert watcher._wake_r != None and watcher._inotify != None
+    release.set()
+    thread.join(5.0)
+    assert watcher._wake_r == None and watcher._inotify == None
+    # restarting works once the old thread is gone
+    watcher.start()
+    assert watcher.is_running()
+    watcher.stop()
+    assert watcher._thread == None and watcher._inotify == None